@@ -350,6 +350,11 @@ function initGenerateButton() {
     btnGenerate.disabled = true;
     btnGenerate.textContent = '正在生成...';
 
+    // 优先流式生成，收到第一题即开始答题
+    if (await startStreamingGeneration({ types, count, mode })) {
+      return;
+    }
+
     try {
       const response = await fetch(`${API_BASE}/generate-questions`, {
         method: 'POST',
@@ -400,6 +405,60 @@ function initGenerateButton() {
   });
 }
 
+/**
+ * 以 SSE 流式生成题目：收到第一题即切换到答题界面，其余题目在后台继续生成
+ * 浏览器不支持或在第一题之前失败时返回 false，由调用方改用普通接口
+ */
+function startStreamingGeneration({ types, count, mode }) {
+  if (typeof EventSource === 'undefined') {
+    return Promise.resolve(false);
+  }
+  const params = new URLSearchParams({
+    filepath: currentFilepath,
+    types: types.join(','),
+    count: String(count),
+    mode,
+  });
+
+  return new Promise((resolve) => {
+    const source = new EventSource(`${API_BASE}/generate-questions/stream?${params}`);
+    let started = false;
+
+    source.addEventListener('session', (event) => {
+      const data = JSON.parse(event.data);
+      currentSessionId = data.session_id;
+      localStorage.setItem(STORAGE_KEYS.SESSION, currentSessionId);
+      totalCount = data.total_count;
+    });
+
+    source.addEventListener('question', async () => {
+      if (started) return;
+      started = true;
+      resolve(true);
+
+      // 重置计数并加载第一题
+      answeredCount = 0;
+      correctCount = 0;
+      updateStats();
+      showQuizView();
+      resetQuestionHistory();
+      await loadNextQuestion();
+    });
+
+    source.addEventListener('done', (event) => {
+      totalCount = JSON.parse(event.data).total_count;
+      updateStats();
+      source.close();
+    });
+
+    // 服务端的 error 事件与连接错误都会触发
+    source.addEventListener('error', () => {
+      source.close();
+      if (!started) resolve(false);
+    });
+  });
+}
+
 /**
  * 显示消息
  */
@@ -862,6 +921,13 @@ async function loadNextQuestion(options = {}) {
       return;
     }
 
+    if (data.pending) {
+      // 题目仍在生成中，稍后重试
+      questionContainer.innerHTML = '<div class="loading-message">题目生成中...</div>';
+      setTimeout(() => loadNextQuestion(options), 800);
+      return;
+    }
+
     totalCount = data.total_count ?? totalCount;
     currentQuestion = data.question;
     selectedOptions.clear();
@@ -111,7 +111,7 @@ class QuizSession:
                 extra=outcome.extra,
             )
             if outcome.is_correct:
-                self.record_manager.remove_wrong_question(question.identifier)
+                self.record_manager.record_wrong_question_review(question.identifier)
             else:
                 self.record_manager.upsert_wrong_question(
                     question,
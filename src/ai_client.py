@@ -6,7 +6,16 @@ import re
 import urllib.error
 import urllib.request
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+)
 
 from .question_models import Question, QuestionType
 
@@ -49,6 +58,61 @@ class AIResponseFormatError(RuntimeError):
     """Raised when the AI response cannot be parsed into questions."""
 
 
+class IncrementalJSONArray:
+    """Incrementally parse a JSON array of objects fed in arbitrary text chunks.
+
+    Text before the first ``[`` (code fences, a ``{"questions": `` wrapper) is
+    skipped; :meth:`feed` returns every object that became complete.
+    """
+
+    def __init__(self) -> None:
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        items: List[Dict[str, Any]] = []
+        for ch in text:
+            if self._finished:
+                break
+            if not self._started:
+                self._started = ch == "["
+                continue
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buffer = [ch]
+                elif ch == "]":
+                    self._finished = True
+                continue
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        item = json.loads("".join(self._buffer))
+                    except json.JSONDecodeError:
+                        item = None
+                    if isinstance(item, dict):
+                        items.append(item)
+                    self._buffer = []
+        return items
+
+
 class AIClient:
     """Client for requesting additional questions from an external AI model."""
 
@@ -71,6 +135,65 @@ class AIClient:
     ) -> List[Question]:
         if count <= 0:
             return []
+        question_types = list(question_types)
+        payload = self._build_payload(entries, count, question_types, temperature)
+        response = self._post_json(self._sanitize_url(self.config.url), payload)
+        message = self._extract_message_text(response)
+        raw_questions = self._parse_questions(message)
+        built_questions: List[Question] = []
+        for idx, raw in enumerate(raw_questions, start=1):
+            question = self._build_question(raw, fallback_index=idx)
+            if question is None:
+                continue
+            if question.question_type not in question_types:
+                continue
+            built_questions.append(question)
+            if len(built_questions) >= count:
+                break
+        return built_questions
+
+    def stream_questions(
+        self,
+        entries: Sequence["KnowledgeEntry"],
+        *,
+        count: int,
+        question_types: Iterable[QuestionType],
+        temperature: float = 0.7,
+    ) -> Iterator[Question]:
+        """Yield questions one by one while the model is still generating.
+
+        Requests ``stream: true`` and parses the JSON array incrementally from
+        the streamed deltas. Endpoints that ignore ``stream`` and answer with a
+        single JSON body are handled as well.
+        """
+        if count <= 0:
+            return
+        question_types = list(question_types)
+        payload = self._build_payload(entries, count, question_types, temperature)
+        payload["stream"] = True
+        parser = IncrementalJSONArray()
+        received = 0
+        built = 0
+        for text in self._post_stream(self._sanitize_url(self.config.url), payload):
+            for raw in parser.feed(text):
+                received += 1
+                question = self._build_question(raw, fallback_index=received)
+                if question is None or question.question_type not in question_types:
+                    continue
+                built += 1
+                yield question
+                if built >= count:
+                    return
+        if received == 0:
+            raise AIResponseFormatError("AI 流式返回内容中不包含题目数组")
+
+    def _build_payload(
+        self,
+        entries: Sequence["KnowledgeEntry"],
+        count: int,
+        question_types: Iterable[QuestionType],
+        temperature: float,
+    ) -> Dict[str, Any]:
         type_labels = sorted(
             {self._question_type_to_label(qt) for qt in question_types}
         )
@@ -80,7 +203,7 @@ class AIClient:
         knowledge_summary = self._build_knowledge_summary(entries)
         prompt = self._build_prompt(knowledge_summary, count, type_labels)
 
-        payload = {
+        return {
             "model": self.config.model,
             "messages": [
                 {
@@ -95,21 +218,6 @@ class AIClient:
             "temperature": temperature,
         }
 
-        response = self._post_json(self._sanitize_url(self.config.url), payload)
-        message = self._extract_message_text(response)
-        raw_questions = self._parse_questions(message)
-        built_questions: List[Question] = []
-        for idx, raw in enumerate(raw_questions, start=1):
-            question = self._build_question(raw, fallback_index=idx)
-            if question is None:
-                continue
-            if question.question_type not in question_types:
-                continue
-            built_questions.append(question)
-            if len(built_questions) >= count:
-                break
-        return built_questions
-
     def _question_type_to_label(self, question_type: QuestionType) -> str:
         if question_type == QuestionType.SINGLE_CHOICE:
             return "single"
@@ -168,6 +276,69 @@ class AIClient:
         except json.JSONDecodeError as exc:
             raise AIResponseFormatError("AI 接口返回的不是合法 JSON") from exc
 
+    def _post_stream(self, url: str, payload: Dict[str, Any]) -> Iterator[str]:
+        """POST ``payload`` and yield message text as the server streams it."""
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+            "Authorization": f"Bearer {self.config.key}",
+        }
+        request = urllib.request.Request(url, data=data, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(
+                request, timeout=self.config.timeout
+            ) as response:
+                content_type = response.headers.get("Content-Type", "")
+                if "text/event-stream" not in content_type:
+                    # 接口忽略了 stream 参数，按普通响应解析
+                    raw = response.read().decode("utf-8")
+                    try:
+                        body = json.loads(raw)
+                    except json.JSONDecodeError as exc:
+                        raise AIResponseFormatError(
+                            "AI 接口返回的不是合法 JSON"
+                        ) from exc
+                    yield self._extract_message_text(body)
+                    return
+                for line in response:
+                    text = line.decode("utf-8").strip()
+                    if not text.startswith("data:"):
+                        continue
+                    chunk = text[len("data:") :].strip()
+                    if chunk == "[DONE]":
+                        return
+                    try:
+                        event = json.loads(chunk)
+                    except json.JSONDecodeError:
+                        continue
+                    delta = self._extract_delta_text(event)
+                    if delta:
+                        yield delta
+        except urllib.error.HTTPError as exc:  # pragma: no cover - network path
+            detail = exc.read().decode("utf-8", errors="ignore")
+            raise AITransportError(f"AI 接口 HTTP {exc.code}: {detail}") from exc
+        except OSError as exc:  # pragma: no cover - network path
+            raise AITransportError(f"无法连接 AI 接口: {exc}") from exc
+
+    def _extract_delta_text(self, event: Dict[str, Any]) -> str:
+        choices = event.get("choices")
+        if not isinstance(choices, list):
+            return ""
+        parts = []
+        for choice in choices:
+            if not isinstance(choice, dict):
+                continue
+            for key in ("delta", "message"):
+                message = choice.get(key)
+                if isinstance(message, dict) and isinstance(
+                    message.get("content"), str
+                ):
+                    parts.append(message["content"])
+            if isinstance(choice.get("text"), str):
+                parts.append(choice["text"])
+        return "".join(parts)
+
     def _extract_message_text(self, response: Dict[str, Any]) -> str:
         choices = response.get("choices")
         if isinstance(choices, list):
@@ -237,8 +408,8 @@ class AIClient:
         prompt = str(raw.get("prompt", "")).strip()
         if not prompt:
             return None
-        component = str(raw.get("component", "")).strip() or "AI"
-        identifier = str(raw.get("id") or f"AI-{component}-{fallback_index}")
+        component = str(raw.get("component", "")).strip() or None
+        identifier = str(raw.get("id") or f"AI-{component or 'AI'}-{fallback_index}")
         explanation = str(raw.get("explanation", "")).strip() or None
 
         if question_type in {QuestionType.SINGLE_CHOICE, QuestionType.MULTI_CHOICE}:
@@ -259,6 +430,7 @@ class AIClient:
                 correct_options=correct,
                 answer_text=answer_text,
                 explanation=explanation,
+                component=component,
             )
 
         answer_text = self._normalize_text_answer(raw.get("answer"))
@@ -273,6 +445,7 @@ class AIClient:
             answer_text=answer_text,
             explanation=explanation,
             keywords=keywords,
+            component=component,
         )
 
     def _normalize_options(self, options: Any) -> Optional[List[str]]:
@@ -374,5 +547,6 @@ __all__ = [
     "AIConfig",
     "AIResponseFormatError",
     "AITransportError",
+    "IncrementalJSONArray",
     "load_ai_config",
 ]
@@ -0,0 +1,487 @@
+"""答题历史的列式分析快照
+
+按组件统计正确率、按周统计各题型错误数等看板查询，原先需要逐条遍历
+``_iter_answer_history`` 返回的字典。这里把历史定期转存为列式快照：
+时间戳、会话、题型、知识点组件、是否正确各占一个 NumPy 数组，字符串列
+使用字典编码（整数编码 + 取值表）。聚合通过 ``np.bincount`` 向量化完成，
+百万级作答记录的查询只需毫秒级。
+
+NumPy 为可选依赖：``pip install numpy``。
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover - optional dependency
+    HAS_NUMPY = False
+
+from .history_store import to_timestamp_key
+from .question_models import UNCATEGORIZED_COMPONENT, infer_component
+
+if TYPE_CHECKING:
+    from .record_manager import RecordManager
+
+DICTIONARY_COLUMNS = ("session", "question_type", "component")
+SNAPSHOT_VERSION = 1
+UNCATEGORIZED = UNCATEGORIZED_COMPONENT
+
+
+def _require_numpy() -> None:
+    if not HAS_NUMPY:
+        raise ImportError("历史分析快照需要安装 NumPy：pip install numpy")
+
+
+def component_of(item: Dict[str, Any]) -> str:
+    """作答记录所属的知识点组件"""
+    component = item.get("component")
+    if component:
+        return str(component)
+    question = item.get("question") or {}
+    component = question.get("component")
+    if component:
+        return str(component)
+    return infer_component(item.get("question_id") or question.get("identifier") or "")
+
+
+Row = Tuple[str, str, str, str, bool]
+
+
+def extract_rows(records: Iterable[Dict[str, Any]]) -> List[Row]:
+    """把作答记录压缩为快照所需的行元组，可作为并行扫描的 mapper"""
+    rows: List[Row] = []
+    for item in records:
+        timestamp = item.get("timestamp")
+        if not timestamp:
+            continue
+        question_type = item.get("question_type") or (item.get("question") or {}).get(
+            "question_type"
+        )
+        rows.append(
+            (
+                timestamp.rstrip("Z")[:19],
+                item.get("session_id") or "",
+                question_type or UNCATEGORIZED,
+                component_of(item),
+                bool(item.get("is_correct")),
+            )
+        )
+    return rows
+
+
+def _concat_rows(left: List[Row], right: List[Row]) -> List[Row]:
+    left.extend(right)
+    return left
+
+
+class _Encoder:
+    """字符串列的字典编码器"""
+
+    def __init__(self) -> None:
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def encode(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class HistorySnapshot:
+    """答题历史的列式快照"""
+
+    def __init__(
+        self,
+        columns: Dict[str, "np.ndarray"],
+        dictionaries: Dict[str, List[str]],
+        *,
+        built_at: float,
+        source_rows: int,
+        source_generation: Optional[str] = None,
+    ) -> None:
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.built_at = built_at
+        self.source_rows = source_rows
+        # 构建时作答历史的数据版本，行数不变的压缩、清理也会改变它
+        self.source_generation = source_generation
+
+    def __len__(self) -> int:
+        return int(self.columns["timestamp"].shape[0])
+
+    # Building / persistence ------------------------------------------------------
+
+    @classmethod
+    def build(
+        cls,
+        records: Iterable[Dict[str, Any]],
+        *,
+        source_rows: Optional[int] = None,
+        source_generation: Optional[str] = None,
+    ) -> "HistorySnapshot":
+        """从作答记录构建快照"""
+        return cls.from_rows(
+            extract_rows(records),
+            source_rows=source_rows,
+            source_generation=source_generation,
+        )
+
+    @classmethod
+    def from_rows(
+        cls,
+        rows: List[Row],
+        *,
+        source_rows: Optional[int] = None,
+        source_generation: Optional[str] = None,
+    ) -> "HistorySnapshot":
+        """从 :func:`extract_rows` 产生的行元组构建快照"""
+        _require_numpy()
+        encoders = {name: _Encoder() for name in DICTIONARY_COLUMNS}
+        timestamps: List[str] = []
+        codes: Dict[str, List[int]] = {name: [] for name in DICTIONARY_COLUMNS}
+        correct: List[bool] = []
+        for timestamp, session, question_type, component, is_correct in rows:
+            timestamps.append(timestamp)
+            codes["session"].append(encoders["session"].encode(session))
+            codes["question_type"].append(
+                encoders["question_type"].encode(question_type)
+            )
+            codes["component"].append(encoders["component"].encode(component))
+            correct.append(is_correct)
+
+        columns = {
+            "timestamp": np.array(timestamps, dtype="datetime64[s]").astype(np.int64),
+            "correct": np.array(correct, dtype=bool),
+        }
+        for name in DICTIONARY_COLUMNS:
+            columns[name] = np.array(codes[name], dtype=np.int32)
+        return cls(
+            columns,
+            {name: encoders[name].values for name in DICTIONARY_COLUMNS},
+            built_at=time.time(),
+            source_rows=len(timestamps) if source_rows is None else source_rows,
+            source_generation=source_generation,
+        )
+
+    def save(self, path: Path) -> None:
+        """原子写入 ``.npz`` 文件"""
+        _require_numpy()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "built_at": self.built_at,
+            "source_rows": self.source_rows,
+            "source_generation": self.source_generation,
+            "dictionaries": self.dictionaries,
+        }
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            meta=np.frombuffer(
+                json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8
+            ),
+            **self.columns,
+        )
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(buffer.getvalue())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["HistorySnapshot"]:
+        """读取快照，文件不存在或版本不符时返回 None"""
+        _require_numpy()
+        if not path.exists():
+            return None
+        try:
+            with np.load(path) as archive:
+                meta = json.loads(archive["meta"].tobytes().decode("utf-8"))
+                if meta.get("version") != SNAPSHOT_VERSION:
+                    return None
+                columns = {
+                    name: archive[name]
+                    for name in ("timestamp", "correct", *DICTIONARY_COLUMNS)
+                }
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(
+            columns,
+            meta["dictionaries"],
+            built_at=meta["built_at"],
+            source_rows=meta["source_rows"],
+            source_generation=meta.get("source_generation"),
+        )
+
+    # Aggregations --------------------------------------------------------------
+
+    def count_by(
+        self,
+        column: str,
+        *,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        correct: Optional[bool] = None,
+    ) -> Dict[str, int]:
+        """按字典编码列计数"""
+        codes = self._codes(column)
+        mask = self._mask(date_from=date_from, date_to=date_to, correct=correct)
+        counts = np.bincount(codes[mask], minlength=len(self.dictionaries[column]))
+        return {
+            value: int(count)
+            for value, count in zip(self.dictionaries[column], counts)
+            if count
+        }
+
+    def accuracy_by(
+        self,
+        column: str,
+        *,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """按字典编码列统计作答数与正确率，按作答数降序"""
+        codes = self._codes(column)
+        mask = self._mask(date_from=date_from, date_to=date_to)
+        size = len(self.dictionaries[column])
+        totals = np.bincount(codes[mask], minlength=size)
+        corrects = np.bincount(
+            codes[mask], weights=self.columns["correct"][mask], minlength=size
+        )
+        order = np.argsort(-totals, kind="stable")
+        return [
+            {
+                column: self.dictionaries[column][index],
+                "total": int(totals[index]),
+                "correct": int(corrects[index]),
+                "accuracy": float(corrects[index] / totals[index]),
+            }
+            for index in order
+            if totals[index]
+        ]
+
+    def time_buckets(
+        self,
+        bucket: str = "day",
+        *,
+        by: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """按天/周分桶统计作答数与正确率，可再按某一列细分
+
+        周桶以周一（UTC）为起点。
+        """
+        if bucket not in {"day", "week"}:
+            raise ValueError(f"不支持的时间粒度: {bucket}")
+        mask = self._mask(date_from=date_from, date_to=date_to)
+        days = self.columns["timestamp"][mask] // 86_400
+        if bucket == "week":
+            # 1970-01-01 是周四，+3 后按 7 取整即对齐到周一
+            starts = (days + 3) // 7 * 7 - 3
+        else:
+            starts = days
+        if starts.size == 0:
+            return []
+        base = int(starts.min())
+        slots = starts - base
+
+        group_size = 1
+        group_codes = np.zeros_like(slots)
+        if by is not None:
+            group_size = max(1, len(self.dictionaries[by]))
+            group_codes = self._codes(by)[mask]
+        keys = slots * group_size + group_codes
+        length = int(keys.max()) + 1
+        totals = np.bincount(keys, minlength=length)
+        corrects = np.bincount(
+            keys, weights=self.columns["correct"][mask], minlength=length
+        )
+
+        rows: List[Dict[str, Any]] = []
+        for key in np.nonzero(totals)[0]:
+            slot, group = divmod(int(key), group_size)
+            start = np.datetime64(base + slot, "D")
+            row: Dict[str, Any] = {
+                "bucket": str(start),
+                "total": int(totals[key]),
+                "correct": int(corrects[key]),
+                "accuracy": float(corrects[key] / totals[key]),
+            }
+            if by is not None:
+                row[by] = self.dictionaries[by][group]
+            rows.append(row)
+        return rows
+
+    # Internal helpers ---------------------------------------------------------
+
+    def _codes(self, column: str) -> "np.ndarray":
+        if column not in DICTIONARY_COLUMNS:
+            raise ValueError(f"不支持的分组列: {column}")
+        return self.columns[column]
+
+    def _mask(
+        self,
+        *,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        correct: Optional[bool] = None,
+    ) -> "np.ndarray":
+        timestamps = self.columns["timestamp"]
+        mask = np.ones(timestamps.shape[0], dtype=bool)
+        if date_from is not None:
+            mask &= timestamps >= _epoch_seconds(date_from)
+        if date_to is not None:
+            mask &= timestamps <= _epoch_seconds(date_to)
+        if correct is not None:
+            mask &= self.columns["correct"] == correct
+        return mask
+
+
+def _epoch_seconds(value: datetime) -> int:
+    key = to_timestamp_key(value).rstrip("Z")
+    return int(np.datetime64(key, "s").astype(np.int64))
+
+
+class AnalyticsSnapshotManager:
+    """维护 ``data/analytics/history_snapshot.npz`` 并定期刷新
+
+    请求线程只读取已有快照；快照过期时交给后台线程重建，重建期间继续返回
+    旧快照。只有从未构建过快照时才会在调用线程中同步构建一次。
+    """
+
+    def __init__(
+        self,
+        record_manager: "RecordManager",
+        *,
+        path: Optional[Path] = None,
+        max_age_seconds: float = 300.0,
+    ) -> None:
+        self.record_manager = record_manager
+        self.path = (
+            path or record_manager.data_dir / "analytics" / "history_snapshot.npz"
+        )
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()  # 保护 _snapshot
+        self._build_lock = threading.Lock()  # 同一时间只重建一次
+        self._snapshot: Optional[HistorySnapshot] = None
+        self._loaded = False
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._stop_refresh = threading.Event()
+        self._wake = threading.Event()
+
+    def get(self) -> HistorySnapshot:
+        """返回最近的快照；过期时安排后台重建，不等待重建完成"""
+        _require_numpy()
+        with self._lock:
+            if not self._loaded:
+                self._snapshot = HistorySnapshot.load(self.path)
+                self._loaded = True
+            snapshot = self._snapshot
+        if snapshot is None:
+            # 首次构建发生在请求线程中，不启动扫描进程池
+            with self._build_lock:
+                return self._rebuild(workers=1)
+        if self._is_stale(snapshot):
+            self._schedule_rebuild()
+        return snapshot
+
+    def refresh(self) -> HistorySnapshot:
+        """立即重建快照"""
+        _require_numpy()
+        with self._build_lock:
+            return self._rebuild()
+
+    def start_refresh_thread(self) -> None:
+        """启动后台刷新线程：定期检查，或在 :meth:`get` 发现过期时立即重建"""
+        if self._refresh_thread is not None or not HAS_NUMPY:
+            return
+
+        def refresh_loop() -> None:
+            while not self._stop_refresh.is_set():
+                self._wake.wait(timeout=self.max_age_seconds)
+                self._wake.clear()
+                if self._stop_refresh.is_set():
+                    return
+                self._refresh_if_stale()
+
+        self._refresh_thread = threading.Thread(
+            target=refresh_loop, name="analytics-refresh", daemon=True
+        )
+        self._refresh_thread.start()
+
+    def stop_refresh_thread(self) -> None:
+        """停止后台刷新线程"""
+        if self._refresh_thread is None:
+            return
+        self._stop_refresh.set()
+        self._wake.set()
+        self._refresh_thread.join(timeout=2)
+        self._refresh_thread = None
+
+    def _schedule_rebuild(self) -> None:
+        if self._refresh_thread is not None:
+            self._wake.set()
+            return
+        # 未启动刷新线程（如命令行工具）时用一次性线程重建
+        if not self._build_lock.locked():
+            threading.Thread(
+                target=self._refresh_if_stale, name="analytics-rebuild", daemon=True
+            ).start()
+
+    def _refresh_if_stale(self) -> None:
+        if not self._build_lock.acquire(blocking=False):
+            return  # 已有重建在进行
+        try:
+            with self._lock:
+                snapshot = self._snapshot
+            if snapshot is None or self._is_stale(snapshot):
+                self._rebuild()
+        except Exception as exc:  # pragma: no cover - 后台线程兜底
+            print(f"⚠️  刷新分析快照失败: {exc}")
+        finally:
+            self._build_lock.release()
+
+    def _is_stale(self, snapshot: HistorySnapshot) -> bool:
+        if time.time() - snapshot.built_at < self.max_age_seconds:
+            return False
+        # 旧快照没有记录数据版本，视为过期重建一次
+        generation = self.record_manager.answer_history_generation()
+        return snapshot.source_generation != generation
+
+    def _rebuild(self, *, workers: Optional[int] = None) -> HistorySnapshot:
+        """重建并保存快照（调用方持有 ``_build_lock``）"""
+        # 先取数据版本再扫描：扫描期间的写入会让快照在下次检查时过期
+        source_generation = self.record_manager.answer_history_generation()
+        source_rows = self.record_manager.count_answer_history()
+        rows = self.record_manager.scan_answer_history(
+            extract_rows, _concat_rows, [], workers=workers
+        )
+        snapshot = HistorySnapshot.from_rows(
+            rows, source_rows=source_rows, source_generation=source_generation
+        )
+        snapshot.save(self.path)
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+
+__all__ = [
+    "AnalyticsSnapshotManager",
+    "HAS_NUMPY",
+    "HistorySnapshot",
+    "component_of",
+    "extract_rows",
+]
@@ -0,0 +1,355 @@
+"""JSONL → SQLite 批量导入工具
+
+把现有部署的答题历史（``data/history/`` 分段以及尚未迁移的旧版
+``answer_history.jsonl``）和 ``wrong_questions.json`` 导入 ``data/records.db``。
+
+- 逐行流式读取，不把整个文件读入内存；
+- 每批 ``batch_size`` 行用 ``executemany`` 在一个事务内写入；
+- 每批提交时在同一事务里更新 ``import_checkpoints`` 中的字节偏移，
+  中断后重新运行会从断点继续，已导入的行按 ``record_id`` 去重；
+- 向空表导入时先删除二级索引、导入完成后统一重建（定义暂存在
+  ``import_deferred_indexes``，中断后下次运行结束时同样会重建）。
+
+用法::
+
+    python -m src.database.importer [data_dir] [db_path]
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, Callable, Iterator, List, Optional, Tuple
+
+from ..question_catalog import QuestionCatalog
+from ..record_manager import history_entry_id, history_question_type
+from .migrations import run_migrations
+
+DEFAULT_BATCH_SIZE = 50_000
+
+_INSERT_HISTORY_SQL = """
+    INSERT OR IGNORE INTO answer_history (
+        record_id, timestamp, session_id, question_type, question_prompt,
+        user_answer, is_correct, plain_explanation, knowledge_source, mode,
+        extra, question_id, question_ref
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_INSERT_WRONG_SQL = """
+    INSERT OR REPLACE INTO wrong_questions (
+        identifier, question_type, question_prompt, question_data,
+        last_plain_explanation, last_wrong_at, wrong_count
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+_UPSERT_CHECKPOINT_SQL = """
+    INSERT INTO import_checkpoints (source, byte_offset, rows, updated_at)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(source) DO UPDATE SET
+        byte_offset = excluded.byte_offset,
+        rows = excluded.rows,
+        updated_at = excluded.updated_at
+"""
+
+
+@dataclass
+class ImportStats:
+    """导入结果统计"""
+
+    history_rows: int = 0
+    skipped_rows: int = 0
+    wrong_questions: int = 0
+    sources: int = 0
+    elapsed_seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.history_rows / self.elapsed_seconds
+
+
+class RecordImporter:
+    """把 ``data_dir`` 下的 JSON/JSONL 记录导入 SQLite"""
+
+    def __init__(
+        self,
+        data_dir: Path,
+        db_path: Path,
+        *,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        self.data_dir = data_dir
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._catalog = QuestionCatalog(data_dir / "question_catalog.jsonl")
+
+    def run(self) -> ImportStats:
+        """执行迁移并导入全部数据"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        run_migrations(self.db_path)
+        stats = ImportStats()
+        started = time.perf_counter()
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            # 大事务 + WAL：每批只 fsync 一次
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-262144")
+            self._defer_secondary_indexes(conn)
+            for source, opener in self._history_sources():
+                stats.sources += 1
+                self._import_history_source(conn, source, opener, stats)
+            self._restore_deferred_indexes(conn)
+            self._import_wrong_questions(conn, stats)
+        finally:
+            conn.close()
+        stats.elapsed_seconds = time.perf_counter() - started
+        return stats
+
+    # Internal helpers ---------------------------------------------------------
+
+    def _history_sources(self) -> List[Tuple[str, Callable[[], IO[bytes]]]]:
+        """按时间顺序列出历史来源；断点键不含 ``.gz``，段被压缩后仍可续传"""
+        sources: List[Tuple[str, Callable[[], IO[bytes]]]] = []
+        legacy = self.data_dir / "answer_history.jsonl"
+        if legacy.exists():
+            sources.append((legacy.name, legacy.open))
+
+        history_root = self.data_dir / "history"
+        manifest_path = history_root / "manifest.json"
+        if manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+            for segment in manifest.get("segments", []):
+                path = history_root / segment["name"]
+                key = f"history/{segment['name'].removesuffix('.gz')}"
+                sources.append((key, _segment_opener(path)))
+        return sources
+
+    def _defer_secondary_indexes(self, conn: sqlite3.Connection) -> None:
+        """空表导入时暂时删除非唯一索引，逐行维护索引是导入的主要开销"""
+        if conn.execute("SELECT 1 FROM answer_history LIMIT 1").fetchone():
+            return
+        indexes = conn.execute("""
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND tbl_name = 'answer_history'
+              AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%'
+            """).fetchall()
+        if not indexes:
+            return
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO import_deferred_indexes (name, sql) VALUES (?, ?)",
+                indexes,
+            )
+            for name, _ in indexes:
+                conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _restore_deferred_indexes(self, conn: sqlite3.Connection) -> None:
+        indexes = conn.execute(
+            "SELECT name, sql FROM import_deferred_indexes"
+        ).fetchall()
+        if not indexes:
+            return
+        print(f"🔄 重建 {len(indexes)} 个索引...")
+        conn.execute("BEGIN")
+        try:
+            for name, sql in indexes:
+                conn.execute(
+                    sql.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1)
+                )
+            conn.execute("DELETE FROM import_deferred_indexes")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _import_history_source(
+        self,
+        conn: sqlite3.Connection,
+        source: str,
+        opener: Callable[[], IO[bytes]],
+        stats: ImportStats,
+    ) -> None:
+        row = conn.execute(
+            "SELECT byte_offset, rows FROM import_checkpoints WHERE source = ?",
+            (source,),
+        ).fetchone()
+        offset, imported = row if row else (0, 0)
+
+        try:
+            handle = opener()
+        except FileNotFoundError:
+            return
+        with handle:
+            if offset:
+                handle.seek(offset)
+            batch: List[Tuple[Any, ...]] = []
+            for raw in handle:
+                if not raw.endswith(b"\n"):
+                    break  # 仍在写入的最后一行，下次再导入
+                offset += len(raw)
+                parsed = self._history_row(raw)
+                if parsed is None:
+                    if raw.strip():
+                        stats.skipped_rows += 1
+                    continue
+                batch.append(parsed)
+                if len(batch) >= self.batch_size:
+                    imported += self._commit_batch(
+                        conn, source, batch, offset, imported
+                    )
+                    stats.history_rows += len(batch)
+                    batch = []
+            imported += self._commit_batch(conn, source, batch, offset, imported)
+            stats.history_rows += len(batch)
+
+    def _commit_batch(
+        self,
+        conn: sqlite3.Connection,
+        source: str,
+        batch: List[Tuple[Any, ...]],
+        offset: int,
+        imported: int,
+    ) -> int:
+        """写入一批并在同一事务中推进断点"""
+        conn.execute("BEGIN")
+        try:
+            if batch:
+                conn.executemany(_INSERT_HISTORY_SQL, batch)
+            conn.execute(
+                _UPSERT_CHECKPOINT_SQL,
+                (source, offset, imported + len(batch), _now_iso()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(batch)
+
+    def _history_row(self, raw: bytes) -> Optional[Tuple[Any, ...]]:
+        """校验并转换一行历史；无效行返回 None"""
+        try:
+            item = json.loads(raw)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+        if not isinstance(item, dict):
+            return None
+        timestamp = item.get("timestamp")
+        session_id = item.get("session_id")
+        question_type = history_question_type(item)
+        if not (timestamp and session_id and question_type):
+            return None
+
+        question = item.get("question")
+        if not isinstance(question, dict) and item.get("question_ref"):
+            question = self._catalog.get(item["question_ref"])
+        question = question or {}
+        context = item.get("session_context") or {}
+        extra = item.get("extra")
+        return (
+            history_entry_id(item),
+            timestamp,
+            session_id,
+            question_type,
+            question.get("prompt", ""),
+            str(item.get("user_answer", "")),
+            1 if item.get("is_correct") else 0,
+            item.get("plain_explanation"),
+            context.get("filepath"),
+            context.get("mode"),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+            item.get("question_id") or question.get("identifier"),
+            item.get("question_ref"),
+        )
+
+    def _import_wrong_questions(
+        self, conn: sqlite3.Connection, stats: ImportStats
+    ) -> None:
+        wrong_path = self.data_dir / "wrong_questions.json"
+        if not wrong_path.exists():
+            return
+        try:
+            payload = json.loads(wrong_path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            print(f"⚠️  无法解析 {wrong_path}，跳过错题导入")
+            return
+        entries = payload.values() if isinstance(payload, dict) else payload
+
+        rows: List[Tuple[Any, ...]] = []
+        for entry in entries:
+            question = entry.get("question") if isinstance(entry, dict) else None
+            if not isinstance(question, dict) or not question.get("identifier"):
+                stats.skipped_rows += 1
+                continue
+            rows.append(
+                (
+                    question["identifier"],
+                    question.get("question_type", ""),
+                    question.get("prompt", ""),
+                    json.dumps(question, ensure_ascii=False),
+                    entry.get("last_plain_explanation"),
+                    entry.get("last_wrong_at") or _now_iso(),
+                    int(entry.get("wrong_count", 1)),
+                )
+            )
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(_INSERT_WRONG_SQL, rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        stats.wrong_questions += len(rows)
+
+
+def _segment_opener(path: Path) -> Callable[[], IO[bytes]]:
+    def open_segment() -> IO[bytes]:
+        # 段可能在导入期间被压缩，解压后的字节偏移与原文件一致
+        for candidate in (path, path.with_name(path.name + ".gz")):
+            if candidate.suffix == ".gz" and candidate.exists():
+                return gzip.open(candidate, "rb")
+            if candidate.exists():
+                return candidate.open("rb")
+        raise FileNotFoundError(path)
+
+    return open_segment
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
+
+
+def iter_import_checkpoints(db_path: Path) -> Iterator[Tuple[str, int, int]]:
+    """列出各来源的导入断点（来源、字节偏移、已导入行数）"""
+    with sqlite3.connect(db_path) as conn:
+        yield from conn.execute(
+            "SELECT source, byte_offset, rows FROM import_checkpoints ORDER BY source"
+        )
+
+
+if __name__ == "__main__":
+    import sys
+
+    data_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path("data")
+    db_path = Path(sys.argv[2]) if len(sys.argv) > 2 else data_dir / "records.db"
+
+    result = RecordImporter(data_dir, db_path).run()
+    print(
+        f"✅ 导入完成：历史 {result.history_rows} 行，错题 {result.wrong_questions} 道，"
+        f"跳过 {result.skipped_rows} 行，耗时 {result.elapsed_seconds:.1f}s"
+        f"（{result.rows_per_second:,.0f} 行/秒）"
+    )
+    for source, offset, rows in iter_import_checkpoints(db_path):
+        print(f"   {source}: {rows} 行 @ {offset} 字节")
@@ -299,6 +299,40 @@ MIGRATIONS: List[Migration] = [
             DROP TABLE IF EXISTS ai_call_metrics;
         """,
     ),
+    Migration(
+        version="005_add_import_checkpoints",
+        description="支持从 JSONL 批量导入：记录标识与导入断点",
+        up_sql="""
+            ALTER TABLE answer_history ADD COLUMN record_id TEXT;
+            ALTER TABLE answer_history ADD COLUMN question_id TEXT;
+            ALTER TABLE answer_history ADD COLUMN question_ref TEXT;
+
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_answer_history_record_id
+                ON answer_history(record_id);
+
+            CREATE TABLE IF NOT EXISTS import_checkpoints (
+                source TEXT PRIMARY KEY,
+                byte_offset INTEGER NOT NULL,
+                rows INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS import_deferred_indexes (
+                name TEXT PRIMARY KEY,
+                sql TEXT NOT NULL
+            );
+        """,
+        down_sql="""
+            DROP TABLE IF EXISTS import_deferred_indexes;
+            DROP TABLE IF EXISTS import_checkpoints;
+            DROP INDEX IF EXISTS idx_answer_history_record_id;
+
+            -- DROP COLUMN 需要 SQLite 3.35+，列上的索引须先删除
+            ALTER TABLE answer_history DROP COLUMN question_ref;
+            ALTER TABLE answer_history DROP COLUMN question_id;
+            ALTER TABLE answer_history DROP COLUMN record_id;
+        """,
+    ),
 ]
 
 
@@ -0,0 +1,117 @@
+"""答题历史的流式导出（CSV / NDJSON，可选 gzip）
+
+导出以生成器的形式逐段读取历史，按时间正序逐条编码，累积约
+``CHUNK_BYTES`` 后产出一块交给 HTTP 分块响应；全程只持有当前块，导出
+数百万行时内存占用保持不变。
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+CHUNK_BYTES = 64 * 1024
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+CSV_COLUMNS = [
+    "id",
+    "timestamp",
+    "session_id",
+    "question_id",
+    "question_type",
+    "component",
+    "prompt",
+    "user_answer",
+    "is_correct",
+    "plain_explanation",
+    "knowledge_file",
+    "mode",
+]
+
+
+def _csv_row(item: Dict[str, Any]) -> List[Any]:
+    question = item.get("question") or {}
+    context = item.get("session_context") or {}
+    return [
+        item.get("id"),
+        item.get("timestamp"),
+        item.get("session_id"),
+        item.get("question_id") or question.get("identifier"),
+        item.get("question_type") or question.get("question_type"),
+        item.get("component") or question.get("component"),
+        question.get("prompt"),
+        item.get("user_answer"),
+        "true" if item.get("is_correct") else "false",
+        item.get("plain_explanation"),
+        context.get("knowledge_file") or context.get("filepath"),
+        context.get("mode"),
+    ]
+
+
+def _chunked(lines: Iterable[str]) -> Iterator[bytes]:
+    buffer: List[bytes] = []
+    size = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        buffer.append(data)
+        size += len(data)
+        if size >= CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_csv(records: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """编码为 CSV（带 UTF-8 BOM，便于 Excel 直接打开）"""
+
+    def lines() -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        yield "\ufeff" + buffer.getvalue()
+        for item in records:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(_csv_row(item))
+            yield buffer.getvalue()
+
+    return _chunked(lines())
+
+
+def iter_ndjson(records: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """编码为每行一个 JSON 对象"""
+    return _chunked(json.dumps(item, ensure_ascii=False) + "\n" for item in records)
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """把字节流增量压缩为 gzip 格式"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+ENCODERS: Dict[str, Callable[[Iterable[Dict[str, Any]]], Iterator[bytes]]] = {
+    "csv": iter_csv,
+    "ndjson": iter_ndjson,
+}
+
+
+__all__ = [
+    "CSV_COLUMNS",
+    "ENCODERS",
+    "EXPORT_FORMATS",
+    "gzip_stream",
+    "iter_csv",
+    "iter_ndjson",
+]
@@ -0,0 +1,199 @@
+"""内存映射 + 多进程的全量历史扫描
+
+导出、重建统计快照等任务需要遍历全部作答记录，逐行 ``json.loads`` 只能用满
+一个核。扫描器先按清单挑选分段，未压缩的段用 ``mmap`` 映射后按换行边界切成
+若干块，压缩段各自作为一块；各块交给进程池解析并调用 ``mapper`` 得到部分
+结果，最后按块顺序用 ``reducer`` 合并。
+
+``mapper`` 与 ``reducer`` 必须是模块级函数（子进程需要能够 pickle）。数据量
+小于 ``parallel_threshold`` 或 ``workers=1`` 时直接在当前进程内执行。
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import mmap
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from functools import reduce
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from .history_store import HistoryStore, to_timestamp_key
+
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+DEFAULT_PARALLEL_THRESHOLD = 4 * 1024 * 1024
+
+T = TypeVar("T")
+Mapper = Callable[[Iterator[Dict[str, Any]]], T]
+Reducer = Callable[[T, T], T]
+
+
+@dataclass(frozen=True)
+class ScanTask:
+    """一个待解析的数据块：段文件中 ``[start, end)`` 的字节范围"""
+
+    path: str
+    compressed: bool
+    start: int
+    end: Optional[int]
+    lower: Optional[str] = None
+    upper: Optional[str] = None
+    estimated_bytes: int = 0  # 解压后的大小，用于判断是否值得启动进程池
+
+
+def _read_range(task: ScanTask) -> bytes:
+    path = Path(task.path)
+    if not task.compressed:
+        try:
+            with path.open("rb") as handle:
+                size = os.fstat(handle.fileno()).st_size
+                if size == 0:
+                    return b""
+                with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return mapped[task.start : task.end]
+        except FileNotFoundError:
+            # 规划之后该段被关闭并压缩；解压后的字节偏移不变
+            path = path.with_name(path.name + ".gz")
+    try:
+        with gzip.open(path, "rb") as handle:
+            data = handle.read()
+    except FileNotFoundError:
+        return b""
+    return data[task.start : task.end]
+
+
+def _iter_task_records(task: ScanTask) -> Iterator[Dict[str, Any]]:
+    for raw in _read_range(task).splitlines():
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            continue
+        if task.lower or task.upper:
+            timestamp = record.get("timestamp") or ""
+            if task.lower and timestamp < task.lower:
+                continue
+            if task.upper and timestamp > task.upper:
+                continue
+        yield record
+
+
+def _run_task(task: ScanTask, mapper: Mapper) -> Any:
+    return mapper(_iter_task_records(task))
+
+
+class HistoryScanner:
+    """对 :class:`HistoryStore` 做 map/reduce 式的并行全量扫描"""
+
+    def __init__(
+        self,
+        store: HistoryStore,
+        *,
+        workers: Optional[int] = None,
+        chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+        parallel_threshold: int = DEFAULT_PARALLEL_THRESHOLD,
+    ) -> None:
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_bytes = chunk_bytes
+        self.parallel_threshold = parallel_threshold
+
+    def plan(
+        self,
+        *,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+    ) -> List[ScanTask]:
+        """按清单挑选分段并切块"""
+        lower = to_timestamp_key(date_from) if date_from else None
+        upper = to_timestamp_key(date_to) if date_to else None
+        tasks: List[ScanTask] = []
+        for segment in self.store.select_segments(date_from=date_from, date_to=date_to):
+            path = self.store.root / segment["name"]
+            if segment["compressed"]:
+                # 清单中的 bytes 是压缩前的原始大小
+                tasks.append(
+                    ScanTask(str(path), True, 0, None, lower, upper, segment["bytes"])
+                )
+                continue
+            tasks.extend(self._split_segment(path, segment["bytes"], lower, upper))
+        return tasks
+
+    def map_reduce(
+        self,
+        mapper: Mapper,
+        reducer: Reducer,
+        initial: T,
+        *,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+    ) -> T:
+        """对每块调用 ``mapper``，再按块顺序用 ``reducer`` 合并部分结果"""
+        tasks = self.plan(date_from=date_from, date_to=date_to)
+        if self._run_inline(tasks):
+            partials = [_run_task(task, mapper) for task in tasks]
+        else:
+            # 使用 spawn：Web 进程中有后台写线程，fork 可能继承被持有的锁
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(tasks)), mp_context=context
+            ) as pool:
+                partials = list(pool.map(_run_task, tasks, [mapper] * len(tasks)))
+        return reduce(reducer, partials, initial)
+
+    # Internal helpers ---------------------------------------------------------
+
+    def _run_inline(self, tasks: List[ScanTask]) -> bool:
+        if self.workers <= 1 or len(tasks) <= 1:
+            return True
+        estimated = sum(task.estimated_bytes for task in tasks)
+        return estimated < self.parallel_threshold
+
+    def _split_segment(
+        self,
+        path: Path,
+        committed_bytes: int,
+        lower: Optional[str],
+        upper: Optional[str],
+    ) -> List[ScanTask]:
+        """在换行边界处把未压缩段切成约 ``chunk_bytes`` 大小的块
+
+        只扫描清单已登记的字节数，其他进程正在追加的行不会被读到一半。
+        """
+        try:
+            handle = path.open("rb")
+        except FileNotFoundError:
+            # 段已被压缩，整段作为一块
+            return [
+                ScanTask(
+                    str(path), False, 0, committed_bytes, lower, upper, committed_bytes
+                )
+            ]
+        tasks: List[ScanTask] = []
+        with handle:
+            size = min(os.fstat(handle.fileno()).st_size, committed_bytes)
+            if size == 0:
+                return tasks
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                start = 0
+                while start < size:
+                    end = min(start + self.chunk_bytes, size)
+                    if end < size:
+                        newline = mapped.find(b"\n", end - 1, size)
+                        end = size if newline == -1 else newline + 1
+                    tasks.append(
+                        ScanTask(
+                            str(path), False, start, end, lower, upper, end - start
+                        )
+                    )
+                    start = end
+        return tasks
+
+
+__all__ = ["HistoryScanner", "ScanTask"]
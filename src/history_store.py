@@ -0,0 +1,667 @@
+"""按日期分段的答题历史存储
+
+历史记录不再写入单个不断增长的 ``answer_history.jsonl``，而是按天（以及
+单段大小上限）切分为多个 JSONL 段文件，并用 ``manifest.json`` 记录每段的
+时间范围、行数与原始字节数（压缩段另记 ``compressed_bytes``）。已关闭的段会被 gzip 压缩；按时间过滤的读取会
+直接跳过范围之外的段，无需打开文件。
+
+迟到的记录（时间早于所在段已有的记录）会并入当前活动段，该段在清单中
+标记 ``unordered``；读取时对这类段以及时间范围互相重叠的相邻段按时间
+重新排序，保证 :meth:`HistoryStore.iter_records` 按时间顺序（或倒序）返回。
+
+清单还记录版本号 ``generation``（每次写入清单时递增）与 ``epoch``（清单
+新建时随机生成），:meth:`HistoryStore.generation` 据此给出数据版本，
+供接口生成 ETag。
+
+多个进程可以共享同一目录：所有写操作都持有 ``.lock`` 文件锁，并在写入前
+重新同步磁盘上的清单；清单通过临时文件原子替换，读者无需加锁。
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from .utils.file_lock import FileLock, atomic_write_text
+
+MANIFEST_VERSION = 1
+DEFAULT_MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+REVERSE_BLOCK_SIZE = 64 * 1024
+
+
+def to_timestamp_key(value: datetime) -> str:
+    """将 datetime 转为与记录 ``timestamp`` 字段可直接比较的字符串"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=0).isoformat() + "Z"
+
+
+class HistoryStore:
+    """管理答题历史段文件及其清单"""
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        legacy_path: Optional[Path] = None,
+        max_segment_bytes: int = DEFAULT_MAX_SEGMENT_BYTES,
+        compress_level: int = 6,
+    ) -> None:
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.root / "manifest.json"
+        self.legacy_path = legacy_path
+        self.max_segment_bytes = max_segment_bytes
+        self.compress_level = compress_level
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(self.root / ".lock")
+        self._manifest_stamp: Optional[Tuple[int, int, int]] = None
+        self._segments: List[Dict[str, Any]] = []
+        self._epoch: Optional[str] = None
+        self._generation = 0
+        self._migrated_legacy: Optional[Dict[str, Any]] = None
+        self._obsolete: List[Path] = []
+        with self._file_lock:
+            self._sync_manifest()
+            if legacy_path is not None and legacy_path.exists():
+                self._migrate_legacy(legacy_path)
+            self.compact()
+
+    # Write path -----------------------------------------------------------------
+
+    def append(self, records: List[Tuple[str, str]], fsync: bool = False) -> None:
+        """追加一批 ``(timestamp, line)`` 记录，必要时切换到新段"""
+        if not records:
+            return
+        with self._file_lock, self._lock:
+            self._sync_manifest()
+            groups: List[Tuple[Dict[str, Any], List[Tuple[str, str]]]] = []
+            closed: List[Dict[str, Any]] = []
+            for timestamp, line in records:
+                segment = self._segment_for(timestamp, closed)
+                if groups and groups[-1][0] is segment:
+                    groups[-1][1].append((timestamp, line))
+                else:
+                    groups.append((segment, [(timestamp, line)]))
+
+            for segment, items in groups:
+                payload = "".join(line for _, line in items).encode("utf-8")
+                path = self.root / segment["name"]
+                with path.open("ab") as handle:
+                    handle.write(payload)
+                    if fsync:
+                        handle.flush()
+                        os.fsync(handle.fileno())
+                stamps = [ts for ts, _ in items if ts]
+                if stamps:
+                    if stamps != sorted(stamps) or stamps[0] < segment["last_ts"]:
+                        segment["unordered"] = True
+                    first, last = min(stamps), max(stamps)
+                    if not segment["first_ts"] or first < segment["first_ts"]:
+                        segment["first_ts"] = first
+                    if not segment["last_ts"] or last > segment["last_ts"]:
+                        segment["last_ts"] = last
+                segment["rows"] += len(items)
+                segment["bytes"] += len(payload)
+
+            # 本批写完之后再压缩被切换下来的旧段
+            for segment in closed:
+                self._compress_segment(segment)
+            self._write_manifest()
+
+    def compact(self) -> int:
+        """压缩除当前活动段之外所有未压缩的段，返回压缩数量"""
+        with self._file_lock, self._lock:
+            self._sync_manifest()
+            active = self._active_segment()
+            compressed = 0
+            for segment in self._segments:
+                if segment is active or segment["compressed"]:
+                    continue
+                self._compress_segment(segment)
+                compressed += 1
+            if compressed:
+                self._write_manifest()
+            return compressed
+
+    def purge(
+        self, *, before: Optional[str] = None, max_rows: Optional[int] = None
+    ) -> int:
+        """删除时间戳早于 ``before`` 的记录，并只保留最新的 ``max_rows`` 行
+
+        整段过期的直接删除；跨越边界的段流式重写到新文件名（保证同名段的
+        字节偏移永不改变，导入断点与扫描切块仍然有效）。返回删除的行数。
+        """
+        with self._file_lock, self._lock:
+            self._sync_manifest()
+            removed = 0
+            if before:
+                for segment in list(self._segments):
+                    if segment["last_ts"] and segment["last_ts"] < before:
+                        removed += self._drop_segment(segment)
+                    elif segment["first_ts"] and segment["first_ts"] < before:
+                        removed += self._rewrite_segment(
+                            segment, lambda index, ts: ts >= before
+                        )
+            if max_rows is not None:
+                excess = sum(segment["rows"] for segment in self._segments) - max_rows
+                while excess > 0 and self._segments:
+                    segment = self._segments[0]
+                    if segment["rows"] <= excess:
+                        dropped = self._drop_segment(segment)
+                    else:
+                        skip = excess
+                        dropped = self._rewrite_segment(
+                            segment, lambda index, ts: index >= skip
+                        )
+                    excess -= dropped
+                    removed += dropped
+            if removed:
+                self._write_manifest()
+            for path in self._obsolete:
+                path.unlink(missing_ok=True)
+            self._obsolete = []
+            return removed
+
+    def clear(self) -> None:
+        """删除所有段文件与清单"""
+        with self._file_lock, self._lock:
+            self._sync_manifest()
+            for segment in self._segments:
+                (self.root / segment["name"]).unlink(missing_ok=True)
+            self._segments = []
+            self.manifest_path.unlink(missing_ok=True)
+            self._manifest_stamp = None
+            self._epoch, self._generation = None, 0
+
+    # Read path ------------------------------------------------------------------
+
+    def segments(self) -> List[Dict[str, Any]]:
+        """返回清单快照（按时间顺序）"""
+        with self._lock:
+            self._sync_manifest()
+            return [dict(segment) for segment in self._segments]
+
+    def generation(self) -> str:
+        """数据版本：任何写入（追加、压缩、清理、清空）后都会改变"""
+        with self._lock:
+            self._sync_manifest()
+            if self._epoch is not None:
+                return f"{self._epoch}.{self._generation}"
+            if self._manifest_stamp is None:
+                return "0"  # 尚无记录
+            # 旧版清单没有版本号，以文件戳代替
+            return ".".join(str(part) for part in self._manifest_stamp)
+
+    def iter_records(
+        self,
+        *,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        reverse: bool = False,
+        max_timestamp: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """遍历记录，跳过时间范围之外的段
+
+        ``reverse=True`` 时从最新的记录开始倒序返回；``max_timestamp`` 是
+        时间戳键的上界（含），游标续读时借此跳过整段更新的记录，倒序读取
+        有序段时段内更新的记录也会被跳过。
+        """
+        segments = self.select_segments(
+            date_from=date_from, date_to=date_to, max_timestamp=max_timestamp
+        )
+        groups = _overlapping_groups(segments)
+        if reverse:
+            groups.reverse()
+        for group in groups:
+            if len(group) == 1 and not group[0].get("unordered"):
+                if reverse:
+                    # 有序的单个段从末尾（或上界处）倒着读，调用方取够即停
+                    yield from self._iter_segment_reversed(group[0], max_timestamp)
+                else:
+                    yield from self._iter_segment(group[0])
+                continue
+            # 乱序或互相重叠的段只能整组排序；稳定排序：同一时间戳保持写入顺序
+            records = sorted(
+                (record for segment in group for record in self._iter_segment(segment)),
+                key=lambda record: record.get("timestamp") or "",
+            )
+            yield from reversed(records) if reverse else records
+
+    def select_segments(
+        self,
+        *,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        max_timestamp: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """根据清单中的时间范围挑选可能包含目标记录的段"""
+        lower = to_timestamp_key(date_from) if date_from else None
+        upper = to_timestamp_key(date_to) if date_to else None
+        if max_timestamp and (upper is None or max_timestamp < upper):
+            upper = max_timestamp
+        selected = []
+        for segment in self.segments():
+            if lower and segment["last_ts"] and segment["last_ts"] < lower:
+                continue
+            if upper and segment["first_ts"] and segment["first_ts"] > upper:
+                continue
+            selected.append(segment)
+        return selected
+
+    def total_rows(self) -> int:
+        """清单记录的总行数（无需读取段文件）"""
+        return sum(segment["rows"] for segment in self.segments())
+
+    def open_segment(self, segment: Dict[str, Any]) -> Optional[IO[bytes]]:
+        """以二进制方式打开段文件（兼容读取期间段被压缩的情况）"""
+        path = self.root / segment["name"]
+        candidates = [path]
+        if not segment["compressed"]:
+            candidates.append(path.with_name(path.name + ".gz"))
+        for candidate in candidates:
+            try:
+                if candidate.suffix == ".gz":
+                    return gzip.open(candidate, "rb")
+                return candidate.open("rb")
+            except FileNotFoundError:
+                continue
+        return None
+
+    def disk_usage(self) -> int:
+        """所有段文件占用的字节数"""
+        total = 0
+        for segment in self.segments():
+            path = self.root / segment["name"]
+            if path.exists():
+                total += path.stat().st_size
+        return total
+
+    # Internal helpers ---------------------------------------------------------
+
+    def _iter_segment(self, segment: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        handle = self.open_segment(segment)
+        if handle is None:
+            return
+        with handle:
+            yield from _parse_lines(handle)
+
+    def _iter_segment_reversed(
+        self, segment: Dict[str, Any], max_timestamp: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """倒序读取有序段，跳过时间戳大于 ``max_timestamp`` 的记录
+
+        未压缩的段先二分查找上界所在的字节偏移，再从该处按固定大小的块
+        向前读取，只解析实际返回的行；gzip 段无法向前定位，仍顺序解压后
+        倒序返回（只保留上界以内的记录）。
+        """
+        handle = self.open_segment(segment)
+        if handle is None:
+            return
+        with handle:
+            if isinstance(handle, gzip.GzipFile):
+                records = [
+                    record
+                    for record in _parse_lines(handle)
+                    if not max_timestamp
+                    or (record.get("timestamp") or "") <= max_timestamp
+                ]
+                yield from reversed(records)
+                return
+            end = handle.seek(0, os.SEEK_END)
+            if max_timestamp:
+                end = _offset_after(handle, end, max_timestamp)
+            yield from _parse_lines(_lines_backwards(handle, end))
+
+    def _active_segment(self) -> Optional[Dict[str, Any]]:
+        for segment in reversed(self._segments):
+            if not segment["compressed"]:
+                return segment
+        return None
+
+    def _segment_for(
+        self, timestamp: str, closed: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        day = (timestamp or to_timestamp_key(datetime.utcnow()))[:10]
+        active = self._active_segment()
+        if active is not None and active is self._segments[-1]:
+            # 迟到的记录（日期早于活动段）直接并入活动段，清单会扩展其时间范围，
+            # append 把该段标记为 unordered，读取时按时间重排
+            if day <= active["day"] and active["bytes"] < self.max_segment_bytes:
+                return active
+        if active is not None:
+            closed.append(active)
+        return self._new_segment(day)
+
+    def _next_part(self, day: str) -> int:
+        """同一天的下一个段序号（段被清理后也不会复用旧文件名）"""
+        parts = [
+            int(segment["name"][11:14]) if segment["name"][11:14].isdigit() else 0
+            for segment in self._segments
+            if segment["day"] == day
+        ]
+        return max(parts) + 1 if parts else 0
+
+    def _new_segment(self, day: str) -> Dict[str, Any]:
+        part = self._next_part(day)
+        name = f"{day}.jsonl" if part == 0 else f"{day}.{part:03d}.jsonl"
+        segment = {
+            "name": name,
+            "day": day,
+            "first_ts": "",
+            "last_ts": "",
+            "rows": 0,
+            "bytes": 0,
+            "compressed": False,
+        }
+        self._segments.append(segment)
+        return segment
+
+    def _drop_segment(self, segment: Dict[str, Any]) -> int:
+        # 文件在新清单写出之后才删除，中途崩溃不会让清单指向缺失的段
+        self._obsolete.append(self.root / segment["name"])
+        self._segments.remove(segment)
+        return segment["rows"]
+
+    def _rewrite_segment(
+        self, segment: Dict[str, Any], keep: Callable[[int, str], bool]
+    ) -> int:
+        """流式重写一个段，只保留 ``keep(行号, 时间戳)`` 为真的行"""
+        source = self.root / segment["name"]
+        part = self._next_part(segment["day"])
+        name = f"{segment['day']}.{part:03d}.jsonl"
+        if segment["compressed"]:
+            name += ".gz"
+        target = self.root / name
+        tmp = target.with_name(target.name + ".tmp")
+        rewritten = {**segment, "name": name, "first_ts": "", "last_ts": ""}
+        rewritten.update(rows=0, bytes=0)
+        reader = self.open_segment(segment)
+        if reader is None:
+            return self._drop_segment(segment)
+        if segment["compressed"]:
+            writer: IO[bytes] = gzip.open(tmp, "wb", compresslevel=self.compress_level)
+        else:
+            writer = tmp.open("wb")
+        with reader, writer:
+            for index, raw in enumerate(reader):
+                try:
+                    timestamp = json.loads(raw).get("timestamp") or ""
+                except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+                    timestamp = ""
+                if not keep(index, timestamp):
+                    continue
+                writer.write(raw)
+                if timestamp:
+                    if not rewritten["first_ts"] or timestamp < rewritten["first_ts"]:
+                        rewritten["first_ts"] = timestamp
+                    if timestamp > rewritten["last_ts"]:
+                        rewritten["last_ts"] = timestamp
+                rewritten["rows"] += 1
+                rewritten["bytes"] += len(raw)
+        if not rewritten["rows"]:
+            tmp.unlink()
+            return self._drop_segment(segment)
+        os.replace(tmp, target)
+        self._obsolete.append(source)
+        if segment["compressed"]:
+            rewritten["compressed_bytes"] = target.stat().st_size
+        self._segments[self._segments.index(segment)] = rewritten
+        return segment["rows"] - rewritten["rows"]
+
+    def _compress_segment(self, segment: Dict[str, Any]) -> None:
+        source = self.root / segment["name"]
+        target = source.with_name(source.name + ".gz")
+        if source.exists():
+            tmp = target.with_name(target.name + ".tmp")
+            with source.open("rb") as f_in, gzip.open(
+                tmp, "wb", compresslevel=self.compress_level
+            ) as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.replace(tmp, target)
+            source.unlink()
+        segment["name"] = target.name
+        segment["compressed"] = True
+        if target.exists():
+            segment["compressed_bytes"] = target.stat().st_size
+
+    def _migrate_legacy(self, legacy_path: Path) -> None:
+        """把旧版单文件历史按日期切分进段文件
+
+        先在 ``.migrating`` 目录中切分出完整的段集合，再移入本目录并一次写出
+        新清单，中途崩溃时清单不变，下次启动从头迁移。清单同时记下已迁移的
+        旧文件，写出清单之后、删除旧文件之前崩溃也不会重复迁移。
+        """
+        stat = legacy_path.stat()
+        marker = {
+            "name": legacy_path.name,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        if self._migrated_legacy == marker:
+            legacy_path.unlink()
+            return
+
+        print(f"🔄 迁移旧版答题历史: {legacy_path}")
+        staging_root = self.root / ".migrating"
+        shutil.rmtree(staging_root, ignore_errors=True)
+        staging = HistoryStore(
+            staging_root,
+            max_segment_bytes=self.max_segment_bytes,
+            compress_level=self.compress_level,
+        )
+        batch: List[Tuple[str, str]] = []
+        with legacy_path.open("r", encoding="utf-8") as handle:
+            for raw in handle:
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    timestamp = json.loads(line).get("timestamp", "")
+                except json.JSONDecodeError:
+                    continue
+                batch.append((timestamp, line + "\n"))
+                if len(batch) >= 10_000:
+                    staging.append(batch)
+                    batch = []
+        staging.append(batch)
+        staging.compact()
+        staged = staging.segments()
+
+        with self._lock:
+            for segment in staged:
+                if not segment["compressed"]:
+                    staging._compress_segment(segment)
+                day, part = segment["day"], self._next_part(segment["day"])
+                name = f"{day}.jsonl.gz" if part == 0 else f"{day}.{part:03d}.jsonl.gz"
+                os.replace(staging_root / segment["name"], self.root / name)
+                self._segments.append({**segment, "name": name})
+            # 旧版记录排在同一天已有的段之前
+            self._segments.sort(key=lambda segment: segment["day"])
+            self._migrated_legacy = marker
+            self._write_manifest()
+        legacy_path.unlink()
+        shutil.rmtree(staging_root, ignore_errors=True)
+        print(f"✅ 旧版答题历史迁移完成（{len(staged)} 个分段）")
+
+    def _sync_manifest(self) -> None:
+        """磁盘上的清单被其他进程替换后重新加载"""
+        try:
+            stat = self.manifest_path.stat()
+        except FileNotFoundError:
+            if self._manifest_stamp is not None:
+                self._segments = []
+                self._manifest_stamp = None
+                self._epoch, self._generation = None, 0
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stamp != self._manifest_stamp:
+            self._segments = self._load_manifest()
+            self._manifest_stamp = stamp
+
+    def _load_manifest(self) -> List[Dict[str, Any]]:
+        self._epoch, self._generation = None, 0
+        self._migrated_legacy = None
+        if not self.manifest_path.exists():
+            return []
+        try:
+            payload = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            return self._rebuild_manifest()
+        if not isinstance(payload, dict):
+            return []
+        self._epoch = payload.get("epoch")
+        self._generation = int(payload.get("generation", 0))
+        self._migrated_legacy = payload.get("migrated_legacy")
+        segments = payload.get("segments", [])
+        return [segment for segment in segments if isinstance(segment, dict)]
+
+    def _rebuild_manifest(self) -> List[Dict[str, Any]]:
+        """清单损坏时扫描段文件重建"""
+        segments: List[Dict[str, Any]] = []
+
+        def order(path: Path) -> Tuple[str, int]:
+            part = path.name[11:14]
+            return path.name[:10], int(part) if part.isdigit() else 0
+
+        for path in sorted(self.root.glob("*.jsonl*"), key=order):
+            if path.name.endswith(".tmp"):
+                continue
+            compressed = path.suffix == ".gz"
+            segment = {
+                "name": path.name,
+                "day": path.name[:10],
+                "first_ts": "",
+                "last_ts": "",
+                "rows": 0,
+                "bytes": 0,
+                "compressed": compressed,
+            }
+            for record in self._iter_segment(segment):
+                timestamp = record.get("timestamp", "")
+                if timestamp and (
+                    not segment["first_ts"] or timestamp < segment["first_ts"]
+                ):
+                    segment["first_ts"] = timestamp
+                if timestamp and timestamp > segment["last_ts"]:
+                    segment["last_ts"] = timestamp
+                segment["rows"] += 1
+            segment["bytes"] = path.stat().st_size
+            segments.append(segment)
+        return segments
+
+    def _write_manifest(self) -> None:
+        if self._epoch is None:
+            self._epoch = uuid.uuid4().hex[:12]
+        self._generation += 1
+        payload = {
+            "version": MANIFEST_VERSION,
+            "epoch": self._epoch,
+            "generation": self._generation,
+            "segments": self._segments,
+        }
+        if self._migrated_legacy is not None:
+            payload["migrated_legacy"] = self._migrated_legacy
+        atomic_write_text(self.manifest_path, json.dumps(payload, ensure_ascii=False))
+        stat = self.manifest_path.stat()
+        self._manifest_stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _parse_lines(lines: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    """解析 JSONL 行，跳过空行与损坏的行（如崩溃时写了一半的最后一行）"""
+    for raw in lines:
+        line = raw.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            continue
+
+
+def _line_timestamp(line: bytes) -> str:
+    try:
+        return json.loads(line).get("timestamp") or ""
+    except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+        return ""
+
+
+def _offset_after(handle: IO[bytes], size: int, max_timestamp: str) -> int:
+    """在按时间排序的段中二分查找第一条时间戳大于上界的行的起始偏移"""
+    # 不变式：lo 之前开始的行都不晚于上界，hi 及之后开始的行都晚于上界
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if mid:
+            handle.seek(mid - 1)
+            handle.readline()  # 移到 mid 及之后的第一个行首
+        else:
+            handle.seek(0)
+        start = handle.tell()
+        if start >= hi:
+            hi = mid  # [mid, hi) 内没有行首
+            continue
+        line = handle.readline()
+        if _line_timestamp(line) <= max_timestamp:
+            lo = handle.tell()
+        else:
+            hi = start
+    return lo
+
+
+def _lines_backwards(
+    handle: IO[bytes], end: int, block_size: int = REVERSE_BLOCK_SIZE
+) -> Iterator[bytes]:
+    """从 ``end`` 处按块向前读取，倒序产出各行（按字节切分，不会截断多字节字符）"""
+    position = end
+    tail = b""
+    while position > 0:
+        step = min(block_size, position)
+        position -= step
+        handle.seek(position)
+        lines = (handle.read(step) + tail).split(b"\n")
+        tail = lines[0]  # 可能只是某行的后半部分，与前一块拼接
+        yield from reversed(lines[1:])
+    yield tail
+
+
+def _overlapping_groups(segments: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """把时间范围互相重叠的相邻段归为一组，组与组之间按时间先后排列"""
+    # 段 i 之后所有段的最早时间戳，用来判断能否在段 i 与 i+1 之间分组
+    later_first: List[str] = [""] * len(segments)
+    lowest = ""
+    for index in range(len(segments) - 1, -1, -1):
+        later_first[index] = lowest
+        first = segments[index]["first_ts"]
+        if first and (not lowest or first < lowest):
+            lowest = first
+    groups: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    highest = ""
+    for index, segment in enumerate(segments):
+        current.append(segment)
+        highest = max(highest, segment["last_ts"])
+        if not later_first[index] or highest <= later_first[index]:
+            groups.append(current)
+            current, highest = [], ""
+    return groups
+
+
+__all__ = ["HistoryStore", "to_timestamp_key"]
@@ -0,0 +1,273 @@
+"""答题记录批量写入器（组提交）
+
+``RecordManager.log_attempt`` 每次作答都会打开、追加、关闭一次 JSONL 文件。
+高并发下这会产生大量系统调用。本模块提供一个后台写入线程：记录先进入
+有界队列，再按批量大小或时间阈值合并成一次写入。写入器不关心记录的
+具体形式，整批记录原样交给 ``sink`` 处理。
+
+``sink`` 抛出异常时整批记录保留在写入线程中，每隔 ``retry_interval`` 秒
+（或收到 ``flush`` 时）连同新记录一起重试；此期间等待落盘的 ``flush``
+与 ALWAYS 策略下的提交会抛出 :class:`HistoryWriteError`。
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, List, Optional
+
+from .monitoring.metrics import AppMetrics
+
+
+class FsyncPolicy(Enum):
+    """落盘策略"""
+
+    NONE = "none"  # 交给操作系统决定何时刷盘
+    BATCH = "batch"  # 每批写入后 fsync 一次
+    ALWAYS = "always"  # 每批 fsync，且提交方阻塞直到记录落盘
+
+
+@dataclass
+class HistoryWriterConfig:
+    """批量写入参数"""
+
+    max_batch_size: int = 256
+    flush_interval: float = 0.2
+    max_queue_size: int = 10_000
+    fsync_policy: FsyncPolicy = FsyncPolicy.BATCH
+    retry_interval: float = 1.0
+
+    @classmethod
+    def from_env(cls) -> "HistoryWriterConfig":
+        """从环境变量读取配置，未设置的项使用默认值"""
+        defaults = cls()
+        policy_raw = os.environ.get("HISTORY_FSYNC_POLICY", defaults.fsync_policy.value)
+        try:
+            policy = FsyncPolicy(policy_raw.strip().lower())
+        except ValueError:
+            policy = defaults.fsync_policy
+        return cls(
+            max_batch_size=int(
+                os.environ.get("HISTORY_BATCH_SIZE", defaults.max_batch_size)
+            ),
+            flush_interval=float(
+                os.environ.get("HISTORY_FLUSH_INTERVAL", defaults.flush_interval)
+            ),
+            max_queue_size=int(
+                os.environ.get("HISTORY_QUEUE_SIZE", defaults.max_queue_size)
+            ),
+            fsync_policy=policy,
+        )
+
+
+BatchSink = Callable[[List[Any], bool], None]
+
+
+class HistoryWriteError(RuntimeError):
+    """写出批次失败，记录仍在等待重试"""
+
+
+class BatchedHistoryWriter:
+    """后台线程批量写入记录
+
+    ``submit`` 只把一条记录放入有界队列（队列满时阻塞，形成背压）；
+    后台线程凑满 ``max_batch_size`` 条或等待 ``flush_interval`` 秒后，
+    通过 ``sink`` 一次性写出整批记录。
+    """
+
+    _SENTINEL = object()
+    _FLUSH = object()
+
+    def __init__(
+        self,
+        sink: BatchSink,
+        config: Optional[HistoryWriterConfig] = None,
+    ) -> None:
+        self._sink = sink
+        self.config = config or HistoryWriterConfig()
+        self._queue: "queue.Queue[object]" = queue.Queue(
+            maxsize=max(1, self.config.max_queue_size)
+        )
+        self._cond = threading.Condition()
+        self._submit_lock = threading.Lock()
+        self._submitted_seq = 0
+        self._written_seq = 0
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._last_error: Optional[BaseException] = None
+        self._failures = 0
+
+    # Public API ----------------------------------------------------------------
+
+    def start(self) -> None:
+        """启动后台写入线程（幂等）"""
+        with self._cond:
+            if self._thread is not None or self._closed:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="history-writer", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.close)
+
+    def submit(self, record: Any) -> None:
+        """提交一条记录"""
+        self.submit_many([record])
+
+    def submit_many(self, records: List[Any]) -> None:
+        """按顺序提交多条记录（ALWAYS 策略下只等待一次落盘）"""
+        if not records:
+            return
+        if self._closed:
+            raise RuntimeError("历史写入器已关闭")
+        if self._thread is None:
+            self.start()
+        # 序号分配与入队在同一把锁内完成，保证队列顺序与序号一致
+        with self._submit_lock:
+            for record in records:
+                with self._cond:
+                    self._submitted_seq += 1
+                    seq = self._submitted_seq
+                self._queue.put((seq, record))
+        AppMetrics.history_queue_depth.set(self._queue.qsize())
+        if self.config.fsync_policy is FsyncPolicy.ALWAYS:
+            self._wait_for(seq)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待此前提交的记录全部写出，返回是否在超时前完成
+
+        写出失败时抛出 :class:`HistoryWriteError`，记录仍会在后台重试。
+        """
+        with self._submit_lock:
+            with self._cond:
+                target = self._submitted_seq
+                if self._written_seq >= target:
+                    return True
+            # 插入刷新标记，让后台线程不必等到时间阈值
+            self._queue.put(self._FLUSH)
+        return self._wait_for(target, timeout=timeout)
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """写出所有待写记录并停止后台线程"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is None:
+            return
+        atexit.unregister(self.close)
+        self._queue.put(self._SENTINEL)
+        thread.join(timeout=timeout)
+
+    def pending(self) -> int:
+        """尚未写出的记录数"""
+        with self._cond:
+            return self._submitted_seq - self._written_seq
+
+    # Internal helpers ---------------------------------------------------------
+
+    def _wait_for(self, seq: int, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            failures = self._failures
+            while self._written_seq < seq:
+                if self._failures != failures:
+                    raise HistoryWriteError(
+                        f"写出答题记录失败: {self._last_error}"
+                    ) from self._last_error
+                if self._thread is None or not self._thread.is_alive():
+                    return False
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining if remaining is not None else 0.5)
+        return True
+
+    def _run(self) -> None:
+        stopping = False
+        # 写出失败的批次，下一轮与新记录一起重试
+        retained: List[tuple] = []
+        while not stopping:
+            try:
+                item = self._queue.get(
+                    timeout=self.config.retry_interval if retained else None
+                )
+            except queue.Empty:
+                item = self._FLUSH
+            if item is self._SENTINEL:
+                break
+            batch = list(retained)
+            if item is not self._FLUSH:
+                batch.append(item)
+            if not batch:
+                continue
+            deadline = time.monotonic() + self.config.flush_interval
+            while item is not self._FLUSH and len(batch) < self.config.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = (
+                        self._queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if item is self._SENTINEL:
+                    stopping = True
+                    break
+                if item is self._FLUSH:
+                    break
+                batch.append(item)
+            written = self._write_batch(batch)  # type: ignore[arg-type]
+            retained = [] if written else batch
+
+        # 关闭时排空队列中剩余的记录（含尚未写出的失败批次）
+        leftovers = retained
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self._SENTINEL and item is not self._FLUSH:
+                leftovers.append(item)
+        if leftovers:
+            self._write_batch(leftovers)  # type: ignore[arg-type]
+
+        with self._cond:
+            self._cond.notify_all()
+
+    def _write_batch(self, batch: List[tuple]) -> bool:
+        """写出一批记录，失败时不推进已写序号，返回是否成功"""
+        started = time.perf_counter()
+        fsync = self.config.fsync_policy is not FsyncPolicy.NONE
+        try:
+            self._sink([record for _, record in batch], fsync)
+        except Exception as exc:
+            print(f"⚠️  批量写入答题记录失败（{len(batch)} 条待重试）: {exc}")
+            with self._cond:
+                self._last_error = exc
+                self._failures += 1
+                self._cond.notify_all()
+            return False
+        AppMetrics.history_flush_duration.observe(time.perf_counter() - started)
+        AppMetrics.history_records_written.inc(len(batch))
+        AppMetrics.history_queue_depth.set(self._queue.qsize())
+        with self._cond:
+            self._last_error = None
+            self._written_seq = batch[-1][0]
+            self._cond.notify_all()
+        return True
+
+
+__all__ = [
+    "BatchedHistoryWriter",
+    "FsyncPolicy",
+    "HistoryWriteError",
+    "HistoryWriterConfig",
+]
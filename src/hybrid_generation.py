@@ -0,0 +1,135 @@
+"""限时的混合出题：AI 与本地生成器并行
+
+AI 出题慢且耗时不稳定。这里在后台线程中流式接收 AI 题目，同时在当前线程
+运行本地生成器；到达截止时间（或 AI 已给出足够题目）后，取截至此刻 AI 已
+生成的题目，不足部分用本地题目补齐。出题的最坏耗时由 ``deadline`` 决定，
+而不是 AI 超时再加本地生成的时间。
+
+截止后仍未结束的 AI 请求在后台线程中被放弃：收到下一道题时即关闭连接。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from .question_models import Question
+
+DEFAULT_DEADLINE_SECONDS = 10.0
+
+
+def deadline_from_env() -> float:
+    """读取 ``GENERATION_DEADLINE_SECONDS``，未设置时使用默认值"""
+    raw = os.environ.get("GENERATION_DEADLINE_SECONDS", "").strip()
+    return float(raw) if raw else DEFAULT_DEADLINE_SECONDS
+
+
+@dataclass
+class HybridResult:
+    """混合出题结果"""
+
+    questions: List[Question]
+    ai_count: int
+    local_count: int
+    timed_out: bool
+    ai_error: Optional[str] = None
+
+
+class _AICollector:
+    """在后台线程中消费 AI 题目流，可随时读取已收到的题目"""
+
+    def __init__(self, stream: Callable[[], Iterable[Question]], count: int) -> None:
+        self._stream = stream
+        self._count = count
+        self._lock = threading.Lock()
+        self._questions: List[Question] = []
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.error: Optional[str] = None
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="ai-collector", daemon=True).start()
+
+    def take(self) -> List[Question]:
+        """放弃后续题目并返回已收到的题目"""
+        with self._lock:
+            self.cancelled.set()
+            return list(self._questions)
+
+    def _run(self) -> None:
+        iterator: Optional[Iterator[Question]] = None
+        try:
+            iterator = iter(self._stream())
+            for question in iterator:
+                with self._lock:
+                    if self.cancelled.is_set():
+                        break
+                    self._questions.append(question)
+                    if len(self._questions) >= self._count:
+                        break
+        except Exception as exc:  # AI 失败时由本地题目补齐
+            self.error = str(exc)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            self.finished.set()
+
+
+def generate_with_deadline(
+    *,
+    count: int,
+    deadline: float,
+    local: Callable[[], List[Question]],
+    ai_stream: Optional[Callable[[], Iterable[Question]]] = None,
+) -> HybridResult:
+    """在 ``deadline`` 秒内出 ``count`` 道题，AI 题目优先，本地题目补齐
+
+    ``ai_stream`` 返回逐题产出的可迭代对象（如 ``AIClient.stream_questions``）；
+    为 ``None`` 或 ``count`` 为 0（不限数量）时只使用本地生成器。
+    """
+    started = time.monotonic()
+    collector = None
+    if ai_stream is not None and count:
+        collector = _AICollector(ai_stream, count)
+        collector.start()
+
+    local_questions = local()
+
+    ai_questions: List[Question] = []
+    timed_out = False
+    ai_error = None
+    if collector is not None:
+        remaining = deadline - (time.monotonic() - started)
+        timed_out = not collector.finished.wait(timeout=max(0.0, remaining))
+        ai_questions = collector.take()
+        ai_error = collector.error
+
+    questions = list(ai_questions)
+    seen = {question.prompt for question in questions}
+    for question in local_questions:
+        if count and len(questions) >= count:
+            break
+        if question.prompt in seen:
+            continue
+        seen.add(question.prompt)
+        questions.append(question)
+
+    return HybridResult(
+        questions=questions,
+        ai_count=len(ai_questions),
+        local_count=len(questions) - len(ai_questions),
+        timed_out=timed_out,
+        ai_error=ai_error,
+    )
+
+
+__all__ = [
+    "DEFAULT_DEADLINE_SECONDS",
+    "HybridResult",
+    "deadline_from_env",
+    "generate_with_deadline",
+]
@@ -0,0 +1,290 @@
+"""后台任务（Job）队列
+
+耗时操作（如调用 AI 生成题目）不再占用请求线程：提交后立即返回任务 ID，
+由固定数量的工作线程执行，客户端轮询任务状态、进度与已产生的部分结果。
+
+- 每个任务一个文件 ``<job_id>.json``，状态变化时原子替换，多个 worker 进程
+  共享同一目录即可互相查询；
+- 排队中的任务数超过 ``max_queued`` 时拒绝提交（:class:`JobQueueFull`），
+  避免慢速的 AI 接口堆积请求；
+- 启动时接管属主进程已退出的排队中/执行中任务并重新执行；
+- 已结束的任务保留 ``retain_hours`` 小时后删除。
+
+任务处理函数按 ``kind`` 注册，签名为 ``handler(params, job) -> result``，
+通过 :class:`JobContext` 汇报进度与部分结果。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .utils.file_lock import FileLock, atomic_write_text, pid_alive
+
+Job = Dict[str, Any]
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_ACTIVE_STATES = (QUEUED, RUNNING)
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class JobQueueFull(RuntimeError):
+    """排队中的任务过多，暂不接受新任务"""
+
+
+@dataclass
+class JobQueueConfig:
+    """任务队列参数"""
+
+    workers: int = 2
+    max_queued: int = 32
+    retain_hours: float = 24.0
+
+    @classmethod
+    def from_env(cls) -> "JobQueueConfig":
+        """从环境变量读取配置，未设置的项使用默认值"""
+        defaults = cls()
+        return cls(
+            workers=max(1, int(os.environ.get("JOB_WORKERS", defaults.workers))),
+            max_queued=int(os.environ.get("JOB_MAX_QUEUED", defaults.max_queued)),
+            retain_hours=float(
+                os.environ.get("JOB_RETAIN_HOURS", defaults.retain_hours)
+            ),
+        )
+
+
+class JobContext:
+    """处理函数汇报进度与部分结果的句柄"""
+
+    def __init__(self, manager: "JobManager", job_id: str) -> None:
+        self._manager = manager
+        self.job_id = job_id
+
+    def report(self, completed: int, total: Optional[int] = None) -> None:
+        """更新进度（已完成数 / 总数）"""
+
+        def apply(job: Job) -> None:
+            job["progress"]["completed"] = completed
+            if total is not None:
+                job["progress"]["total"] = total
+
+        self._manager._update(self.job_id, apply)
+
+    def add_partial(self, items: List[Any]) -> None:
+        """追加已产生的部分结果（须可 JSON 序列化）"""
+        self._manager._update(
+            self.job_id, lambda job: job["partial_results"].extend(items)
+        )
+
+
+JobHandler = Callable[[Dict[str, Any], JobContext], Dict[str, Any]]
+
+
+class JobManager:
+    """有界工作线程池 + 文件持久化的任务队列"""
+
+    def __init__(
+        self,
+        root: Path,
+        handlers: Dict[str, JobHandler],
+        config: Optional[JobQueueConfig] = None,
+    ) -> None:
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.handlers = handlers
+        self.config = config or JobQueueConfig()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._queued = 0
+        self._workers: List[threading.Thread] = []
+
+    # Public API ----------------------------------------------------------------
+
+    def start(self) -> None:
+        """接管遗留任务并启动工作线程（幂等）"""
+        with self._lock:
+            if self._workers:
+                return
+            self._workers = [
+                threading.Thread(
+                    target=self._run, name=f"job-worker-{index}", daemon=True
+                )
+                for index in range(self.config.workers)
+            ]
+        self._recover()
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """停止工作线程（执行中的任务完成后退出，排队中的任务留待下次启动）"""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join(timeout=timeout)
+
+    def submit(self, kind: str, params: Dict[str, Any]) -> Job:
+        """登记任务并放入队列，返回任务快照"""
+        if kind not in self.handlers:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        if not self._workers:
+            self.start()
+        now = time.time()
+        job: Job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "params": params,
+            "state": QUEUED,
+            "progress": {"completed": 0, "total": None},
+            "partial_results": [],
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "owner": os.getpid(),
+        }
+        with self._lock:
+            if self._queued >= self.config.max_queued:
+                raise JobQueueFull(f"排队中的任务已达上限（{self.config.max_queued}）")
+            self._queued += 1
+            self._jobs[job["id"]] = job
+            self._save(job)
+            snapshot = self._snapshot(job)
+        self._queue.put(job["id"])
+        return snapshot
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """查询任务快照；其他 worker 进程的任务从文件读取"""
+        if not _JOB_ID.match(job_id or ""):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return self._snapshot(job)
+        job = self._read(self.root / f"{job_id}.json")
+        return self._snapshot(job) if job is not None else None
+
+    def queued(self) -> int:
+        with self._lock:
+            return self._queued
+
+    # Internal helpers ----------------------------------------------------------
+
+    def _run(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            self._execute(job_id)
+
+    def _execute(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            self._queued -= 1
+        self._update(job_id, lambda item: item.update(state=RUNNING))
+        try:
+            handler = self.handlers[job["kind"]]
+            result = handler(job["params"], JobContext(self, job_id))
+        except Exception as exc:
+            error = str(exc)
+            print(f"⚠️  任务 {job_id} 执行失败: {error}")
+            self._update(job_id, lambda item: item.update(state=FAILED, error=error))
+        else:
+            self._update(
+                job_id, lambda item: item.update(state=SUCCEEDED, result=result)
+            )
+        finally:
+            # 已结束的任务以文件为准，不再占用内存
+            with self._lock:
+                self._jobs.pop(job_id, None)
+
+    def _update(self, job_id: str, apply: Callable[[Job], None]) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            apply(job)
+            job["updated_at"] = time.time()
+            self._save(job)
+
+    def _recover(self) -> None:
+        """重新排队属主进程已退出的未完成任务，并删除过期的已结束任务"""
+        cutoff = time.time() - self.config.retain_hours * 3600
+        recovered = []
+        with FileLock(self.root / ".lock"):
+            for path in self.root.glob("*.json"):
+                job = self._read(path)
+                if job is None:
+                    continue
+                if job["state"] not in _ACTIVE_STATES:
+                    if job["updated_at"] < cutoff:
+                        path.unlink(missing_ok=True)
+                    continue
+                owner = job.get("owner")
+                if owner and owner != os.getpid() and pid_alive(owner):
+                    continue  # 其他存活的 worker 进程正在处理
+                # 执行中断的任务从头重新执行
+                job.update(
+                    state=QUEUED,
+                    owner=os.getpid(),
+                    progress={"completed": 0, "total": None},
+                    partial_results=[],
+                )
+                with self._lock:
+                    if job["id"] in self._jobs:
+                        continue  # 本进程刚提交的任务
+                    self._jobs[job["id"]] = job
+                    self._queued += 1
+                    self._save(job)
+                recovered.append(job)
+        recovered.sort(key=lambda item: item["created_at"])
+        for job in recovered:
+            self._queue.put(job["id"])
+        if recovered:
+            print(f"🔄 重新排队 {len(recovered)} 个未完成的任务")
+
+    def _save(self, job: Job) -> None:
+        """写出任务文件（调用方持有 ``_lock``）"""
+        atomic_write_text(
+            self.root / f"{job['id']}.json", json.dumps(job, ensure_ascii=False)
+        )
+
+    @staticmethod
+    def _read(path: Path) -> Optional[Job]:
+        try:
+            job = json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return job if isinstance(job, dict) and "state" in job else None
+
+    @staticmethod
+    def _snapshot(job: Job) -> Job:
+        snapshot = json.loads(json.dumps(job, ensure_ascii=False))
+        snapshot.pop("owner", None)
+        return snapshot
+
+
+__all__ = [
+    "FAILED",
+    "QUEUED",
+    "RUNNING",
+    "SUCCEEDED",
+    "JobContext",
+    "JobManager",
+    "JobQueueConfig",
+    "JobQueueFull",
+]
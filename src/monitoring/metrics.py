@@ -287,12 +287,28 @@ class AppMetrics:
         "Total AI call errors",
     )
 
+    question_generation_duration = metrics.histogram(
+        "question_generation_duration_seconds",
+        "Deadline-bounded question generation latency (AI raced against local)",
+        buckets=[0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0],
+    )
+
     # 会话
     active_sessions = metrics.gauge(
         "active_sessions",
         "Number of active sessions",
     )
 
+    session_memory_bytes = metrics.gauge(
+        "session_memory_bytes",
+        "Estimated bytes held by in-memory sessions",
+    )
+
+    session_evictions_total = metrics.counter(
+        "session_evictions_total",
+        "Sessions evicted by the session memory cap",
+    )
+
     session_duration = metrics.histogram(
         "session_duration_seconds",
         "Session duration",
@@ -310,6 +326,11 @@ class AppMetrics:
         "Total file upload errors",
     )
 
+    file_upload_dedup_total = metrics.counter(
+        "file_upload_dedup_total",
+        "Uploads whose content was already stored and reused",
+    )
+
     file_upload_size = metrics.histogram(
         "file_upload_size_bytes",
         "File upload size",
@@ -334,6 +355,56 @@ class AppMetrics:
         "Total wrong questions in database",
     )
 
+    # 答题记录批量写入
+    history_queue_depth = metrics.gauge(
+        "history_writer_queue_depth",
+        "Answer records waiting in the history writer queue",
+    )
+
+    history_flush_duration = metrics.histogram(
+        "history_writer_flush_duration_seconds",
+        "History writer batch flush latency",
+        buckets=[0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5],
+    )
+
+    history_records_written = metrics.counter(
+        "history_writer_records_total",
+        "Total answer records written by the history writer",
+    )
+
+    # 交卷与响应后的后台任务
+    submit_answer_duration = metrics.histogram(
+        "submit_answer_duration_seconds",
+        "Latency of /api/submit-answer until the grade is returned",
+        buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5],
+    )
+
+    background_tasks_pending = metrics.gauge(
+        "background_tasks_pending",
+        "Journaled background tasks not yet applied",
+    )
+
+    background_tasks_dead_lettered = metrics.counter(
+        "background_tasks_dead_lettered_total",
+        "Background tasks moved to the dead-letter file after failed retries",
+    )
+
+    # 条件请求与响应缓存
+    response_cache_hits = metrics.counter(
+        "response_cache_hits_total",
+        "Responses served from the versioned response cache",
+    )
+
+    response_cache_misses = metrics.counter(
+        "response_cache_misses_total",
+        "Responses recomputed because the cache had no entry for the data version",
+    )
+
+    not_modified_total = metrics.counter(
+        "http_not_modified_total",
+        "Conditional GETs answered with 304 Not Modified",
+    )
+
 
 class Timer:
     """计时器上下文管理器"""
@@ -0,0 +1,148 @@
+"""内容寻址的题目目录
+
+答题历史的每一行原先都内嵌完整题目（本地题的 ``explanation`` 就是整段知识
+原文），同样的文本会被重复写入成千上万次。题目目录按题目内容的哈希只保存
+一份题目数据，历史记录只引用哈希；读取时再按需联结，并用 LRU 缓存热点题目。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .utils.file_lock import FileLock
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+def question_ref(payload: Dict[str, Any]) -> str:
+    """计算题目内容的哈希引用"""
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:24]
+
+
+class QuestionCatalog:
+    """``data/question_catalog.jsonl``：每行 ``{"ref": ..., "question": {...}}``
+
+    内存中只保存 ``ref → 文件偏移`` 索引；题目内容在首次访问时按偏移读取，
+    并放入容量为 ``cache_size`` 的 LRU 缓存。
+    """
+
+    def __init__(self, path: Path, *, cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.path = path
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(path.with_name(path.name + ".lock"))
+        self._offsets: Dict[str, int] = {}
+        self._indexed_bytes = 0
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def put(self, payload: Dict[str, Any]) -> str:
+        """登记题目（内容已存在时不重复写入），返回引用"""
+        ref = question_ref(payload)
+        with self._lock:
+            if ref in self._offsets:
+                self._remember(ref, payload)
+                return ref
+        with self._file_lock, self._lock:
+            # 持有文件锁后再补扫文件尾部，避免多个进程重复写入同一题目
+            self._refresh_index()
+            if ref not in self._offsets:
+                line = json.dumps({"ref": ref, "question": payload}, ensure_ascii=False)
+                with self.path.open("ab") as handle:
+                    offset = handle.tell()
+                    handle.write((line + "\n").encode("utf-8"))
+                self._offsets[ref] = offset
+                self._indexed_bytes = max(
+                    self._indexed_bytes, offset + len(line.encode("utf-8")) + 1
+                )
+            self._remember(ref, payload)
+        return ref
+
+    def get(self, ref: str) -> Optional[Dict[str, Any]]:
+        """按引用读取题目内容"""
+        with self._lock:
+            cached = self._cache.get(ref)
+            if cached is not None:
+                self._cache.move_to_end(ref)
+                return cached
+            offset = self._offsets.get(ref)
+            if offset is None:
+                # 可能是其他进程新写入的题目
+                self._refresh_index()
+                offset = self._offsets.get(ref)
+                if offset is None:
+                    return None
+            payload = self._read_at(offset)
+            if payload is not None:
+                self._remember(ref, payload)
+            return payload
+
+    def clear(self) -> None:
+        """删除目录文件并清空索引"""
+        with self._file_lock, self._lock:
+            self.path.unlink(missing_ok=True)
+            self._offsets.clear()
+            self._cache.clear()
+            self._indexed_bytes = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh_index()
+            return len(self._offsets)
+
+    # Internal helpers ---------------------------------------------------------
+
+    def _remember(self, ref: str, payload: Dict[str, Any]) -> None:
+        self._cache[ref] = payload
+        self._cache.move_to_end(ref)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _refresh_index(self) -> None:
+        """从上次索引到的位置继续扫描文件尾部"""
+        if not self.path.exists():
+            if self._indexed_bytes:
+                self._offsets.clear()
+                self._cache.clear()
+                self._indexed_bytes = 0
+            return
+        size = self.path.stat().st_size
+        if size < self._indexed_bytes:
+            # 文件被截断或重建，重新索引
+            self._offsets.clear()
+            self._cache.clear()
+            self._indexed_bytes = 0
+        if size == self._indexed_bytes:
+            return
+        with self.path.open("rb") as handle:
+            handle.seek(self._indexed_bytes)
+            offset = self._indexed_bytes
+            for raw in handle:
+                if not raw.endswith(b"\n"):
+                    break  # 其他进程尚未写完的行
+                try:
+                    ref = json.loads(raw)["ref"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    ref = None
+                if ref and ref not in self._offsets:
+                    self._offsets[ref] = offset
+                offset += len(raw)
+            self._indexed_bytes = offset
+
+    def _read_at(self, offset: int) -> Optional[Dict[str, Any]]:
+        try:
+            with self.path.open("rb") as handle:
+                handle.seek(offset)
+                record = json.loads(handle.readline())
+        except (OSError, json.JSONDecodeError):
+            return None
+        question = record.get("question") if isinstance(record, dict) else None
+        return question if isinstance(question, dict) else None
+
+
+__all__ = ["QuestionCatalog", "question_ref"]
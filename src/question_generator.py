@@ -76,6 +76,7 @@ class QuestionGenerator:
                     correct_options=[correct_index],
                     answer_text=correct_sentence,
                     explanation=entry.raw_text,
+                    component=entry.component,
                 )
             )
         return questions
@@ -113,6 +114,7 @@ class QuestionGenerator:
                     correct_options=correct_indices,
                     answer_text="；".join(correct_sentences),
                     explanation=entry.raw_text,
+                    component=entry.component,
                 )
             )
         return questions
@@ -132,6 +134,7 @@ class QuestionGenerator:
                         prompt=f"填空题：{cloze_sentence}",
                         answer_text=answer,
                         explanation=sentence,
+                        component=entry.component,
                     )
                 )
                 break
@@ -151,6 +154,7 @@ class QuestionGenerator:
                     answer_text=reference,
                     explanation=entry.raw_text,
                     keywords=keywords,
+                    component=entry.component,
                 )
             )
         return questions
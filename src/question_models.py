@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass, field
 from enum import Enum, auto
 from typing import List, Optional
@@ -22,6 +23,7 @@ class Question:
     answer_text: Optional[str] = None
     explanation: Optional[str] = None
     keywords: List[str] = field(default_factory=list)
+    component: Optional[str] = None
 
     def is_multiple_choice(self) -> bool:
         return self.question_type in {
@@ -30,4 +32,23 @@ class Question:
         }
 
 
-__all__ = ["Question", "QuestionType"]
+UNCATEGORIZED_COMPONENT = "未分类"
+
+_LOCAL_IDENTIFIER = re.compile(r"^(?P<component>.+)-(?:SC|MC|CZ|QA)-\d+$")
+_AI_IDENTIFIER = re.compile(r"^AI-(?P<component>.+)-\d+$")
+
+
+def infer_component(identifier: str) -> str:
+    """从旧数据的题目编号推断知识点组件
+
+    新题目显式携带 ``component``；只有未记录该字段的旧数据才需要解析
+    ``{组件}-SC-1`` 或 ``AI-{组件}-1`` 形式的编号。
+    """
+    for pattern in (_AI_IDENTIFIER, _LOCAL_IDENTIFIER):
+        match = pattern.match(identifier or "")
+        if match:
+            return match.group("component")
+    return UNCATEGORIZED_COMPONENT
+
+
+__all__ = ["Question", "QuestionType", "UNCATEGORIZED_COMPONENT", "infer_component"]
@@ -1,18 +1,40 @@
 from __future__ import annotations
 
+import hashlib
+import heapq
 import json
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from .question_models import Question, QuestionType
+from .history_scanner import HistoryScanner
+from .history_store import HistoryStore, to_timestamp_key
+from .history_writer import BatchedHistoryWriter, FsyncPolicy, HistoryWriterConfig
+from .question_catalog import QuestionCatalog
+from .question_models import Question, QuestionType, infer_component
+from .review_scheduler import (
+    DueQueue,
+    apply_lapse,
+    apply_success,
+    is_graduated,
+    review_state_of,
+)
+from .search_index import SearchIndex
+from .task_journal import DurableTaskQueue
+from .utils.cursor import decode_cursor, encode_cursor
+from .utils.file_lock import FileLock, atomic_write_text
 
 
 def _ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
+_NOT_LOADED = object()
+# 每道错题记住最近应用过的作答编号，重放任务时据此跳过
+_APPLIED_ATTEMPTS_KEPT = 32
+
+
 def _now_iso() -> str:
     return datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
@@ -33,6 +55,7 @@ def _question_to_dict(question: Question) -> Dict[str, Any]:
         "answer_text": question.answer_text,
         "explanation": question.explanation,
         "keywords": question.keywords,
+        "component": question.component,
     }
 
 
@@ -47,17 +70,161 @@ def _dict_to_question(payload: Dict[str, Any]) -> Question:
         answer_text=payload.get("answer_text"),
         explanation=payload.get("explanation"),
         keywords=list(payload.get("keywords", []) or []),
+        component=payload.get("component"),
     )
 
 
+def _question_component(payload: Dict[str, Any]) -> str:
+    """题目所属知识点组件：优先使用显式字段，旧数据再从编号推断"""
+    return payload.get("component") or infer_component(payload.get("identifier", ""))
+
+
+def _wrong_entry_component(entry: Dict[str, Any]) -> str:
+    return entry.get("component") or _question_component(entry.get("question", {}))
+
+
+def _wrong_entry_type(entry: Dict[str, Any]) -> Optional[str]:
+    return entry.get("question", {}).get("question_type")
+
+
+def history_question_type(item: Dict[str, Any]) -> Optional[str]:
+    """历史记录的题型（兼容内嵌完整题目的旧格式）"""
+    q_type = item.get("question_type")
+    if q_type:
+        return q_type
+    return item.get("question", {}).get("question_type")
+
+
+def history_entry_id(item: Dict[str, Any]) -> str:
+    """历史记录的唯一标识（旧记录没有 id 时按内容生成）"""
+    entry_id = item.get("id")
+    if entry_id:
+        return str(entry_id)
+    canonical = json.dumps(item, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _history_matches(
+    item: Dict[str, Any],
+    *,
+    session_id: str | None = None,
+    question_type: QuestionType | None = None,
+    is_correct: bool | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+) -> bool:
+    if session_id and item.get("session_id") != session_id:
+        return False
+    if question_type and history_question_type(item) != question_type.name:
+        return False
+    if is_correct is not None and item.get("is_correct") != is_correct:
+        return False
+    if (date_from or date_to) and (timestamp := item.get("timestamp")):
+        try:
+            dt = _parse_iso(timestamp)
+        except ValueError:
+            return False
+        if date_from and dt < date_from:
+            return False
+        if date_to and dt > date_to:
+            return False
+    return True
+
+
+def _page_info(total: int, page: int, page_size: int) -> Dict[str, int]:
+    return {
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": (total + page_size - 1) // page_size if total > 0 else 0,
+    }
+
+
+def _attempt_applied(entry: Optional[Dict[str, Any]], attempt_id: Any) -> bool:
+    """该作答结果是否已应用到错题上（旧任务没有作答编号，总是应用）"""
+    return bool(attempt_id) and attempt_id in (entry or {}).get("applied_attempts", ())
+
+
+def _remember_attempt(entry: Dict[str, Any], attempt_id: Any) -> None:
+    if attempt_id:
+        applied = entry.setdefault("applied_attempts", [])
+        applied.append(attempt_id)
+        del applied[:-_APPLIED_ATTEMPTS_KEPT]
+
+
+def _count_wrong_entry(
+    stats: Dict[str, Any], entry: Dict[str, Any], delta: int
+) -> None:
+    """按题型、组件增减一条错题的计数，减到 0 的键直接删除"""
+    stats["total"] = stats.get("total", 0) + delta
+    for field, key in (
+        ("by_type", _wrong_entry_type(entry)),
+        ("by_component", _wrong_entry_component(entry)),
+    ):
+        counts = stats.setdefault(field, {})
+        value = counts.get(key, 0) + delta
+        if value > 0:
+            counts[key] = value
+        else:
+            counts.pop(key, None)
+
+
 class RecordManager:
-    """Manage answer history and wrong-question persistence."""
+    """Manage answer history and wrong-question persistence.
+
+    When ``writer_config`` is given, answer records are appended by a
+    background :class:`BatchedHistoryWriter` instead of one open/write/close
+    per attempt. Readers flush pending records first, so queries always see
+    every attempt logged before them.
 
-    def __init__(self, data_dir: Path | None = None) -> None:
+    With ``defer_wrong_updates`` the wrong-question read-modify-write that
+    follows each answer is journaled and applied by a background
+    :class:`DurableTaskQueue`; wrong-question readers settle pending updates
+    first, and unfinished updates are replayed after a crash.
+    """
+
+    def __init__(
+        self,
+        data_dir: Path | None = None,
+        *,
+        writer_config: HistoryWriterConfig | None = None,
+        defer_wrong_updates: bool = False,
+    ) -> None:
         self.data_dir = data_dir or Path("data")
         _ensure_dir(self.data_dir)
-        self.history_path = self.data_dir / "answer_history.jsonl"
+        self.history_store = HistoryStore(
+            self.data_dir / "history",
+            legacy_path=self.data_dir / "answer_history.jsonl",
+        )
+        self.question_catalog = QuestionCatalog(
+            self.data_dir / "question_catalog.jsonl"
+        )
+        # 全文检索索引随历史批次增量更新
+        self.search_index = SearchIndex(self.data_dir / "search_index.db")
         self.wrong_path = self.data_dir / "wrong_questions.json"
+        # 错题计数（按题型、按组件）随增删增量维护，统计接口无需重读错题本
+        self.wrong_stats_path = self.data_dir / "wrong_questions_stats.json"
+        # 间隔复习的到期堆，随错题本的文件戳失效后重建
+        self._due_queue = DueQueue()
+        self._due_stamp: Any = _NOT_LOADED
+        # 错题本的读-改-写在多个进程间互斥
+        self._wrong_lock = FileLock(self.data_dir / "wrong_questions.json.lock")
+        self._writer: Optional[BatchedHistoryWriter] = None
+        if writer_config is not None:
+            self._writer = BatchedHistoryWriter(
+                self._append_history_lines, writer_config
+            )
+            self._writer.start()
+        self._outcomes: Optional[DurableTaskQueue] = None
+        if defer_wrong_updates:
+            self._outcomes = DurableTaskQueue(
+                self.data_dir / "journal",
+                {"answer_outcome": self._apply_answer_outcomes},
+                # 与答题记录一致：ALWAYS 时每个任务落盘后才返回
+                fsync=writer_config is not None
+                and writer_config.fsync_policy is FsyncPolicy.ALWAYS,
+            )
+            self._outcomes.start()
 
     def new_session_id(self) -> str:
         return uuid.uuid4().hex
@@ -73,20 +240,87 @@ class RecordManager:
         session_context: Optional[Dict[str, Any]] = None,
         extra: Optional[Dict[str, Any]] = None,
     ) -> None:
-        entry: Dict[str, Any] = {
-            "timestamp": _now_iso(),
-            "session_id": session_id,
-            "question": _question_to_dict(question),
-            "user_answer": user_answer,
-            "is_correct": is_correct,
-            "plain_explanation": plain_explanation,
-        }
-        if session_context:
-            entry["session_context"] = session_context
-        if extra:
-            entry["extra"] = extra
-        with self.history_path.open("a", encoding="utf-8") as handle:
-            handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.log_attempts(
+            [
+                {
+                    "session_id": session_id,
+                    "question": question,
+                    "user_answer": user_answer,
+                    "is_correct": is_correct,
+                    "plain_explanation": plain_explanation,
+                    "session_context": session_context,
+                    "extra": extra,
+                }
+            ]
+        )
+
+    def log_attempts(self, attempts: Iterable[Dict[str, Any]]) -> None:
+        """一次提交多条作答记录，字段与 :meth:`log_attempt` 的参数相同"""
+        records = [self._attempt_record(**attempt) for attempt in attempts]
+        if not records:
+            return
+        if self._writer is not None:
+            self._writer.submit_many(records)
+        else:
+            self._append_history_lines(records, False)
+
+    def record_answer_outcome(
+        self, question: Question, *, is_correct: bool, plain_explanation: str
+    ) -> None:
+        """按作答结果更新错题本：答对推进复习间隔，答错登记错题
+
+        启用 ``defer_wrong_updates`` 时只写入任务日志，由后台线程完成更新。
+        """
+        self.record_answer_outcomes(
+            [
+                {
+                    "question": question,
+                    "is_correct": is_correct,
+                    "plain_explanation": plain_explanation,
+                }
+            ]
+        )
+
+    def record_answer_outcomes(self, outcomes: Iterable[Dict[str, Any]]) -> None:
+        """一次登记多道题的作答结果，错题本只读写一次
+
+        每个结果带有作答编号（可由 ``attempt_id`` 指定），任务重放时已应用的
+        结果会被跳过，错题次数与复习间隔不会重复推进。
+        """
+        payloads = [
+            {
+                "attempt_id": outcome.get("attempt_id") or uuid.uuid4().hex,
+                "question": _question_to_dict(outcome["question"]),
+                "is_correct": outcome["is_correct"],
+                "plain_explanation": outcome["plain_explanation"],
+            }
+            for outcome in outcomes
+        ]
+        if not payloads:
+            return
+        if self._outcomes is not None:
+            self._outcomes.submit_many("answer_outcome", payloads)
+        else:
+            self._apply_answer_outcomes(payloads)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """等待后台写入器写出所有待写记录、错题更新全部完成
+
+        历史写出失败时抛出 :class:`~src.history_writer.HistoryWriteError`。
+        """
+        flushed = True
+        if self._writer is not None:
+            flushed = self._writer.flush(timeout=timeout)
+        if self._outcomes is not None:
+            flushed = self._outcomes.flush(timeout=timeout) and flushed
+        return flushed
+
+    def close(self) -> None:
+        """写出待写记录并停止后台写入器"""
+        if self._writer is not None:
+            self._writer.close()
+        if self._outcomes is not None:
+            self._outcomes.close()
 
     # Answer history management ------------------------------------------------
 
@@ -100,31 +334,30 @@ class RecordManager:
         is_correct: bool | None = None,
         date_from: datetime | None = None,
         date_to: datetime | None = None,
+        cursor: str | None = None,
+        include_total: bool = True,
     ) -> Dict[str, Any]:
-        """分页查询作答历史记录"""
-        entries = list(self._iter_answer_history())
-        entries.sort(key=lambda item: item.get("timestamp", ""), reverse=True)
+        """分页查询作答历史记录
 
-        filtered: List[Dict[str, Any]] = []
-        for item in entries:
-            if session_id and item.get("session_id") != session_id:
-                continue
-            if question_type:
-                q_type = item.get("question", {}).get("question_type")
-                if q_type != question_type.name:
-                    continue
-            if is_correct is not None and item.get("is_correct") != is_correct:
-                continue
-            if (date_from or date_to) and (timestamp := item.get("timestamp")):
-                try:
-                    dt = _parse_iso(timestamp)
-                except ValueError:
-                    continue
-                if date_from and dt < date_from:
-                    continue
-                if date_to and dt > date_to:
-                    continue
-            filtered.append(item)
+        传入 ``cursor``（首页传空字符串）时改用游标分页：从上一页最后一条
+        记录的 (timestamp, id) 位置继续倒序读取，凑满一页即停止，
+        ``include_total`` 为 False 时不再统计总数。
+        """
+        filters = {
+            "session_id": session_id,
+            "question_type": question_type,
+            "is_correct": is_correct,
+            "date_from": date_from,
+            "date_to": date_to,
+        }
+        if cursor is not None:
+            return self._query_answer_history_by_cursor(
+                cursor, page_size=page_size, include_total=include_total, **filters
+            )
+
+        entries = list(self._iter_answer_history(date_from=date_from, date_to=date_to))
+        entries.sort(key=lambda item: item.get("timestamp", ""), reverse=True)
+        filtered = [item for item in entries if _history_matches(item, **filters)]
 
         total = len(filtered)
         total_pages = (total + page_size - 1) // page_size if total > 0 else 0
@@ -133,7 +366,7 @@ class RecordManager:
         page_entries = filtered[start:end] if start < total else []
 
         return {
-            "entries": page_entries,
+            "entries": [self._join_question(item) for item in page_entries],
             "pagination": {
                 "total": total,
                 "page": page,
@@ -142,6 +375,217 @@ class RecordManager:
             },
         }
 
+    def iter_answer_history(
+        self,
+        *,
+        session_id: str | None = None,
+        question_type: QuestionType | None = None,
+        is_correct: bool | None = None,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """按时间正序逐条产出符合条件的作答记录（补全题目与记录 ID）
+
+        逐段流式读取，不在内存中累积记录，供导出等全量遍历使用。
+        """
+        filters = {
+            "session_id": session_id,
+            "question_type": question_type,
+            "is_correct": is_correct,
+            "date_from": date_from,
+            "date_to": date_to,
+        }
+        for item in self._iter_answer_history(date_from=date_from, date_to=date_to):
+            if not _history_matches(item, **filters):
+                continue
+            joined = self._join_question(item)
+            if "id" not in joined:
+                joined = {"id": history_entry_id(item), **joined}
+            yield joined
+
+    def count_answer_history(self, **filters: Any) -> int:
+        """统计符合条件的作答记录数（无筛选条件时直接读取分段清单）"""
+        if not any(value is not None for value in filters.values()):
+            self.flush()
+            return self.history_store.total_rows()
+        records = self._iter_answer_history(
+            date_from=filters.get("date_from"), date_to=filters.get("date_to")
+        )
+        return sum(1 for item in records if _history_matches(item, **filters))
+
+    def scan_answer_history(
+        self,
+        mapper: Callable[[Iterator[Dict[str, Any]]], Any],
+        reducer: Callable[[Any, Any], Any],
+        initial: Any,
+        *,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        workers: int | None = None,
+    ) -> Any:
+        """用 :class:`HistoryScanner` 对全部历史做并行 map/reduce"""
+        self.flush()
+        scanner = HistoryScanner(self.history_store, workers=workers)
+        return scanner.map_reduce(
+            mapper, reducer, initial, date_from=date_from, date_to=date_to
+        )
+
+    def index_questions(self, questions: Iterable[Question]) -> None:
+        """把题库中的题目登记到题目目录与全文检索索引"""
+        pending = []
+        for question in questions:
+            payload = _question_to_dict(question)
+            pending.append((self.question_catalog.put(payload), payload))
+        self.search_index.add_questions(pending)
+
+    def search_answer_history(
+        self,
+        query: str,
+        *,
+        page: int = 1,
+        page_size: int = 20,
+        cursor: str | None = None,
+        include_total: bool = True,
+    ) -> Dict[str, Any]:
+        """全文检索作答记录（题干、解析、用户答案、判分说明）
+
+        传入 ``cursor``（首页传空字符串）时改用游标分页：从上一页最后一条
+        的 (相关度, timestamp, id) 位置继续，``include_total`` 为 False 时
+        不再统计命中总数。
+        """
+        self.flush()
+        if cursor is None:
+            results, total = self.search_index.search_attempts(
+                query, page=page, page_size=page_size
+            )
+            return {
+                "entries": [self._join_question(item) for item in results],
+                "pagination": _page_info(total or 0, page, page_size),
+            }
+
+        after = None
+        if cursor:
+            position = decode_cursor(cursor)
+            if position.get("q") != query:
+                raise ValueError("分页游标与检索词不匹配")
+            try:
+                after = (
+                    float(position["score"]),
+                    str(position["ts"]),
+                    str(position["id"]),
+                )
+            except (KeyError, TypeError, ValueError) as exc:
+                raise ValueError("无效的分页游标") from exc
+        # 多取一条判断是否还有下一页
+        results, total = self.search_index.search_attempts(
+            query, page_size=page_size + 1, after=after, include_total=include_total
+        )
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        next_cursor = None
+        if has_more:
+            last = results[-1]
+            next_cursor = encode_cursor(
+                {
+                    "q": query,
+                    "score": last["score"],
+                    "ts": last["timestamp"],
+                    "id": last["id"],
+                }
+            )
+        pagination: Dict[str, Any] = {
+            "page_size": page_size,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        }
+        if include_total:
+            pagination["total"] = total
+        return {
+            "entries": [self._join_question(item) for item in results],
+            "pagination": pagination,
+        }
+
+    def search_questions(
+        self, query: str, *, page: int = 1, page_size: int = 20
+    ) -> Dict[str, Any]:
+        """全文检索题库"""
+        self.flush()
+        results, total = self.search_index.search_questions(
+            query, page=page, page_size=page_size
+        )
+        questions = []
+        for item in results:
+            payload = self.question_catalog.get(item["question_ref"])
+            questions.append({**item, "question": payload})
+        return {
+            "questions": questions,
+            "pagination": _page_info(total, page, page_size),
+        }
+
+    def rebuild_search_index(self, *, batch_size: int = 1000) -> int:
+        """从全部历史重建全文检索索引，返回登记的作答数"""
+        self.search_index.clear()
+        indexed = 0
+        attempts: List[Dict[str, Any]] = []
+        questions: List[Tuple[str, Dict[str, Any]]] = []
+        for item in self._iter_answer_history():
+            document = dict(item)
+            document["id"] = history_entry_id(item)
+            document["question_type"] = history_question_type(item)
+            embedded = item.get("question")
+            if isinstance(embedded, dict):
+                # 旧版记录内嵌题目：登记到题目目录后按引用检索
+                document["question_ref"] = self.question_catalog.put(embedded)
+                questions.append((document["question_ref"], embedded))
+            elif item.get("question_ref"):
+                payload = self.question_catalog.get(item["question_ref"])
+                if payload is not None:
+                    questions.append((item["question_ref"], payload))
+            attempts.append(document)
+            if len(attempts) >= batch_size:
+                self.search_index.add_attempts(attempts, questions)
+                indexed += len(attempts)
+                attempts, questions = [], []
+        self.search_index.add_attempts(attempts, questions)
+        return indexed + len(attempts)
+
+    def purge_answer_history(
+        self,
+        *,
+        before: datetime | None = None,
+        max_rows: int | None = None,
+    ) -> int:
+        """按保留策略删除旧的作答历史（含检索索引），返回删除的行数"""
+        self.flush()
+        removed = self.history_store.purge(
+            before=to_timestamp_key(before) if before else None, max_rows=max_rows
+        )
+        if removed:
+            oldest = min(
+                (s["first_ts"] for s in self.history_store.segments() if s["first_ts"]),
+                default=None,
+            )
+            if oldest:
+                self.search_index.purge_before(oldest)
+            else:
+                self.search_index.clear()
+        return removed
+
+    def ensure_search_index(self) -> int:
+        """检索索引为空而历史不为空时（升级后首次启动）补建索引"""
+        if not self.search_index.available or self.search_index.attempt_count():
+            return 0
+        if not self.count_answer_history():
+            return 0
+        return self.rebuild_search_index()
+
+    def clear_answer_history(self) -> None:
+        """删除全部作答历史"""
+        self.flush()
+        self.history_store.clear()
+        self.search_index.clear()
+        self.question_catalog.clear()
+
     def list_answer_history_sessions(self, *, limit: int = 20) -> List[Dict[str, Any]]:
         """汇总最近的作答会话"""
         entries = list(self._iter_answer_history())
@@ -188,9 +632,27 @@ class RecordManager:
             entry["accuracy"] = (correct / total_answers) if total_answers else 0.0
         return ordered[:limit]
 
+    def answer_history_generation(self) -> str:
+        """作答历史的数据版本，历史有任何写入后改变（供接口生成 ETag）"""
+        self.flush()
+        return self.history_store.generation()
+
     # Wrong question management -------------------------------------------------
 
+    def wrong_questions_generation(self) -> str:
+        """错题本的数据版本：由错题本文件的 inode、修改时间与大小得出
+
+        错题本总是原子替换写入，每次写入都会得到新的文件戳。
+        """
+        self._settle_wrong_updates()
+        try:
+            stat = self.wrong_path.stat()
+        except FileNotFoundError:
+            return "0"
+        return f"{stat.st_ino}.{stat.st_mtime_ns}.{stat.st_size}"
+
     def load_wrong_questions(self) -> List[Question]:
+        self._settle_wrong_updates()
         entries = self._load_wrong_payloads()
         questions: List[Question] = []
         for item in entries:
@@ -203,20 +665,80 @@ class RecordManager:
     def upsert_wrong_question(
         self, question: Question, *, last_plain_explanation: str
     ) -> None:
-        entries = self._load_wrong_payloads(as_dict=True)
-        record = {
-            "question": _question_to_dict(question),
-            "last_plain_explanation": last_plain_explanation,
-            "last_wrong_at": _now_iso(),
-        }
-        entries[question.identifier] = record
-        self._write_wrong_payloads(entries.values())
+        """登记一次答错：新增错题，或对已有错题累加次数并重置复习间隔"""
+        self._settle_wrong_updates()
+        with self._wrong_lock:
+            in_sync = self._due_queue_in_sync()
+            stats = self._load_wrong_stats()
+            entries = self._load_wrong_payloads(as_dict=True)
+            self._lapse_entry(
+                entries,
+                stats,
+                _question_to_dict(question),
+                last_plain_explanation,
+                in_sync=in_sync,
+            )
+            self._write_wrong_payloads(entries.values())
+            self._write_wrong_stats(stats)
+            self._mark_due_queue(entries, in_sync)
 
     def remove_wrong_question(self, identifier: str) -> None:
-        entries = self._load_wrong_payloads(as_dict=True)
-        if identifier in entries:
-            entries.pop(identifier)
+        self._settle_wrong_updates()
+        with self._wrong_lock:
+            entries = self._load_wrong_payloads(as_dict=True)
+            if identifier in entries:
+                in_sync = self._due_queue_in_sync()
+                stats = self._load_wrong_stats()
+                _count_wrong_entry(stats, entries.pop(identifier), -1)
+                self._write_wrong_payloads(entries.values())
+                self._write_wrong_stats(stats)
+                if in_sync:
+                    self._due_queue.discard(identifier)
+                self._mark_due_queue(entries, in_sync)
+
+    def record_wrong_question_review(self, identifier: str) -> bool:
+        """登记一次错题答对：按 SM-2 延长复习间隔
+
+        间隔达到掌握阈值时移出错题本并返回 True；题目不在错题本中时不做处理。
+        """
+        self._settle_wrong_updates()
+        with self._wrong_lock:
+            entries = self._load_wrong_payloads(as_dict=True)
+            if identifier not in entries:
+                return False
+            in_sync = self._due_queue_in_sync()
+            # 未移出时计数不变，写回只为让计数文件跟上错题本的新文件戳
+            stats = self._load_wrong_stats()
+            graduated = self._review_entry(entries, stats, identifier, in_sync=in_sync)
             self._write_wrong_payloads(entries.values())
+            self._write_wrong_stats(stats)
+            self._mark_due_queue(entries, in_sync)
+            return graduated
+
+    def select_due_wrong_questions(
+        self,
+        count: int,
+        *,
+        question_types: Optional[Iterable[QuestionType]] = None,
+    ) -> List[Question]:
+        """按到期先后取出 ``count`` 道错题，用于错题复练"""
+        type_names = {qt.name for qt in question_types} if question_types else None
+        self._settle_wrong_updates()
+
+        def accept(entry: Dict[str, Any]) -> bool:
+            return type_names is None or _wrong_entry_type(entry) in type_names
+
+        with self._wrong_lock:
+            if not self._due_queue_in_sync():
+                self._mark_due_queue(self._load_wrong_payloads(as_dict=True), False)
+            selected = self._due_queue.most_due(count, accept)
+        questions: List[Question] = []
+        for entry in selected:
+            try:
+                questions.append(_dict_to_question(entry["question"]))
+            except KeyError:
+                continue
+        return questions
 
     def get_wrong_questions_paginated(
         self,
@@ -225,8 +747,15 @@ class RecordManager:
         question_type: Optional[QuestionType] = None,
         sort_by: str = "last_wrong_at",
         order: str = "desc",
+        cursor: Optional[str] = None,
+        include_total: bool = True,
     ) -> Dict[str, Any]:
-        """获取分页的错题列表"""
+        """获取分页的错题列表
+
+        传入 ``cursor``（首页传空字符串）时使用游标分页：只挑出排在游标
+        之后的前 ``page_size`` 条，不再对整个列表排序与切片。
+        """
+        self._settle_wrong_updates()
         entries = self._load_wrong_payloads()
 
         # 筛选题型
@@ -237,6 +766,16 @@ class RecordManager:
                 if e.get("question", {}).get("question_type") == question_type.name
             ]
 
+        if cursor is not None:
+            return self._wrong_questions_by_cursor(
+                entries,
+                cursor,
+                page_size=page_size,
+                sort_by=sort_by,
+                order=order,
+                include_total=include_total,
+            )
+
         # 排序
         reverse = order == "desc"
         if sort_by == "last_wrong_at":
@@ -263,48 +802,228 @@ class RecordManager:
             },
         }
 
-    def get_wrong_question_stats(self) -> Dict[str, Any]:
-        """获取错题统计信息"""
-        entries = self._load_wrong_payloads()
+    def _wrong_questions_by_cursor(
+        self,
+        entries: List[Dict[str, Any]],
+        cursor: str,
+        *,
+        page_size: int,
+        sort_by: str,
+        order: str,
+        include_total: bool,
+    ) -> Dict[str, Any]:
+        def sort_key(entry: Dict[str, Any]) -> Tuple[str, str]:
+            identifier = entry.get("question", {}).get("identifier", "")
+            if sort_by == "last_wrong_at":
+                return entry.get("last_wrong_at", ""), identifier
+            return identifier, identifier
 
-        by_type = {}
-        for entry in entries:
-            q_type = entry.get("question", {}).get("question_type")
-            by_type[q_type] = by_type.get(q_type, 0) + 1
+        descending = order == "desc"
+        candidates = entries
+        if cursor:
+            position = decode_cursor(cursor)
+            if position.get("sort_by") != sort_by or position.get("order") != order:
+                raise ValueError("分页游标与排序参数不匹配")
+            last_key = tuple(position.get("key", []))
+            if descending:
+                candidates = [e for e in entries if sort_key(e) < last_key]
+            else:
+                candidates = [e for e in entries if sort_key(e) > last_key]
 
-        # 提取知识点（从 identifier 中提取）
-        topics = {}
-        for entry in entries:
-            identifier = entry.get("question", {}).get("identifier", "")
-            topic = identifier.split("-")[0] if "-" in identifier else "未分类"
-            topics[topic] = topics.get(topic, 0) + 1
+        select = heapq.nlargest if descending else heapq.nsmallest
+        window = select(page_size + 1, candidates, key=sort_key)
+        has_more = len(window) > page_size
+        page_entries = window[:page_size]
+
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor(
+                {
+                    "key": list(sort_key(page_entries[-1])),
+                    "sort_by": sort_by,
+                    "order": order,
+                }
+            )
+        pagination: Dict[str, Any] = {
+            "page_size": page_size,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        }
+        if include_total:
+            pagination["total"] = len(entries)
+        return {"questions": page_entries, "pagination": pagination}
+
+    def get_wrong_question_stats(self) -> Dict[str, Any]:
+        """获取错题统计信息（读取增量维护的计数）"""
+        self._settle_wrong_updates()
+        stats = self._read_wrong_stats()
+        if stats is None:
+            # 错题本被外部修改或来自旧版本，重建一次计数
+            with self._wrong_lock:
+                stats = self._load_wrong_stats()
 
+        topics = stats["by_component"]
         weakest_topics = [
             {"topic": k, "count": v}
             for k, v in sorted(topics.items(), key=lambda x: x[1], reverse=True)[:5]
         ]
 
         return {
-            "total_wrong": len(entries),
-            "by_type": by_type,
+            "total_wrong": stats["total"],
+            "by_type": stats["by_type"],
+            "by_component": topics,
             "weakest_topics": weakest_topics,
         }
 
     def get_wrong_question_detail(self, identifier: str) -> Optional[Dict[str, Any]]:
         """获取单个错题详情"""
+        self._settle_wrong_updates()
         entries = self._load_wrong_payloads(as_dict=True)
         return entries.get(identifier)
 
     def clear_all_wrong_questions(self) -> int:
         """清空错题本，返回删除数量"""
-        entries = self._load_wrong_payloads()
-        count = len(entries)
-        if self.wrong_path.exists():
-            self.wrong_path.unlink()
-        return count
+        self._settle_wrong_updates()
+        with self._wrong_lock:
+            entries = self._load_wrong_payloads()
+            count = len(entries)
+            if self.wrong_path.exists():
+                self.wrong_path.unlink()
+            self.wrong_stats_path.unlink(missing_ok=True)
+            self._due_queue.clear()
+            self._due_stamp = None
+            return count
 
     # Internal helpers ---------------------------------------------------------
 
+    def _attempt_record(
+        self,
+        *,
+        session_id: str,
+        question: Question,
+        user_answer: str,
+        is_correct: bool,
+        plain_explanation: str,
+        session_context: Optional[Dict[str, Any]] = None,
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[Any, ...]:
+        timestamp = _now_iso()
+        question_payload = _question_to_dict(question)
+        ref = self.question_catalog.put(question_payload)
+        entry: Dict[str, Any] = {
+            "timestamp": timestamp,
+            "id": uuid.uuid4().hex[:16],
+            "session_id": session_id,
+            "question_ref": ref,
+            "question_id": question.identifier,
+            "question_type": question.question_type.name,
+            "component": question.component or infer_component(question.identifier),
+            "user_answer": user_answer,
+            "is_correct": is_correct,
+            "plain_explanation": plain_explanation,
+        }
+        if session_context:
+            entry["session_context"] = session_context
+        if extra:
+            entry["extra"] = extra
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        return (timestamp, line, entry, (ref, question_payload))
+
+    def _apply_answer_outcomes(self, payloads: List[Dict[str, Any]]) -> None:
+        """在一次读-改-写中应用一批作答结果，跳过已应用过的作答编号"""
+        with self._wrong_lock:
+            in_sync = self._due_queue_in_sync()
+            stats = self._load_wrong_stats()
+            entries = self._load_wrong_payloads(as_dict=True)
+            changed = False
+            for payload in payloads:
+                question_payload = payload["question"]
+                identifier = question_payload["identifier"]
+                attempt_id = payload.get("attempt_id")
+                if _attempt_applied(entries.get(identifier), attempt_id):
+                    continue
+                if not payload["is_correct"]:
+                    self._lapse_entry(
+                        entries,
+                        stats,
+                        question_payload,
+                        payload["plain_explanation"],
+                        in_sync=in_sync,
+                    )
+                    _remember_attempt(entries[identifier], attempt_id)
+                    changed = True
+                elif identifier in entries:
+                    # 掌握后错题被移出，重放时错题已不在错题本中，同样不会重复推进
+                    if not self._review_entry(
+                        entries, stats, identifier, in_sync=in_sync
+                    ):
+                        _remember_attempt(entries[identifier], attempt_id)
+                    changed = True
+            if changed:
+                self._write_wrong_payloads(entries.values())
+                self._write_wrong_stats(stats)
+                self._mark_due_queue(entries, in_sync)
+
+    def _lapse_entry(
+        self,
+        entries: Dict[str, Dict[str, Any]],
+        stats: Dict[str, Any],
+        question_payload: Dict[str, Any],
+        plain_explanation: str,
+        *,
+        in_sync: bool,
+    ) -> None:
+        """在内存中登记一次答错（新增错题或累加次数并重置复习间隔）"""
+        identifier = question_payload["identifier"]
+        record = {
+            "question": question_payload,
+            "component": _question_component(question_payload),
+            "last_plain_explanation": plain_explanation,
+            "last_wrong_at": _now_iso(),
+        }
+        previous = entries.get(identifier)
+        if previous is not None:
+            _count_wrong_entry(stats, previous, -1)
+            if previous.get("applied_attempts"):
+                record["applied_attempts"] = list(previous["applied_attempts"])
+        review = apply_lapse(review_state_of(previous), datetime.utcnow())
+        record["wrong_count"] = review.pop("wrong_count")
+        record["review"] = review
+        _count_wrong_entry(stats, record, 1)
+        entries[identifier] = record
+        if in_sync:
+            self._due_queue.push(identifier, record)
+
+    def _review_entry(
+        self,
+        entries: Dict[str, Dict[str, Any]],
+        stats: Dict[str, Any],
+        identifier: str,
+        *,
+        in_sync: bool,
+    ) -> bool:
+        """在内存中登记一次错题答对，达到掌握阈值时移出并返回 True"""
+        entry = entries[identifier]
+        review = apply_success(review_state_of(entry), datetime.utcnow())
+        if is_graduated(review):
+            _count_wrong_entry(stats, entries.pop(identifier), -1)
+            if in_sync:
+                self._due_queue.discard(identifier)
+            return True
+        entry["wrong_count"] = review.pop("wrong_count")
+        entry["review"] = review
+        if in_sync:
+            self._due_queue.push(identifier, entry)
+        return False
+
+    def _settle_wrong_updates(self) -> None:
+        """等待已提交的错题更新完成，读者总能看到此前的作答结果
+
+        须在获取 ``_wrong_lock`` 之前调用；在后台线程内调用时立即返回。
+        """
+        if self._outcomes is not None:
+            self._outcomes.flush()
+
     def _load_wrong_payloads(self, *, as_dict: bool = False) -> Any:
         if not self.wrong_path.exists():
             return {} if as_dict else []
@@ -328,31 +1047,172 @@ class RecordManager:
             return list(payload.values())
         return []
 
-    def _iter_answer_history(self) -> Iterable[Dict[str, Any]]:
-        if not self.history_path.exists():
-            return []
+    def _query_answer_history_by_cursor(
+        self,
+        cursor: str,
+        *,
+        page_size: int,
+        include_total: bool,
+        **filters: Any,
+    ) -> Dict[str, Any]:
+        position = decode_cursor(cursor) if cursor else {}
+        last_ts = position.get("ts")
+        last_id = position.get("id")
+        resumed = last_ts is None
+
+        records = self._iter_answer_history(
+            date_from=filters.get("date_from"),
+            date_to=filters.get("date_to"),
+            reverse=True,
+            max_timestamp=last_ts,
+        )
+        page_entries: List[Dict[str, Any]] = []
+        has_more = False
+        for item in records:
+            if not resumed:
+                timestamp = item.get("timestamp", "")
+                if timestamp > last_ts:
+                    continue
+                if timestamp == last_ts:
+                    # 同一秒内的记录按写入倒序排列，越过游标所指的那条后继续
+                    resumed = history_entry_id(item) == last_id
+                    continue
+                resumed = True
+            if not _history_matches(item, **filters):
+                continue
+            if len(page_entries) >= page_size:
+                has_more = True
+                break
+            page_entries.append(item)
+
+        next_cursor = None
+        if has_more and page_entries:
+            last = page_entries[-1]
+            next_cursor = encode_cursor(
+                {"ts": last.get("timestamp", ""), "id": history_entry_id(last)}
+            )
+        pagination: Dict[str, Any] = {
+            "page_size": page_size,
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+        }
+        if include_total:
+            pagination["total"] = self.count_answer_history(**filters)
+        return {
+            "entries": [
+                self._join_question({**item, "id": history_entry_id(item)})
+                for item in page_entries
+            ],
+            "pagination": pagination,
+        }
+
+    def _join_question(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """为引用题目目录的历史记录补回完整题目"""
+        ref = item.get("question_ref")
+        if not ref or "question" in item:
+            return item
+        joined = dict(item)
+        joined["question"] = self.question_catalog.get(ref) or {
+            "identifier": item.get("question_id"),
+            "question_type": item.get("question_type"),
+        }
+        return joined
+
+    def _append_history_lines(
+        self, records: List[Tuple[Any, ...]], fsync: bool
+    ) -> None:
+        """写入一批 ``(timestamp, line, entry, (ref, question))``，再登记检索索引"""
+        self.history_store.append(
+            [(timestamp, line) for timestamp, line, *_ in records], fsync=fsync
+        )
+        try:
+            self.search_index.add_attempts(
+                [record[2] for record in records if len(record) > 2],
+                [record[3] for record in records if len(record) > 3],
+            )
+        except Exception as exc:  # 检索索引可由 rebuild_search_index 补建
+            print(f"⚠️  更新全文检索索引失败: {exc}")
+
+    def _iter_answer_history(
+        self,
+        *,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        reverse: bool = False,
+        max_timestamp: str | None = None,
+    ) -> Iterable[Dict[str, Any]]:
+        self.flush()
+        return self.history_store.iter_records(
+            date_from=date_from,
+            date_to=date_to,
+            reverse=reverse,
+            max_timestamp=max_timestamp,
+        )
+
+    def _wrong_file_stamp(self) -> Optional[List[int]]:
+        try:
+            stat = self.wrong_path.stat()
+        except FileNotFoundError:
+            return None
+        return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
 
-        def generator() -> Iterable[Dict[str, Any]]:
-            with self.history_path.open("r", encoding="utf-8") as handle:
-                for line in handle:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        yield json.loads(line)
-                    except json.JSONDecodeError:
-                        continue
+    def _read_wrong_stats(self) -> Optional[Dict[str, Any]]:
+        """读取错题计数；文件缺失或与错题本不一致时返回 None"""
+        try:
+            stats = json.loads(self.wrong_stats_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            stats = None
+        if (
+            not isinstance(stats, dict)
+            or stats.get("source") != self._wrong_file_stamp()
+        ):
+            if not self.wrong_path.exists():
+                return {"total": 0, "by_type": {}, "by_component": {}, "source": None}
+            return None
+        return stats
 
-        return generator()
+    def _load_wrong_stats(self) -> Dict[str, Any]:
+        """读取错题计数，必要时从错题本重建；调用方需持有 ``_wrong_lock``"""
+        stats = self._read_wrong_stats()
+        return stats if stats is not None else self._rebuild_wrong_stats()
+
+    def _rebuild_wrong_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"total": 0, "by_type": {}, "by_component": {}}
+        for entry in self._load_wrong_payloads():
+            _count_wrong_entry(stats, entry, 1)
+        self._write_wrong_stats(stats)
+        return stats
+
+    def _write_wrong_stats(self, stats: Dict[str, Any]) -> None:
+        stats["source"] = self._wrong_file_stamp()
+        if stats["source"] is None:
+            self.wrong_stats_path.unlink(missing_ok=True)
+            return
+        atomic_write_text(
+            self.wrong_stats_path, json.dumps(stats, ensure_ascii=False, indent=2)
+        )
+
+    def _due_queue_in_sync(self) -> bool:
+        return self._due_stamp is not _NOT_LOADED and (
+            self._due_stamp == self._wrong_file_stamp()
+        )
+
+    def _mark_due_queue(
+        self, entries: Dict[str, Dict[str, Any]], in_sync: bool
+    ) -> None:
+        """写入错题本后登记新的文件戳；此前已不同步时由完整错题本重建"""
+        if not in_sync:
+            self._due_queue.rebuild(entries)
+        self._due_stamp = self._wrong_file_stamp()
 
     def _write_wrong_payloads(self, entries: Iterable[Dict[str, Any]]) -> None:
         payload = list(entries)
         if payload:
-            self.wrong_path.write_text(
-                json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"
+            atomic_write_text(
+                self.wrong_path, json.dumps(payload, ensure_ascii=False, indent=2)
             )
         elif self.wrong_path.exists():
             self.wrong_path.unlink()
 
 
-__all__ = ["RecordManager"]
+__all__ = ["RecordManager", "history_entry_id", "history_question_type"]
@@ -0,0 +1,236 @@
+"""数据保留策略与后台清理任务
+
+长期运行的部署中答题历史、会话与上传文件只增不减。这里按数据类型配置
+保留策略（按时间和/或按数量），由后台线程定期执行：
+
+- 答题历史：整段过期的段直接删除，跨越边界的段流式重写；
+- 会话：按最后活动时间过期，超过数量上限时淘汰最久未活动的会话；
+- 上传文件：按会话统计引用计数（内容寻址的文件可被多个会话共用），计数
+  为 0 且超过宽限期的文件连同解析缓存一起回收。
+
+所有策略项为 ``None`` 时表示不限制。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional
+
+from .upload_store import parse_cache_path
+
+if TYPE_CHECKING:
+    from .record_manager import RecordManager
+
+
+def _env_number(name: str, default: Optional[float], cast: Callable[[str], Any]) -> Any:
+    raw = os.environ.get(name)
+    if raw is None or not raw.strip():
+        return default
+    if raw.strip().lower() in {"none", "off", "0"}:
+        return None
+    return cast(raw)
+
+
+@dataclass
+class RetentionPolicy:
+    """各类数据的保留期限"""
+
+    history_max_age_days: Optional[int] = None
+    history_max_rows: Optional[int] = None
+    session_max_age_days: Optional[int] = 30
+    session_max_count: Optional[int] = 1000
+    upload_grace_hours: Optional[float] = 24.0
+    interval_seconds: float = 3600.0
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        """从环境变量读取策略，``0``/``none``/``off`` 表示不限制"""
+        defaults = cls()
+        return cls(
+            history_max_age_days=_env_number(
+                "RETENTION_HISTORY_DAYS", defaults.history_max_age_days, int
+            ),
+            history_max_rows=_env_number(
+                "RETENTION_HISTORY_MAX_ROWS", defaults.history_max_rows, int
+            ),
+            session_max_age_days=_env_number(
+                "RETENTION_SESSION_DAYS", defaults.session_max_age_days, int
+            ),
+            session_max_count=_env_number(
+                "RETENTION_SESSION_MAX_COUNT", defaults.session_max_count, int
+            ),
+            upload_grace_hours=_env_number(
+                "RETENTION_UPLOAD_GRACE_HOURS", defaults.upload_grace_hours, float
+            ),
+            interval_seconds=float(
+                os.environ.get("RETENTION_INTERVAL_SECONDS", defaults.interval_seconds)
+            ),
+        )
+
+
+def select_expired_sessions(
+    sessions: Dict[str, Dict[str, Any]],
+    *,
+    now: float,
+    max_age_days: Optional[int],
+    max_count: Optional[int],
+) -> List[str]:
+    """按最后活动时间挑出需要淘汰的会话"""
+    by_activity = sorted(
+        sessions.items(), key=lambda item: item[1].get("updated_at", 0)
+    )
+    expired: List[str] = []
+    if max_age_days is not None:
+        cutoff = now - max_age_days * 86_400
+        expired = [
+            sid for sid, session in by_activity if session.get("updated_at", 0) < cutoff
+        ]
+    if max_count is not None:
+        already = set(expired)
+        remaining = [sid for sid, _ in by_activity if sid not in already]
+        overflow = len(remaining) - max_count
+        if overflow > 0:
+            expired.extend(remaining[:overflow])
+    return expired
+
+
+def collect_unreferenced_uploads(
+    upload_dir: Path,
+    referenced: Iterable[str],
+    *,
+    now: float,
+    grace_hours: Optional[float],
+) -> List[Path]:
+    """删除引用计数为 0 且超过宽限期的上传文件，返回被删除的路径
+
+    ``referenced`` 是每个存活会话使用的文件路径，同一文件出现几次即有几个引用。
+    """
+    if grace_hours is None or not upload_dir.exists():
+        return []
+    ref_counts = Counter(Path(name).name for name in referenced if name)
+    cutoff = now - grace_hours * 3600
+    removed: List[Path] = []
+    for path in upload_dir.iterdir():
+        if not path.is_file() or ref_counts[path.name] > 0:
+            continue
+        try:
+            if path.stat().st_mtime >= cutoff:
+                continue
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        parse_cache_path(path).unlink(missing_ok=True)
+        removed.append(path)
+    return removed
+
+
+class RetentionEngine:
+    """定期执行保留策略的后台任务
+
+    会话由调用方持有，通过 ``list_sessions``（返回会话快照）与
+    ``drop_sessions``（删除给定会话并持久化）两个回调访问。
+    """
+
+    def __init__(
+        self,
+        policy: RetentionPolicy,
+        record_manager: "RecordManager",
+        *,
+        upload_dir: Path,
+        list_sessions: Callable[[], Dict[str, Dict[str, Any]]],
+        drop_sessions: Callable[[List[str]], None],
+    ) -> None:
+        self.policy = policy
+        self.record_manager = record_manager
+        self.upload_dir = upload_dir
+        self._list_sessions = list_sessions
+        self._drop_sessions = drop_sessions
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def run_once(self) -> Dict[str, int]:
+        """执行一轮清理，返回各类数据删除的数量"""
+        policy = self.policy
+        now = time.time()
+        report = {"history_rows": 0, "sessions": 0, "uploads": 0}
+
+        if (
+            policy.history_max_age_days is not None
+            or policy.history_max_rows is not None
+        ):
+            before = None
+            if policy.history_max_age_days is not None:
+                before = datetime.utcnow() - timedelta(days=policy.history_max_age_days)
+            report["history_rows"] = self.record_manager.purge_answer_history(
+                before=before, max_rows=policy.history_max_rows
+            )
+
+        sessions = self._list_sessions()
+        expired = select_expired_sessions(
+            sessions,
+            now=now,
+            max_age_days=policy.session_max_age_days,
+            max_count=policy.session_max_count,
+        )
+        if expired:
+            self._drop_sessions(expired)
+            report["sessions"] = len(expired)
+
+        # 会话淘汰之后再统计引用，已过期会话的上传文件可一并回收
+        expired_ids = set(expired)
+        referenced = [
+            session.get("filepath")
+            for sid, session in sessions.items()
+            if sid not in expired_ids
+        ]
+        report["uploads"] = len(
+            collect_unreferenced_uploads(
+                self.upload_dir,
+                referenced,
+                now=now,
+                grace_hours=policy.upload_grace_hours,
+            )
+        )
+
+        if any(report.values()):
+            print(
+                f"🧹 数据清理：历史 {report['history_rows']} 行，"
+                f"会话 {report['sessions']} 个，上传文件 {report['uploads']} 个"
+            )
+        return report
+
+    def start(self) -> None:
+        """启动后台清理线程"""
+        if self._thread is not None:
+            return
+
+        def loop() -> None:
+            while not self._stop.wait(timeout=self.policy.interval_seconds):
+                try:
+                    self.run_once()
+                except Exception as exc:  # pragma: no cover - 后台线程兜底
+                    print(f"⚠️  数据清理失败: {exc}")
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=2)
+        self._thread = None
+
+
+__all__ = [
+    "RetentionEngine",
+    "RetentionPolicy",
+    "collect_unreferenced_uploads",
+    "select_expired_sessions",
+]
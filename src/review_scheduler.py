@@ -0,0 +1,158 @@
+"""错题的间隔复习调度（SM-2）
+
+每道错题记录 ``wrong_count`` 与复习状态 ``review``：易度因子 ``ease``、
+当前间隔 ``interval_days``、连续答对次数 ``repetitions`` 以及下次到期时间
+``due_at``。答错时重置为立即到期并降低易度；答对时按 SM-2 延长间隔，间隔
+达到 ``GRADUATE_INTERVAL_DAYS`` 即视为掌握，移出错题本。
+
+:class:`DueQueue` 是按 ``due_at`` 排序的小顶堆，组卷时弹出最先到期的 N 道
+题，复杂度 O(N log M)；更新采用惰性删除，无需在堆中查找旧位置。
+"""
+
+from __future__ import annotations
+
+import heapq
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+LAPSE_EASE_PENALTY = 0.2
+GRADUATE_INTERVAL_DAYS = 21
+
+
+def _format(value: datetime) -> str:
+    return value.replace(microsecond=0).isoformat() + "Z"
+
+
+def review_state_of(entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """读取错题的复习状态；旧数据没有该字段时以最近答错时间为到期时间"""
+    if not entry:
+        return {
+            "wrong_count": 0,
+            "ease": DEFAULT_EASE,
+            "interval_days": 0,
+            "repetitions": 0,
+            "due_at": None,
+        }
+    review = dict(entry.get("review") or {})
+    review.setdefault("ease", DEFAULT_EASE)
+    review.setdefault("interval_days", 0)
+    review.setdefault("repetitions", 0)
+    review.setdefault("due_at", entry.get("last_wrong_at"))
+    review["wrong_count"] = int(entry.get("wrong_count", 1))
+    return review
+
+
+def apply_lapse(state: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """答错：连续答对次数清零、降低易度，并立即到期"""
+    wrong_count = state["wrong_count"] + 1
+    ease = max(MIN_EASE, state["ease"] - LAPSE_EASE_PENALTY)
+    if state["wrong_count"] == 0:
+        ease = DEFAULT_EASE
+    return {
+        "wrong_count": wrong_count,
+        "ease": round(ease, 2),
+        "interval_days": 0,
+        "repetitions": 0,
+        "due_at": _format(now),
+    }
+
+
+def apply_success(state: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """答对：按 SM-2 的 1 天、6 天、间隔×易度依次延长"""
+    repetitions = state["repetitions"] + 1
+    if repetitions == 1:
+        interval = 1
+    elif repetitions == 2:
+        interval = 6
+    else:
+        interval = max(1, round(state["interval_days"] * state["ease"]))
+    return {
+        "wrong_count": state["wrong_count"],
+        "ease": state["ease"],
+        "interval_days": interval,
+        "repetitions": repetitions,
+        "due_at": _format(now + timedelta(days=interval)),
+    }
+
+
+def is_graduated(state: Dict[str, Any]) -> bool:
+    return state["interval_days"] >= GRADUATE_INTERVAL_DAYS
+
+
+class DueQueue:
+    """按到期时间排序的错题堆（惰性删除）"""
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[str, str]] = []
+        self._entries: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def rebuild(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """由完整错题本重建，O(M)"""
+        self._entries = {}
+        for identifier, entry in entries.items():
+            due_at = review_state_of(entry)["due_at"] or ""
+            self._entries[identifier] = (due_at, entry)
+        self._heap = [
+            (due_at, identifier) for identifier, (due_at, _) in self._entries.items()
+        ]
+        heapq.heapify(self._heap)
+
+    def push(self, identifier: str, entry: Dict[str, Any]) -> None:
+        due_at = review_state_of(entry)["due_at"] or ""
+        self._entries[identifier] = (due_at, entry)
+        heapq.heappush(self._heap, (due_at, identifier))
+        self._maybe_compact()
+
+    def discard(self, identifier: str) -> None:
+        self._entries.pop(identifier, None)
+        self._maybe_compact()
+
+    def clear(self) -> None:
+        self._heap = []
+        self._entries = {}
+
+    def most_due(
+        self,
+        count: int,
+        accept: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> List[Dict[str, Any]]:
+        """返回最先到期的 ``count`` 道错题（不会将其移出队列）"""
+        selected: List[Dict[str, Any]] = []
+        popped: List[Tuple[str, str]] = []
+        seen = set()
+        while self._heap and len(selected) < count:
+            due_at, identifier = heapq.heappop(self._heap)
+            current = self._entries.get(identifier)
+            if current is None or current[0] != due_at or identifier in seen:
+                continue  # 已删除、已被更新或重复的旧堆项
+            seen.add(identifier)
+            popped.append((due_at, identifier))
+            if accept is None or accept(current[1]):
+                selected.append(current[1])
+        for item in popped:
+            heapq.heappush(self._heap, item)
+        return selected
+
+    def _maybe_compact(self) -> None:
+        # 过期堆项超过一半时重建，避免堆无限增长
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [
+                (due_at, identifier)
+                for identifier, (due_at, _) in self._entries.items()
+            ]
+            heapq.heapify(self._heap)
+
+
+__all__ = [
+    "DueQueue",
+    "GRADUATE_INTERVAL_DAYS",
+    "apply_lapse",
+    "apply_success",
+    "is_graduated",
+    "review_state_of",
+]
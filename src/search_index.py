@@ -0,0 +1,410 @@
+"""答题历史与题库的全文检索（SQLite FTS5）
+
+``data/search_index.db`` 中维护两组表：
+
+- ``questions`` / ``questions_fts``：按题目内容哈希登记的题目，索引题干、
+  解析与参考答案；
+- ``attempts`` / ``attempts_fts``：每次作答，索引用户答案与判分说明，
+  ``attempts.question_ref`` 上的索引用于把题目命中展开为作答记录。
+
+FTS5 使用 ``trigram`` 分词器，中文无需额外分词。不足三个字的查询词无法
+走倒排索引：与较长的词同时出现时只在 ``MATCH`` 命中的行上用 ``LIKE``
+过滤；查询只含短词时退化为 ``LIKE`` 扫描，且只扫描最近登记的
+:data:`SHORT_QUERY_SCAN_ROWS` 行。作答记录随历史批量写入时增量登记，
+一个批次一个事务。SQLite 未编译 FTS5 或版本低于 3.34 时检索不可用。
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+MIN_TRIGRAM_CHARS = 3
+
+# 只含短词的查询退化为 LIKE 扫描时，最多扫描的（最近登记的）行数
+SHORT_QUERY_SCAN_ROWS = 50_000
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS questions (
+        id INTEGER PRIMARY KEY,
+        ref TEXT NOT NULL UNIQUE,
+        identifier TEXT,
+        question_type TEXT,
+        component TEXT
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+        prompt, explanation, answer_text, tokenize = 'trigram'
+    );
+    CREATE TABLE IF NOT EXISTS attempts (
+        id INTEGER PRIMARY KEY,
+        record_id TEXT NOT NULL UNIQUE,
+        timestamp TEXT NOT NULL,
+        session_id TEXT,
+        question_ref TEXT,
+        question_id TEXT,
+        question_type TEXT,
+        is_correct INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_attempts_question_ref
+        ON attempts(question_ref);
+    CREATE INDEX IF NOT EXISTS idx_attempts_timestamp
+        ON attempts(timestamp);
+    CREATE VIRTUAL TABLE IF NOT EXISTS attempts_fts USING fts5(
+        user_answer, plain_explanation, tokenize = 'trigram'
+    );
+"""
+
+
+def _split_terms(query: str) -> Tuple[List[str], List[str]]:
+    """把查询拆成可走倒排索引的词与不足三个字的短词"""
+    terms = query.split()
+    long_terms = [term for term in terms if len(term) >= MIN_TRIGRAM_CHARS]
+    short_terms = [term for term in terms if len(term) < MIN_TRIGRAM_CHARS]
+    return long_terms, short_terms
+
+
+def _match_expression(terms: List[str]) -> str:
+    """把查询词转换为 FTS5 查询：各词加引号后按 AND 组合"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _like_clause(columns: Tuple[str, ...], terms: List[str]) -> Tuple[str, List[str]]:
+    clauses = []
+    params: List[str] = []
+    for term in terms:
+        pattern = (
+            "%"
+            + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            + "%"
+        )
+        clauses.append(
+            "("
+            + " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in columns)
+            + ")"
+        )
+        params.extend([pattern] * len(columns))
+    return " AND ".join(clauses), params
+
+
+class SearchIndex:
+    """全文检索索引"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._known_refs: set[str] = set()
+        self.available = True
+        try:
+            conn = self._connect()
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        except sqlite3.OperationalError as exc:
+            print(f"⚠️  全文检索不可用（需要 SQLite FTS5 trigram）：{exc}")
+            self.available = False
+
+    # Indexing -----------------------------------------------------------------
+
+    def add_questions(self, questions: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """登记 ``(ref, 题目字典)``，已登记的题目直接跳过"""
+        if not self.available:
+            return
+        pending = [
+            (ref, payload) for ref, payload in questions if ref not in self._known_refs
+        ]
+        if not pending:
+            return
+        with self._lock, self._connect() as conn:
+            self._insert_questions(conn, pending)
+
+    def add_attempts(
+        self,
+        attempts: Iterable[Dict[str, Any]],
+        questions: Iterable[Tuple[str, Dict[str, Any]]] = (),
+    ) -> None:
+        """在一个事务内登记一批作答记录（及其题目）"""
+        if not self.available:
+            return
+        rows = list(attempts)
+        pending = [
+            (ref, payload) for ref, payload in questions if ref not in self._known_refs
+        ]
+        if not rows and not pending:
+            return
+        with self._lock, self._connect() as conn:
+            if pending:
+                self._insert_questions(conn, pending)
+            for item in rows:
+                cursor = conn.execute(
+                    """
+                    INSERT OR IGNORE INTO attempts (
+                        record_id, timestamp, session_id, question_ref,
+                        question_id, question_type, is_correct
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        item["id"],
+                        item["timestamp"],
+                        item.get("session_id"),
+                        item.get("question_ref"),
+                        item.get("question_id"),
+                        item.get("question_type"),
+                        1 if item.get("is_correct") else 0,
+                    ),
+                )
+                if cursor.rowcount:
+                    conn.execute(
+                        "INSERT INTO attempts_fts (rowid, user_answer, plain_explanation)"
+                        " VALUES (?, ?, ?)",
+                        (
+                            cursor.lastrowid,
+                            item.get("user_answer") or "",
+                            item.get("plain_explanation") or "",
+                        ),
+                    )
+
+    def clear(self) -> None:
+        if not self.available:
+            return
+        with self._lock, self._connect() as conn:
+            for table in ("attempts_fts", "attempts", "questions_fts", "questions"):
+                conn.execute(f"DELETE FROM {table}")
+            self._known_refs.clear()
+
+    def purge_before(self, timestamp: str) -> int:
+        """删除时间戳早于 ``timestamp`` 的作答记录，返回删除数量"""
+        if not self.available:
+            return 0
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "DELETE FROM attempts_fts WHERE rowid IN"
+                " (SELECT id FROM attempts WHERE timestamp < ?)",
+                (timestamp,),
+            )
+            return conn.execute(
+                "DELETE FROM attempts WHERE timestamp < ?", (timestamp,)
+            ).rowcount
+
+    def attempt_count(self) -> int:
+        if not self.available:
+            return 0
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM attempts").fetchone()[0]
+
+    # Searching ----------------------------------------------------------------
+
+    def search_questions(
+        self, query: str, *, page: int = 1, page_size: int = 20
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """按相关度检索题目，返回 ``(结果, 总数)``"""
+        self._require_available()
+        match_sql, params = self._question_match(query)
+        offset = max(0, (page - 1) * page_size)
+        with self._connect() as conn:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM ({match_sql})", params
+            ).fetchone()[0]
+            rows = conn.execute(
+                f"""
+                SELECT q.ref, q.identifier, q.question_type, q.component,
+                       f.prompt, m.score
+                FROM ({match_sql}) AS m
+                JOIN questions AS q ON q.id = m.id
+                JOIN questions_fts AS f ON f.rowid = m.id
+                ORDER BY m.score, q.id DESC
+                LIMIT ? OFFSET ?
+                """,
+                [*params, page_size, offset],
+            ).fetchall()
+        results = [
+            {
+                "question_ref": ref,
+                "identifier": identifier,
+                "question_type": question_type,
+                "component": component,
+                "prompt": prompt,
+                "score": score,
+            }
+            for ref, identifier, question_type, component, prompt, score in rows
+        ]
+        return results, total
+
+    def search_attempts(
+        self,
+        query: str,
+        *,
+        page: int = 1,
+        page_size: int = 20,
+        after: Optional[Tuple[float, str, str]] = None,
+        include_total: bool = True,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """检索作答记录：题目命中或答案/说明命中，按相关度、时间排序
+
+        传入 ``after``（上一页最后一条的 ``(score, timestamp, id)``）时从该
+        位置之后继续取一页，忽略 ``page``。排序与分页只在命中的行号、得分与
+        时间上进行，取出一页后才读取答案与说明；``include_total`` 为 False
+        时不统计总数，返回的总数为 None。
+        """
+        self._require_available()
+        question_sql, question_params = self._question_match(query)
+        attempt_sql, attempt_params = self._attempt_match(query)
+        hits_sql = f"""
+            SELECT id, MIN(score) AS score FROM (
+                SELECT a.id AS id, qm.score AS score
+                FROM ({question_sql}) AS qm
+                JOIN questions AS q ON q.id = qm.id
+                JOIN attempts AS a ON a.question_ref = q.ref
+                UNION ALL
+                SELECT id, score FROM ({attempt_sql})
+            )
+            GROUP BY id
+        """
+        params: List[Any] = [*question_params, *attempt_params]
+        keyset = ""
+        keyset_params: List[Any] = []
+        if after is not None:
+            score, timestamp, record_id = after
+            keyset = """
+                WHERE h.score > ?
+                   OR (h.score = ? AND (a.timestamp < ?
+                       OR (a.timestamp = ? AND a.record_id < ?)))
+            """
+            keyset_params = [score, score, timestamp, timestamp, record_id]
+            offset = 0
+        else:
+            offset = max(0, (page - 1) * page_size)
+        with self._connect() as conn:
+            total = None
+            if include_total:
+                total = conn.execute(
+                    f"SELECT COUNT(*) FROM ({hits_sql})", params
+                ).fetchone()[0]
+            rows = conn.execute(
+                f"""
+                SELECT p.record_id, p.timestamp, p.session_id, p.question_ref,
+                       p.question_id, p.question_type, p.is_correct,
+                       f.user_answer, f.plain_explanation, p.score
+                FROM (
+                    SELECT a.id, a.record_id, a.timestamp, a.session_id,
+                           a.question_ref, a.question_id, a.question_type,
+                           a.is_correct, h.score
+                    FROM ({hits_sql}) AS h
+                    JOIN attempts AS a ON a.id = h.id
+                    {keyset}
+                    ORDER BY h.score, a.timestamp DESC, a.record_id DESC
+                    LIMIT ? OFFSET ?
+                ) AS p
+                JOIN attempts_fts AS f ON f.rowid = p.id
+                ORDER BY p.score, p.timestamp DESC, p.record_id DESC
+                """,
+                [*params, *keyset_params, page_size, offset],
+            ).fetchall()
+        results = [
+            {
+                "id": record_id,
+                "timestamp": timestamp,
+                "session_id": session_id,
+                "question_ref": question_ref,
+                "question_id": question_id,
+                "question_type": question_type,
+                "is_correct": bool(is_correct),
+                "user_answer": user_answer,
+                "plain_explanation": plain_explanation,
+                "score": score,
+            }
+            for (
+                record_id,
+                timestamp,
+                session_id,
+                question_ref,
+                question_id,
+                question_type,
+                is_correct,
+                user_answer,
+                plain_explanation,
+                score,
+            ) in rows
+        ]
+        return results, total
+
+    # Internal helpers ---------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程复用一个连接；``with conn`` 负责提交或回滚事务"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _require_available(self) -> None:
+        if not self.available:
+            raise RuntimeError("全文检索不可用：SQLite 缺少 FTS5 trigram 分词器")
+
+    def _insert_questions(
+        self, conn: sqlite3.Connection, pending: List[Tuple[str, Dict[str, Any]]]
+    ) -> None:
+        for ref, payload in pending:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO questions (ref, identifier, question_type, component)"
+                " VALUES (?, ?, ?, ?)",
+                (
+                    ref,
+                    payload.get("identifier"),
+                    payload.get("question_type"),
+                    payload.get("component"),
+                ),
+            )
+            if cursor.rowcount:
+                options = payload.get("options") or []
+                conn.execute(
+                    "INSERT INTO questions_fts (rowid, prompt, explanation, answer_text)"
+                    " VALUES (?, ?, ?, ?)",
+                    (
+                        cursor.lastrowid,
+                        "\n".join([payload.get("prompt") or "", *options]),
+                        payload.get("explanation") or "",
+                        payload.get("answer_text") or "",
+                    ),
+                )
+            self._known_refs.add(ref)
+
+    def _question_match(self, query: str) -> Tuple[str, List[Any]]:
+        return self._match(
+            "questions_fts", ("prompt", "explanation", "answer_text"), query
+        )
+
+    def _attempt_match(self, query: str) -> Tuple[str, List[Any]]:
+        return self._match("attempts_fts", ("user_answer", "plain_explanation"), query)
+
+    @staticmethod
+    def _match(
+        table: str, columns: Tuple[str, ...], query: str
+    ) -> Tuple[str, List[Any]]:
+        """生成 ``SELECT id, score`` 子查询：长词走 MATCH，短词用 LIKE 过滤"""
+        long_terms, short_terms = _split_terms(query)
+        if long_terms:
+            sql = (
+                f"SELECT rowid AS id, bm25({table}) AS score"
+                f" FROM {table} WHERE {table} MATCH ?"
+            )
+            params: List[Any] = [_match_expression(long_terms)]
+        else:
+            # 没有可走倒排索引的词：只扫描最近登记的若干行
+            sql = (
+                f"SELECT rowid AS id, 0.0 AS score FROM {table}"
+                f" WHERE rowid > (SELECT COALESCE(MAX(rowid), 0) FROM {table}) - ?"
+            )
+            params = [SHORT_QUERY_SCAN_ROWS]
+        if short_terms:
+            clause, like_params = _like_clause(columns, short_terms)
+            sql += f" AND {clause}"
+            params.extend(like_params)
+        return sql, params
+
+
+__all__ = ["SHORT_QUERY_SCAN_ROWS", "SearchIndex"]
@@ -0,0 +1,356 @@
+"""按会话分文件的增量持久化
+
+旧实现每次出题、交卷都把全部会话（连同题目）重写进 ``sessions.json``，
+开销随历史会话总数增长。这里每个会话一个文件 ``<session_id>.json``：
+
+- 会话在首次访问时才从磁盘加载并缓存；
+- 修改后调用 :meth:`SessionStore.mark_dirty` 标记，后台定时器在
+  ``flush_delay`` 秒后合并写出所有脏会话，每个文件先写临时文件再原子替换；
+- 旧版 ``sessions.json`` 在首次打开时拆分为单独的文件；
+- 缓存按最近访问排序，超过 ``max_cached``/``max_cached_bytes`` 或闲置超过
+  ``cache_idle_seconds`` 时淘汰最久未访问的已落盘会话（再次访问时重新
+  加载）；淘汰在放入缓存与每次写出之后进行，尚未写出的会话不会被淘汰。
+
+会话中的题目等对象由调用方提供的 ``encode``/``decode`` 转换为 JSON。写出时
+在 ``session_lock`` 返回的会话锁内编码，不会读到请求修改到一半的会话。
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from enum import Enum
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Set,
+)
+
+from .utils.file_lock import atomic_write_text
+
+Session = Dict[str, Any]
+Codec = Callable[[Session], Session]
+LockProvider = Callable[[str], ContextManager[Any]]
+
+DEFAULT_FLUSH_DELAY = 0.5
+DEFAULT_CACHE_IDLE_SECONDS = 600.0
+
+# 会话 ID 直接用作文件名，只接受 uuid 风格的字符
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _identity(session: Session) -> Session:
+    return session
+
+
+def _no_lock(session_id: str) -> ContextManager[Any]:
+    return nullcontext()
+
+
+def is_valid_session_id(session_id: Any) -> bool:
+    return isinstance(session_id, str) and bool(_SESSION_ID.match(session_id))
+
+
+def estimate_size(value: Any) -> int:
+    """粗略估算对象占用的字节数：递归累加容器、字符串与对象字段"""
+    total = 0
+    seen: Set[int] = set()
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, Enum):
+            continue  # 枚举成员为全局共享对象，不计入会话
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return total
+
+
+class SessionStore(MutableMapping[str, Session]):
+    """以字典方式访问、按会话分文件持久化的会话表"""
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        encode: Codec = _identity,
+        decode: Codec = _identity,
+        flush_delay: float = DEFAULT_FLUSH_DELAY,
+        legacy_path: Optional[Path] = None,
+        max_cached: Optional[int] = None,
+        max_cached_bytes: Optional[int] = None,
+        cache_idle_seconds: Optional[float] = DEFAULT_CACHE_IDLE_SECONDS,
+        session_lock: LockProvider = _no_lock,
+    ) -> None:
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._encode = encode
+        self._decode = decode
+        self.flush_delay = flush_delay
+        self.max_cached = max_cached
+        self.max_cached_bytes = max_cached_bytes
+        self.cache_idle_seconds = cache_idle_seconds
+        self.session_lock = session_lock
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._cache: "OrderedDict[str, Session]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._touched: Dict[str, float] = {}
+        self.cached_bytes = 0
+        self._dirty: Set[str] = set()
+        self._flushing: Set[str] = set()
+        self._timer: Optional[threading.Timer] = None
+        if legacy_path is not None and legacy_path.exists():
+            self._migrate_legacy(legacy_path)
+        atexit.register(self.flush)
+
+    # Mapping API ---------------------------------------------------------------
+
+    def __getitem__(self, session_id: str) -> Session:
+        with self._lock:
+            session = self._cache.get(session_id)
+            if session is not None:
+                self._cache.move_to_end(session_id)
+                self._touched[session_id] = time.monotonic()
+                return session
+            payload = self._read(session_id)
+            if payload is None:
+                raise KeyError(session_id)
+            session = self._decode(payload)
+            self._cache_put(session_id, session)
+            return session
+
+    def __setitem__(self, session_id: str, session: Session) -> None:
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"无效的会话 ID: {session_id!r}")
+        with self._lock:
+            self._cache_put(session_id, session)
+            self.mark_dirty(session_id)
+
+    def __delitem__(self, session_id: str) -> None:
+        with self._lock:
+            cached = self._cache.pop(session_id, None)
+            self.cached_bytes -= self._sizes.pop(session_id, 0)
+            self._touched.pop(session_id, None)
+            self._dirty.discard(session_id)
+            path = self._path(session_id)
+            if path is None or not path.exists():
+                if cached is None:
+                    raise KeyError(session_id)
+                return
+            path.unlink(missing_ok=True)
+
+    def __contains__(self, session_id: object) -> bool:
+        with self._lock:
+            if session_id in self._cache:
+                return True
+            path = self._path(session_id)
+            return path is not None and path.exists()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._session_ids())
+
+    def __len__(self) -> int:
+        return len(self._session_ids())
+
+    def clear(self) -> None:
+        """删除全部会话（包括磁盘文件）"""
+        with self._lock:
+            self._cache.clear()
+            self._sizes.clear()
+            self._touched.clear()
+            self.cached_bytes = 0
+            self._dirty.clear()
+            for path in self.root.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    # Persistence ---------------------------------------------------------------
+
+    def mark_dirty(self, session_id: str) -> None:
+        """标记会话已修改，稍后与同一时间窗口内的其他修改合并写出
+
+        ``flush_delay`` 不大于 0 时立即写出该会话（调用方应持有会话锁）。
+        """
+        with self._lock:
+            session = self._cache.get(session_id)
+            if session is None:
+                return
+            if self.flush_delay > 0:
+                self._dirty.add(session_id)
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_delay, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._write(session_id, self._encode_text(session))
+
+    def flush(self) -> int:
+        """立即写出所有脏会话，返回写出的数量
+
+        每个会话在自己的会话锁内编码，编码期间不持有存储锁；写出后按闲置
+        时间与缓存上限淘汰。
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                dirty, self._dirty = self._dirty, set()
+                self._flushing = set(dirty)
+            written = 0
+            try:
+                for session_id in dirty:
+                    with self.session_lock(session_id):
+                        with self._lock:
+                            session = self._cache.get(session_id)
+                        if session is None:
+                            continue
+                        text = self._encode_text(session)
+                    with self._lock:
+                        # 编码期间被删除的会话不再写出；被替换的会话已重新标记为脏
+                        if self._cache.get(session_id) is session:
+                            self._write(session_id, text)
+                            written += 1
+                        self._flushing.discard(session_id)
+            finally:
+                with self._lock:
+                    self._flushing = set()
+                    self._evict()
+            return written
+
+    def summaries(self) -> Dict[str, Session]:
+        """返回各会话的活动时间与知识文件，不反序列化题目也不填充缓存"""
+        result: Dict[str, Session] = {}
+        with self._lock:
+            cached = dict(self._cache)
+        for session_id in self._session_ids():
+            session = cached.get(session_id)
+            path = self.root / f"{session_id}.json"
+            if session is None:
+                session = self._read(session_id)
+                if session is None:
+                    continue
+            summary = {
+                "created_at": session.get("created_at"),
+                "updated_at": session.get("updated_at"),
+                "filepath": session.get("filepath"),
+            }
+            if summary["updated_at"] is None:
+                try:
+                    summary["updated_at"] = path.stat().st_mtime
+                except FileNotFoundError:
+                    summary["updated_at"] = 0
+            result[session_id] = summary
+        return result
+
+    # Internal helpers ----------------------------------------------------------
+
+    def _cache_put(self, session_id: str, session: Session) -> None:
+        """放入缓存并重新计算字节数，超出上限时淘汰最久未访问的会话"""
+        size = estimate_size(session)
+        self.cached_bytes += size - self._sizes.get(session_id, 0)
+        self._sizes[session_id] = size
+        self._cache[session_id] = session
+        self._cache.move_to_end(session_id)
+        self._touched[session_id] = time.monotonic()
+        self._evict()
+
+    def _over_limit(self) -> bool:
+        if self.max_cached is not None and len(self._cache) > self.max_cached:
+            return True
+        return (
+            self.max_cached_bytes is not None
+            and self.cached_bytes > self.max_cached_bytes
+        )
+
+    def _evict(self) -> None:
+        # 从最久未访问的会话开始，淘汰闲置过久或超出上限的部分；至少保留
+        # 刚访问的会话，尚未写出的会话留到写出之后再淘汰
+        now = time.monotonic()
+        for session_id in list(self._cache)[:-1]:
+            idle = (
+                self.cache_idle_seconds is not None
+                and now - self._touched.get(session_id, now) > self.cache_idle_seconds
+            )
+            if not idle and not self._over_limit():
+                break
+            if session_id in self._dirty or session_id in self._flushing:
+                continue
+            del self._cache[session_id]
+            self._touched.pop(session_id, None)
+            self.cached_bytes -= self._sizes.pop(session_id, 0)
+
+    def _encode_text(self, session: Session) -> str:
+        return json.dumps(self._encode(session), ensure_ascii=False)
+
+    def _write(self, session_id: str, text: str) -> None:
+        atomic_write_text(self.root / f"{session_id}.json", text)
+
+    def _path(self, session_id: object) -> Optional[Path]:
+        if not is_valid_session_id(session_id):
+            return None
+        return self.root / f"{session_id}.json"
+
+    def _read(self, session_id: str) -> Optional[Session]:
+        path = self._path(session_id)
+        if path is None:
+            return None
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as exc:
+            print(f"⚠️  会话文件损坏，已忽略 {path.name}: {exc}")
+            return None
+        return payload if isinstance(payload, dict) else None
+
+    def _session_ids(self) -> List[str]:
+        with self._lock:
+            ids = set(self._cache)
+        ids.update(path.stem for path in self.root.glob("*.json"))
+        return sorted(ids)
+
+    def _migrate_legacy(self, legacy_path: Path) -> None:
+        try:
+            data = json.loads(legacy_path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError as exc:
+            print(f"⚠️  旧版会话文件无法解析，跳过迁移: {exc}")
+            return
+        migrated = 0
+        for session_id, session in (data or {}).items():
+            if not is_valid_session_id(session_id) or not isinstance(session, dict):
+                continue
+            atomic_write_text(
+                self.root / f"{session_id}.json",
+                json.dumps(session, ensure_ascii=False),
+            )
+            migrated += 1
+        legacy_path.unlink()
+        print(f"✅ 已将 {migrated} 个会话迁移为单独的文件")
+
+
+__all__ = [
+    "DEFAULT_CACHE_IDLE_SECONDS",
+    "SessionStore",
+    "estimate_size",
+    "is_valid_session_id",
+]
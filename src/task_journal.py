@@ -0,0 +1,329 @@
+"""带持久化日志的后台任务队列
+
+请求线程把响应之后才需要完成的写入（如错题本的读-改-写）提交为任务：
+任务先追加到本进程的日志文件，再交给后台线程执行，请求随即返回。
+
+- 日志按进程区分（``<pid>.jsonl``），每行是一个任务
+  ``{"seq", "kind", "payload"}`` 或完成标记 ``{"done": seq}``；
+- 队列清空后日志被截断，不会无限增长；
+- 进程退出时（``atexit``）等待队列执行完毕；
+- 启动时重放已退出进程遗留日志中未完成的任务，崩溃也不会丢失已提交的任务；
+- 处理函数抛出异常时按指数退避重试，仍失败的任务移入死信文件
+  ``dead_letter.jsonl``，之后才写完成标记或删除遗留日志。
+
+任务在处理函数返回后、完成标记写入前崩溃时会被重放，处理函数应当幂等
+（如按负载中的编号跳过已应用的任务）。
+
+任务处理函数按 ``kind`` 注册，``payload`` 必须可 JSON 序列化。后台线程把
+已积压的同类任务（最多 ``max_batch`` 个）合并为一批交给处理函数，处理函数
+可在一次读-改-写中应用整批任务。
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .monitoring.metrics import AppMetrics
+from .utils.file_lock import FileLock, pid_alive
+
+TaskHandler = Callable[[List[Dict[str, Any]]], None]
+Task = Tuple[int, str, Dict[str, Any]]
+
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 0.05  # 秒，每次重试翻倍
+DEAD_LETTER_NAME = "dead_letter.jsonl"
+
+
+def _pending_tasks(path: Path) -> List[Task]:
+    """读取日志中未完成的任务（按提交顺序）
+
+    任务按序执行，完成标记 ``{"done": seq}`` 表示 ``seq`` 及之前的任务均已完成。
+    """
+    tasks: Dict[int, Task] = {}
+    done = 0
+    try:
+        handle = path.open("r", encoding="utf-8")
+    except FileNotFoundError:
+        return []
+    with handle:
+        for line in handle:
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 崩溃时写了一半的最后一行
+            if "done" in item:
+                done = max(done, item["done"])
+            elif "seq" in item:
+                tasks[item["seq"]] = (
+                    item["seq"],
+                    item["kind"],
+                    item.get("payload") or {},
+                )
+    return [tasks[seq] for seq in sorted(tasks) if seq > done]
+
+
+class DurableTaskQueue:
+    """日志先行的后台任务队列"""
+
+    def __init__(
+        self,
+        journal_dir: Path,
+        handlers: Dict[str, TaskHandler],
+        *,
+        fsync: bool = False,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_backoff: float = DEFAULT_RETRY_BACKOFF,
+    ) -> None:
+        self.journal_dir = journal_dir
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        self.handlers = handlers
+        self.fsync = fsync
+        self.max_batch = max(1, max_batch)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self._path = self.journal_dir / f"{os.getpid()}.jsonl"
+        self.dead_letter_path = self.journal_dir / DEAD_LETTER_NAME
+        self._queue: "queue.Queue[Optional[Task]]" = queue.Queue()
+        self._cond = threading.Condition()
+        self._journal_lock = threading.Lock()
+        self._journal = None
+        self._submitted = 0
+        self._completed = 0
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._failed = False  # 后台线程因无法写出死信而停止
+
+    # Public API ----------------------------------------------------------------
+
+    def start(self) -> None:
+        """重放遗留任务并启动后台线程（幂等）"""
+        with self._cond:
+            if self._thread is not None or self._closed:
+                return
+            self._replay_orphans()
+            self._journal = self._path.open("a", encoding="utf-8")
+            self._thread = threading.Thread(
+                target=self._run, name="task-journal", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> None:
+        """记录任务到日志后入队，立即返回"""
+        self.submit_many(kind, [payload])
+
+    def submit_many(self, kind: str, payloads: List[Dict[str, Any]]) -> None:
+        """一次写入多个同类任务的日志后入队"""
+        if kind not in self.handlers:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        if self._closed:
+            raise RuntimeError("任务队列已关闭")
+        if not payloads:
+            return
+        if self._thread is None:
+            self.start()
+        with self._journal_lock:
+            tasks = []
+            with self._cond:
+                for payload in payloads:
+                    self._submitted += 1
+                    tasks.append((self._submitted, kind, payload))
+            self._write(
+                *(
+                    {"seq": seq, "kind": kind, "payload": payload}
+                    for seq, _, payload in tasks
+                )
+            )
+            for task in tasks:
+                self._queue.put(task)
+        AppMetrics.background_tasks_pending.set(self.pending())
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待此前提交的任务全部执行完毕，返回是否在超时前完成
+
+        在后台线程内（任务处理函数中）调用时直接返回，避免等待自己；
+        后台线程已停止时立即返回 False。
+        """
+        if threading.current_thread() is self._thread:
+            return True
+        with self._cond:
+            target = self._submitted
+            self._cond.wait_for(
+                lambda: self._completed >= target or self._failed, timeout
+            )
+            return self._completed >= target
+
+    def pending(self) -> int:
+        with self._cond:
+            return self._submitted - self._completed
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """执行完剩余任务并停止后台线程"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout=timeout)
+        with self._journal_lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+                if not _pending_tasks(self._path):
+                    self._path.unlink(missing_ok=True)
+
+    # Internal helpers ----------------------------------------------------------
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            # 合并已积压的同类任务
+            while batch[-1] is not None and len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+            for kind, tasks in _group_by_kind(batch):
+                # 执行成功或已移入死信文件后才登记完成
+                if self._settle(kind, tasks):
+                    self._mark_done(tasks[-1][0])
+                else:
+                    # 死信也写不出时停止处理，未完成的任务留在日志中待重启后重放
+                    print("⚠️  后台任务无法完成，停止处理并保留任务日志")
+                    with self._cond:
+                        self._failed = True
+                        self._cond.notify_all()
+                    return
+
+    def _mark_done(self, seq: int) -> None:
+        """登记 ``seq`` 及之前的任务已完成"""
+        with self._journal_lock:
+            self._write({"done": seq})
+            with self._cond:
+                self._completed = seq
+                self._cond.notify_all()
+                idle = self._completed == self._submitted
+                AppMetrics.background_tasks_pending.set(
+                    self._submitted - self._completed
+                )
+            if idle:
+                # 没有未完成的任务，截断日志
+                self._journal.seek(0)
+                self._journal.truncate()
+
+    def _settle(self, kind: str, tasks: List[Task]) -> bool:
+        """执行一批任务（失败时退避重试），仍失败则移入死信文件
+
+        返回任务是否已有着落（执行成功或已写入死信文件）。
+        """
+        error = self._execute(kind, [payload for _, _, payload in tasks])
+        if error is None:
+            return True
+        print(f"⚠️  后台任务 {kind} 执行失败，移入死信文件: {error}")
+        try:
+            self._dead_letter(kind, tasks, error)
+        except OSError as exc:
+            print(f"⚠️  写入死信文件失败: {exc}")
+            return False
+        AppMetrics.background_tasks_dead_lettered.inc(len(tasks))
+        return True
+
+    def _execute(self, kind: str, payloads: List[Dict[str, Any]]) -> Optional[str]:
+        """执行处理函数，失败时按指数退避重试；成功返回 None，否则返回错误信息"""
+        handler = self.handlers.get(kind)
+        if handler is None:
+            return f"未注册的任务类型: {kind}"
+        delay = self.retry_backoff
+        attempt = 1
+        while True:
+            try:
+                handler(payloads)
+                return None
+            except Exception as exc:  # 一批任务失败不影响后续任务
+                if attempt >= self.max_attempts:
+                    return str(exc) or type(exc).__name__
+                print(f"⚠️  后台任务 {kind} 第 {attempt} 次执行失败，稍后重试: {exc}")
+            time.sleep(delay)
+            delay *= 2
+            attempt += 1
+
+    def _dead_letter(self, kind: str, tasks: List[Task], error: str) -> None:
+        """把失败的任务追加到死信文件，保留负载以便排查后手动重新提交"""
+        failed_at = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+        lines = "".join(
+            json.dumps(
+                {
+                    "kind": kind,
+                    "payload": payload,
+                    "error": error,
+                    "failed_at": failed_at,
+                    "pid": os.getpid(),
+                },
+                ensure_ascii=False,
+            )
+            + "\n"
+            for _, _, payload in tasks
+        )
+        with FileLock(self.journal_dir / ".dead_letter.lock"):
+            with self.dead_letter_path.open("a", encoding="utf-8") as handle:
+                handle.write(lines)
+                handle.flush()
+                os.fsync(handle.fileno())
+
+    def _write(self, *items: Dict[str, Any]) -> None:
+        """追加日志行（调用方持有 ``_journal_lock``）"""
+        self._journal.write(
+            "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items)
+        )
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _replay_orphans(self) -> None:
+        """执行已退出进程遗留的未完成任务，全部有着落后才删除其日志"""
+        with FileLock(self.journal_dir / ".lock"):
+            for path in sorted(self.journal_dir.glob("*.jsonl")):
+                try:
+                    pid = int(path.stem)
+                except ValueError:
+                    continue
+                if pid != os.getpid() and pid_alive(pid):
+                    continue
+                tasks = _pending_tasks(path)
+                if tasks:
+                    print(f"🔄 重放 {len(tasks)} 个未完成的后台任务（{path.name}）")
+                if all(
+                    self._settle(kind, group) for kind, group in _group_by_kind(tasks)
+                ):
+                    path.unlink(missing_ok=True)
+
+
+def _group_by_kind(tasks: List[Task]) -> List[Tuple[str, List[Task]]]:
+    """把连续的同类任务分为一组，保持提交顺序"""
+    groups: List[Tuple[str, List[Task]]] = []
+    for task in tasks:
+        if groups and groups[-1][0] == task[1]:
+            groups[-1][1].append(task)
+        else:
+            groups.append((task[1], [task]))
+    return groups
+
+
+__all__ = ["DurableTaskQueue"]
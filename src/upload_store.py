@@ -0,0 +1,161 @@
+"""内容寻址的上传知识文件存储
+
+同一份手册常被许多学员重复上传。上传内容在流式写入磁盘的同时计算
+SHA-256，文件以 ``<sha256><扩展名>`` 命名：
+
+- 相同内容的后续上传直接复用已有文件（文件 ID 即文件名），不再写第二份；
+- 内容寻址的文件不会被修改，解析结果缓存在 ``.parsed/<文件名>.json``
+  （多进程共享）与进程内 LRU 中，重复上传与出题都无需重新解析；
+- 文件何时可以删除由引用计数决定：数据清理任务统计仍在使用它的会话数，
+  计数为 0 且超过宽限期的文件连同解析缓存一起回收（见
+  :func:`src.retention.collect_unreferenced_uploads`）。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List
+
+from .knowledge_loader import (
+    MAX_KNOWLEDGE_FILE_SIZE,
+    KnowledgeEntry,
+    load_knowledge_entries,
+)
+from .utils.file_lock import atomic_write_text
+
+CHUNK_SIZE = 64 * 1024
+PARSE_CACHE_DIR = ".parsed"
+
+_STORED_NAME = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+
+
+class UploadTooLarge(ValueError):
+    """上传内容超过大小上限"""
+
+
+@dataclass
+class StoredUpload:
+    """一次上传的保存结果"""
+
+    filename: str
+    path: Path
+    size: int
+    created: bool  # False 表示相同内容此前已上传，复用了已有文件
+
+
+def parse_cache_path(upload_path: Path) -> Path:
+    """上传文件对应的解析缓存路径"""
+    return upload_path.parent / PARSE_CACHE_DIR / f"{upload_path.name}.json"
+
+
+class UploadStore:
+    """按内容哈希保存上传文件，并缓存解析结果"""
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        max_bytes: int = MAX_KNOWLEDGE_FILE_SIZE,
+        cache_size: int = 32,
+    ) -> None:
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    def save(self, stream: BinaryIO, suffix: str) -> StoredUpload:
+        """边写入临时文件边计算哈希，再以哈希命名；内容已存在时复用"""
+        tmp = self.root / f".upload-{uuid.uuid4().hex}.tmp"
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with tmp.open("wb") as handle:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise UploadTooLarge(
+                            f"文件过大，最大支持 {self.max_bytes // 1024}KB"
+                        )
+                    digest.update(chunk)
+                    handle.write(chunk)
+            filename = f"{digest.hexdigest()}{suffix.lower()}"
+            path = self.root / filename
+            if path.exists():
+                os.utime(path)  # 重新开始回收宽限期
+                return StoredUpload(filename, path, size, created=False)
+            # 并发上传相同内容时各自原子替换，结果一致
+            os.replace(tmp, path)
+            return StoredUpload(filename, path, size, created=True)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    def entries(self, path: Path) -> List[KnowledgeEntry]:
+        """加载知识条目；内容寻址的上传文件使用解析缓存"""
+        if not _STORED_NAME.match(path.name) or path.parent.resolve() != (
+            self.root.resolve()
+        ):
+            return load_knowledge_entries(path)
+        if not path.exists():
+            raise FileNotFoundError(f"知识文件不存在：{path}")
+
+        with self._lock:
+            payload = self._cache.get(path.name)
+            if payload is not None:
+                self._cache.move_to_end(path.name)
+        if payload is None:
+            payload = self._read_parse_cache(path)
+        if payload is None:
+            payload = [asdict(entry) for entry in load_knowledge_entries(path)]
+            cache_path = parse_cache_path(path)
+            cache_path.parent.mkdir(exist_ok=True)
+            atomic_write_text(cache_path, json.dumps(payload, ensure_ascii=False))
+        with self._lock:
+            self._cache[path.name] = payload
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        # 每次返回新的对象，调用方修改条目不会影响缓存
+        return [
+            KnowledgeEntry(
+                component=item["component"],
+                raw_text=item["raw_text"],
+                sentences=list(item.get("sentences", [])),
+            )
+            for item in payload
+        ]
+
+    def discard(self, path: Path) -> None:
+        """删除上传文件及其解析缓存"""
+        path.unlink(missing_ok=True)
+        parse_cache_path(path).unlink(missing_ok=True)
+        with self._lock:
+            self._cache.pop(path.name, None)
+
+    @staticmethod
+    def _read_parse_cache(path: Path) -> List[Dict[str, Any]] | None:
+        try:
+            payload = json.loads(parse_cache_path(path).read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return payload if isinstance(payload, list) else None
+
+
+__all__ = [
+    "PARSE_CACHE_DIR",
+    "StoredUpload",
+    "UploadStore",
+    "UploadTooLarge",
+    "parse_cache_path",
+]
@@ -0,0 +1,25 @@
+"""不透明分页游标的编码与解码"""
+
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, Dict
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """将位置信息编码为 URL 安全的游标字符串"""
+    raw = json.dumps(position, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    """解码游标，格式不合法时抛出 ValueError"""
+    padded = token + "=" * (-len(token) % 4)
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as exc:
+        raise ValueError("无效的分页游标") from exc
+    if not isinstance(payload, dict):
+        raise ValueError("无效的分页游标")
+    return payload
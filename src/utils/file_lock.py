@@ -0,0 +1,84 @@
+"""跨进程文件锁
+
+多个 worker 进程共享同一个 ``data/`` 目录时，错题本的读-改-写、历史分段
+清单的更新都必须互斥。这里使用 ``fcntl.flock`` 咨询锁；同一进程内的线程
+再由 ``RLock`` 互斥，并允许同一线程重入。不支持 ``fcntl`` 的平台（Windows）
+退化为仅进程内互斥。
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+
+    HAS_FCNTL = True
+except ImportError:  # pragma: no cover - Windows
+    HAS_FCNTL = False
+
+
+class FileLock:
+    """可重入的跨进程排他锁"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> None:
+        self._thread_lock.acquire()
+        if self._depth == 0 and HAS_FCNTL:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
+
+
+def pid_alive(pid: int) -> bool:
+    """进程是否仍在运行（用于判断日志、任务的属主进程是否已退出）"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:  # pragma: no cover - Windows 上无效的 PID
+        return False
+    return True
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """先写临时文件再原子替换，读者不会看到写了一半的内容"""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+__all__ = ["FileLock", "HAS_FCNTL", "atomic_write_text", "pid_alive"]
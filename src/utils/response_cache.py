@@ -0,0 +1,68 @@
+"""按数据版本缓存的接口响应
+
+看板类接口被频繁轮询，而底层数据很少变化。数据存储提供廉价的版本标识
+（``generation``），以 ``(端点, 查询参数, 版本)`` 为键：
+
+- 由键导出强 ETag，客户端带 ``If-None-Match`` 且版本未变时直接返回 304；
+- 进程内 LRU 缓存已序列化的响应体，同一版本的重复请求不再重新计算。
+
+数据写入后版本改变，旧版本的条目不会再被命中，随 LRU 淘汰。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from ..monitoring.metrics import AppMetrics
+
+CacheKey = Tuple[Hashable, ...]
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+def make_etag(key: CacheKey) -> str:
+    """由缓存键导出 ETag 值（不含引号）"""
+    return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+
+
+class ResponseCache:
+    """线程安全的 LRU 响应体缓存"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[CacheKey, bytes]" = OrderedDict()
+
+    def get(self, key: CacheKey) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+        if body is not None:
+            AppMetrics.response_cache_hits.inc()
+        else:
+            AppMetrics.response_cache_misses.inc()
+        return body
+
+    def put(self, key: CacheKey, body: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+__all__ = ["DEFAULT_MAX_ENTRIES", "ResponseCache", "make_etag"]
@@ -0,0 +1,538 @@
+"""会话存储后端
+
+:class:`~src.utils.session_manager.SessionManager` 负责 TTL 与并发控制，
+会话数据与最近访问时间交给后端保存：
+
+- :class:`MemoryBackend`：进程内字典，直接保存对象（默认）；
+- :class:`FileBackend`：每个会话一个 JSON 文件，延迟合并写出（单进程部署）；
+- :class:`SQLiteBackend`：SQLite WAL 数据库，多个 worker 进程共享同一份
+  会话，``gunicorn -w N`` 时任意 worker 都能处理同一会话的请求。
+
+需要序列化的后端通过 ``encode``/``decode`` 在会话对象与 JSON 之间转换。
+
+``save(..., check_version=True)`` 要求会话自本线程上次读取后未被改写，
+否则抛出 :class:`SessionConflictError`。进程内后端由会话锁保证这一点；
+SQLite 后端用版本列做比较并交换，防止多个 worker 重复处理同一次提交。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
+
+from ..monitoring.metrics import AppMetrics
+from ..session_store import SessionStore, estimate_size
+
+Session = Dict[str, Any]
+Codec = Callable[[Session], Session]
+
+
+class SessionConflictError(RuntimeError):
+    """会话在读取之后已被其他进程改写"""
+
+    def __init__(self, session_id: str) -> None:
+        super().__init__(f"会话 {session_id} 已被其他请求修改")
+        self.session_id = session_id
+
+
+def _identity(session: Session) -> Session:
+    return session
+
+
+def _summary(session: Session, last_access: float) -> Session:
+    return {
+        "created_at": session.get("created_at"),
+        "updated_at": session.get("updated_at") or last_access,
+        "filepath": session.get("filepath"),
+    }
+
+
+class SessionBackend(ABC):
+    """会话存储后端基类"""
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Tuple[Session, float]]:
+        """读取会话及其最近访问时间，不存在时返回 None"""
+
+    @abstractmethod
+    def save(
+        self,
+        session_id: str,
+        session: Session,
+        last_access: float,
+        *,
+        check_version: bool = False,
+    ) -> None:
+        """保存（新建或覆盖）会话
+
+        ``check_version`` 时若会话在本线程读取后已被改写，抛出
+        :class:`SessionConflictError`（进程内后端由会话锁串行化，无需检查）。
+        """
+
+    @abstractmethod
+    def touch(self, session_id: str, last_access: float) -> None:
+        """只更新最近访问时间"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """删除会话，返回会话此前是否存在"""
+
+    @abstractmethod
+    def access_times(self) -> Dict[str, float]:
+        """所有会话的最近访问时间"""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """删除全部会话"""
+
+    def expired(self, cutoff: float) -> List[str]:
+        """最近访问时间早于 ``cutoff`` 的会话（默认逐个比较，子类可利用索引）"""
+        return [
+            session_id
+            for session_id, last_access in self.access_times().items()
+            if last_access < cutoff
+        ]
+
+    def count(self) -> int:
+        return len(self.access_times())
+
+    def summaries(self) -> Dict[str, Session]:
+        """各会话的创建/活动时间与知识文件（供数据清理任务使用）"""
+        result: Dict[str, Session] = {}
+        for session_id, last_access in self.access_times().items():
+            loaded = self.load(session_id)
+            if loaded is not None:
+                result[session_id] = _summary(loaded[0], last_access)
+        return result
+
+    def flush(self) -> None:
+        """写出缓冲中的修改（无缓冲的后端无需处理）"""
+
+    def bind_session_lock(
+        self, session_lock: Callable[[str], ContextManager[Any]]
+    ) -> None:
+        """登记会话锁；延迟写出的后端在锁内编码会话（其他后端无需处理）"""
+
+
+class MemoryBackend(SessionBackend):
+    """进程内字典后端
+
+    会话按最近访问排序（``OrderedDict``，访问时移到末尾）。所有会话共用
+    同一个 TTL，最前面的会话总是最先过期，清理时只需从头弹出已过期的
+    部分；超过 ``max_sessions`` 或 ``max_bytes`` 时从头淘汰最久未访问的会话。
+    字节数在保存时按 :func:`~src.session_store.estimate_size` 估算。
+    """
+
+    def __init__(
+        self, *, max_sessions: Optional[int] = None, max_bytes: Optional[int] = None
+    ) -> None:
+        # session_id -> [会话, 最近访问时间, 估算字节数]
+        self._entries: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def load(self, session_id: str) -> Optional[Tuple[Session, float]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        return entry[0], entry[1]
+
+    def save(
+        self,
+        session_id: str,
+        session: Session,
+        last_access: float,
+        *,
+        check_version: bool = False,
+    ) -> None:
+        size = estimate_size(session)
+        with self._lock:
+            previous = self._entries.pop(session_id, None)
+            if previous is not None:
+                self.total_bytes -= previous[2]
+            self._entries[session_id] = [session, last_access, size]
+            self.total_bytes += size
+            self._evict()
+        AppMetrics.session_memory_bytes.set(self.total_bytes)
+
+    def touch(self, session_id: str, last_access: float) -> None:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry[1] = last_access
+                self._entries.move_to_end(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is None:
+                return False
+            self.total_bytes -= entry[2]
+        AppMetrics.session_memory_bytes.set(self.total_bytes)
+        return True
+
+    def access_times(self) -> Dict[str, float]:
+        with self._lock:
+            return {session_id: entry[1] for session_id, entry in self._entries.items()}
+
+    def expired(self, cutoff: float) -> List[str]:
+        # 按访问顺序排列，遇到第一个未过期的会话即可停止
+        result = []
+        with self._lock:
+            for session_id, entry in self._entries.items():
+                if entry[1] >= cutoff:
+                    break
+                result.append(session_id)
+        return result
+
+    def count(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+        AppMetrics.session_memory_bytes.set(0)
+
+    def _evict(self) -> None:
+        """超出上限时淘汰最久未访问的会话（调用方持有锁，至少保留刚保存的会话）"""
+        while len(self._entries) > 1 and (
+            (self.max_sessions is not None and len(self._entries) > self.max_sessions)
+            or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry[2]
+            self.evictions += 1
+            AppMetrics.session_evictions_total.inc()
+
+
+class FileBackend(SessionBackend):
+    """每个会话一个文件的后端（见 :class:`~src.session_store.SessionStore`）
+
+    最近访问时间只保存在进程内，重启后以文件修改时间为准。
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        encode: Codec = _identity,
+        decode: Codec = _identity,
+        flush_delay: Optional[float] = None,
+        legacy_path: Optional[Path] = None,
+        max_cached: Optional[int] = None,
+        max_cached_bytes: Optional[int] = None,
+        cache_idle_seconds: Optional[float] = None,
+    ) -> None:
+        options: Dict[str, Any] = {"encode": encode, "decode": decode}
+        if flush_delay is not None:
+            options["flush_delay"] = flush_delay
+        if cache_idle_seconds is not None:
+            # 0 表示不按闲置时间淘汰
+            options["cache_idle_seconds"] = cache_idle_seconds or None
+        self.store = SessionStore(
+            root,
+            legacy_path=legacy_path,
+            max_cached=max_cached,
+            max_cached_bytes=max_cached_bytes,
+            **options,
+        )
+        self._access_times: Dict[str, float] = {}
+
+    def load(self, session_id: str) -> Optional[Tuple[Session, float]]:
+        try:
+            session = self.store[session_id]
+        except KeyError:
+            return None
+        return session, self._last_access(session_id)
+
+    def save(
+        self,
+        session_id: str,
+        session: Session,
+        last_access: float,
+        *,
+        check_version: bool = False,
+    ) -> None:
+        # 写入缓存并标记为脏，由 SessionStore 延迟合并写出
+        self.store[session_id] = session
+        self._access_times[session_id] = last_access
+
+    def touch(self, session_id: str, last_access: float) -> None:
+        self._access_times[session_id] = last_access
+
+    def delete(self, session_id: str) -> bool:
+        self._access_times.pop(session_id, None)
+        return self.store.pop(session_id, None) is not None
+
+    def access_times(self) -> Dict[str, float]:
+        return {session_id: self._last_access(session_id) for session_id in self.store}
+
+    def count(self) -> int:
+        return len(self.store)
+
+    def clear(self) -> None:
+        self.store.clear()
+        self._access_times.clear()
+
+    def summaries(self) -> Dict[str, Session]:
+        return self.store.summaries()
+
+    def flush(self) -> None:
+        self.store.flush()
+
+    def bind_session_lock(
+        self, session_lock: Callable[[str], ContextManager[Any]]
+    ) -> None:
+        self.store.session_lock = session_lock
+
+    def _last_access(self, session_id: str) -> float:
+        last_access = self._access_times.get(session_id)
+        if last_access is None:
+            try:
+                last_access = (self.store.root / f"{session_id}.json").stat().st_mtime
+            except FileNotFoundError:
+                last_access = time.time()
+            self._access_times[session_id] = last_access
+        return last_access
+
+
+_SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        last_access REAL NOT NULL,
+        created_at REAL,
+        updated_at REAL,
+        filepath TEXT,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access);
+"""
+
+
+DEFAULT_TOUCH_INTERVAL = 5.0  # 秒
+# 每个线程记住最近读取过的会话版本，供随后的比较并交换写入使用
+_SEEN_VERSIONS_KEPT = 64
+
+
+class SQLiteBackend(SessionBackend):
+    """SQLite WAL 后端，多个进程共享会话
+
+    每次读取都从数据库反序列化，写入立即提交，不在进程内缓存会话。
+    读取后的访问时间更新距上次不足 ``touch_interval`` 秒时跳过，只读请求
+    不必每次都写库；TTL 因此最多提前 ``touch_interval`` 秒到期。
+    每次保存递增 ``version`` 列，``check_version`` 时按读取到的版本做
+    条件更新。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        encode: Codec = _identity,
+        decode: Codec = _identity,
+        touch_interval: float = DEFAULT_TOUCH_INTERVAL,
+    ) -> None:
+        self.path = path
+        self._encode = encode
+        self._decode = decode
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SQLITE_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+            if "version" not in columns:
+                # 旧版数据库没有版本列
+                conn.execute(
+                    "ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+                )
+
+    def load(self, session_id: str) -> Optional[Tuple[Session, float]]:
+        row = (
+            self._connect()
+            .execute(
+                "SELECT data, last_access, version FROM sessions WHERE id = ?",
+                (session_id,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        self._remember(session_id, row[1], row[2])
+        return self._decode(json.loads(row[0])), row[1]
+
+    def save(
+        self,
+        session_id: str,
+        session: Session,
+        last_access: float,
+        *,
+        check_version: bool = False,
+    ) -> None:
+        data = json.dumps(self._encode(session), ensure_ascii=False)
+        summary = (
+            session.get("created_at"),
+            session.get("updated_at"),
+            session.get("filepath"),
+        )
+        seen = self._seen().pop(session_id, None)
+        with self._connect() as conn:
+            if check_version and seen is not None:
+                cursor = conn.execute(
+                    """
+                    UPDATE sessions SET
+                        data = ?, last_access = ?, created_at = ?, updated_at = ?,
+                        filepath = ?, version = version + 1
+                    WHERE id = ? AND version = ?
+                    """,
+                    (data, last_access, *summary, session_id, seen[1]),
+                )
+                if cursor.rowcount == 0:
+                    raise SessionConflictError(session_id)
+                self._remember(session_id, last_access, seen[1] + 1)
+                return
+            conn.execute(
+                """
+                INSERT INTO sessions (id, data, last_access, created_at, updated_at, filepath)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    data = excluded.data,
+                    last_access = excluded.last_access,
+                    created_at = excluded.created_at,
+                    updated_at = excluded.updated_at,
+                    filepath = excluded.filepath,
+                    version = sessions.version + 1
+                """,
+                (session_id, data, last_access, *summary),
+            )
+
+    def touch(self, session_id: str, last_access: float) -> None:
+        seen = self._seen().get(session_id)
+        if seen is not None and last_access - seen[0] < self.touch_interval:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE sessions SET last_access = ? WHERE id = ?",
+                (last_access, session_id),
+            )
+        if seen is not None:
+            self._remember(session_id, last_access, seen[1])
+
+    def delete(self, session_id: str) -> bool:
+        self._seen().pop(session_id, None)
+        with self._connect() as conn:
+            cursor = conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            return cursor.rowcount > 0
+
+    def access_times(self) -> Dict[str, float]:
+        return dict(self._connect().execute("SELECT id, last_access FROM sessions"))
+
+    def expired(self, cutoff: float) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT id FROM sessions WHERE last_access < ?", (cutoff,)
+        )
+        return [session_id for (session_id,) in rows]
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions")
+
+    def summaries(self) -> Dict[str, Session]:
+        # 摘要字段单独成列，无需反序列化会话数据
+        rows = self._connect().execute(
+            "SELECT id, last_access, created_at, updated_at, filepath FROM sessions"
+        )
+        return {
+            session_id: {
+                "created_at": created_at,
+                "updated_at": updated_at or last_access,
+                "filepath": filepath,
+            }
+            for session_id, last_access, created_at, updated_at, filepath in rows
+        }
+
+    def _seen(self) -> Dict[str, Tuple[float, int]]:
+        """本线程最近读取的会话：会话 ID -> (访问时间, 版本)"""
+        seen = getattr(self._local, "seen", None)
+        if seen is None:
+            seen = self._local.seen = {}
+        return seen
+
+    def _remember(self, session_id: str, last_access: float, version: int) -> None:
+        seen = self._seen()
+        seen.pop(session_id, None)
+        seen[session_id] = (last_access, version)
+        while len(seen) > _SEEN_VERSIONS_KEPT:
+            del seen[next(iter(seen))]
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程复用一个连接；``with conn`` 负责提交或回滚事务"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+def _env_int(name: str) -> Optional[int]:
+    raw = os.environ.get(name, "").strip()
+    return int(raw) if raw and raw != "0" else None
+
+
+def create_session_backend(
+    kind: Optional[str] = None,
+    *,
+    data_dir: Path = Path("data"),
+    encode: Codec = _identity,
+    decode: Codec = _identity,
+) -> SessionBackend:
+    """按名称（默认读取 ``SESSION_BACKEND``）创建后端：memory/file/sqlite"""
+    kind = (kind or os.environ.get("SESSION_BACKEND") or "file").strip().lower()
+    max_entries = _env_int("SESSION_CACHE_MAX_ENTRIES")
+    max_bytes = _env_int("SESSION_CACHE_MAX_BYTES")
+    if kind == "memory":
+        return MemoryBackend(max_sessions=max_entries, max_bytes=max_bytes)
+    if kind == "file":
+        flush_delay = os.environ.get("SESSION_FLUSH_DELAY")
+        idle_seconds = os.environ.get("SESSION_CACHE_IDLE_SECONDS")
+        return FileBackend(
+            data_dir / "sessions",
+            encode=encode,
+            decode=decode,
+            flush_delay=float(flush_delay) if flush_delay else None,
+            legacy_path=data_dir / "sessions.json",
+            max_cached=max_entries,
+            max_cached_bytes=max_bytes,
+            cache_idle_seconds=float(idle_seconds) if idle_seconds else None,
+        )
+    if kind == "sqlite":
+        path = Path(os.environ.get("SESSION_DB_PATH") or data_dir / "sessions.db")
+        return SQLiteBackend(path, encode=encode, decode=decode)
+    raise ValueError(f"未知的会话后端: {kind}（可选 memory/file/sqlite）")
+
+
+__all__ = [
+    "FileBackend",
+    "MemoryBackend",
+    "SQLiteBackend",
+    "SessionBackend",
+    "SessionConflictError",
+    "create_session_backend",
+]
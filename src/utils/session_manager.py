@@ -1,29 +1,58 @@
-"""会话管理工具（包含线程安全和 TTL）"""
+"""会话管理工具（包含线程安全和 TTL）
+
+并发控制分两层：
+
+- 分段锁：按会话 ID 的哈希把会话分到 ``lock_stripes`` 个分段，单个会话的
+  读取、过期检查与写回只锁住所在分段，不同分段的请求完全并行；
+- 会话锁：:meth:`SessionManager.session_lock` 持有该会话专属的可重入锁，
+  请求在持锁期间完成“读取-修改-写回”，同一会话的重复提交被串行化，
+  而其他会话不受影响。会话锁按引用计数登记，最后一个持有者退出时即移除，
+  锁表大小只取决于同时持锁的请求数，与客户端发来过多少会话 ID 无关。
+"""
 
 from __future__ import annotations
 
 import threading
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
+from .session_backends import MemoryBackend, SessionBackend
 
-class SessionManager:
-    """线程安全的会话管理器，支持 TTL"""
+DEFAULT_LOCK_STRIPES = 64
 
-    def __init__(self, ttl_seconds: int = 3600) -> None:
+
+class SessionManager:
+    """线程安全的会话管理器，支持 TTL 与可替换的存储后端"""
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3600,
+        backend: Optional[SessionBackend] = None,
+        *,
+        lock_stripes: int = DEFAULT_LOCK_STRIPES,
+    ) -> None:
         """
         初始化会话管理器
 
         Args:
             ttl_seconds: 会话过期时间（秒），默认 1 小时
+            backend: 存储后端，默认进程内存（见 ``session_backends``）
+            lock_stripes: 分段锁的数量
         """
-        self._sessions: Dict[str, Dict[str, Any]] = {}
-        self._access_times: Dict[str, float] = {}
-        self._lock = threading.RLock()
+        self._backend = backend or MemoryBackend()
+        self._stripes = [threading.RLock() for _ in range(max(1, lock_stripes))]
+        # 会话 ID -> [会话锁, 持有或等待该锁的请求数]，见 _SessionLock
+        self._session_locks: List[Dict[str, List[Any]]] = [{} for _ in self._stripes]
         self._ttl = ttl_seconds
+        # 延迟写出的后端在会话锁内编码，不会读到请求修改到一半的会话
+        self._backend.bind_session_lock(self.session_lock)
         self._cleanup_thread: Optional[threading.Thread] = None
         self._stop_cleanup = threading.Event()
 
+    @property
+    def backend(self) -> SessionBackend:
+        return self._backend
+
     def start_cleanup_thread(self) -> None:
         """启动后台清理线程"""
         if self._cleanup_thread is not None:
@@ -46,107 +75,184 @@ class SessionManager:
         self._cleanup_thread.join(timeout=2)
         self._cleanup_thread = None
 
+    def session_lock(self, session_id: str) -> "_SessionLock":
+        """返回会话专属的锁，持有期间对该会话的读-改-写不会与其他请求交错"""
+        return _SessionLock(self, session_id)
+
     def get(self, session_id: str) -> Optional[Dict[str, Any]]:
         """获取会话数据"""
-        with self._lock:
-            if session_id not in self._sessions:
+        with self._stripe(session_id):
+            loaded = self._backend.load(session_id)
+            if loaded is None:
                 return None
 
             # 检查是否过期
-            if self._is_expired(session_id):
+            session, last_access = loaded
+            now = time.time()
+            if self._is_expired(last_access, now):
                 self._remove_session(session_id)
                 return None
 
             # 更新访问时间
-            self._access_times[session_id] = time.time()
-            return self._sessions[session_id]
+            self._backend.touch(session_id, now)
+            return session
 
-    def set(self, session_id: str, data: Dict[str, Any]) -> None:
-        """设置会话数据"""
-        with self._lock:
-            self._sessions[session_id] = data
-            self._access_times[session_id] = time.time()
+    def set(
+        self, session_id: str, data: Dict[str, Any], *, check_version: bool = False
+    ) -> None:
+        """设置会话数据（修改 ``get`` 返回的会话后也需调用以持久化）
+
+        ``check_version`` 时要求会话自本线程 ``get`` 之后未被其他进程改写，
+        否则抛出 :class:`~.session_backends.SessionConflictError`。
+        """
+        with self._stripe(session_id):
+            self._backend.save(
+                session_id, data, time.time(), check_version=check_version
+            )
 
     def update(self, session_id: str, data: Dict[str, Any]) -> bool:
         """更新会话数据（如果存在且未过期）"""
-        with self._lock:
-            if session_id not in self._sessions:
-                return False
-
-            if self._is_expired(session_id):
-                self._remove_session(session_id)
+        with self._stripe(session_id):
+            session = self.get(session_id)
+            if session is None:
                 return False
 
-            self._sessions[session_id].update(data)
-            self._access_times[session_id] = time.time()
+            session.update(data)
+            self._backend.save(session_id, session, time.time())
             return True
 
     def delete(self, session_id: str) -> bool:
         """删除会话"""
-        with self._lock:
-            if session_id in self._sessions:
-                self._remove_session(session_id)
-                return True
-            return False
+        with self._stripe(session_id):
+            return self._remove_session(session_id)
 
     def exists(self, session_id: str) -> bool:
         """检查会话是否存在且未过期"""
-        with self._lock:
-            if session_id not in self._sessions:
-                return False
-
-            if self._is_expired(session_id):
-                self._remove_session(session_id)
-                return False
-
-            return True
+        return self.get(session_id) is not None
 
     def get_all(self) -> Dict[str, Dict[str, Any]]:
-        """获取所有会话（仅用于序列化）"""
-        with self._lock:
-            # 清理过期会话
-            self.cleanup_expired()
-            return self._sessions.copy()
+        """获取所有未过期的会话（仅用于序列化，不触发清理）"""
+        now = time.time()
+        sessions = {}
+        for session_id, last_access in self._backend.access_times().items():
+            if self._is_expired(last_access, now):
+                continue
+            loaded = self._backend.load(session_id)
+            if loaded is not None:
+                sessions[session_id] = loaded[0]
+        return sessions
 
     def load_all(self, sessions: Dict[str, Dict[str, Any]]) -> None:
         """加载所有会话（仅用于反序列化）"""
-        with self._lock:
-            self._sessions = sessions.copy()
-            now = time.time()
-            for session_id in self._sessions:
-                self._access_times[session_id] = now
+        self.clear()
+        now = time.time()
+        for session_id, session in sessions.items():
+            with self._stripe(session_id):
+                self._backend.save(session_id, session, now)
+
+    def clear(self) -> None:
+        """删除全部会话"""
+        # 按固定顺序获取全部分段锁，避免与单分段操作死锁
+        for stripe in self._stripes:
+            stripe.acquire()
+        try:
+            self._backend.clear()
+        finally:
+            for stripe in reversed(self._stripes):
+                stripe.release()
+
+    def summaries(self) -> Dict[str, Dict[str, Any]]:
+        """各会话的活动时间与知识文件（供数据清理任务使用）"""
+        return self._backend.summaries()
+
+    def flush(self) -> None:
+        """写出后端缓冲中的修改"""
+        self._backend.flush()
 
     def cleanup_expired(self) -> int:
         """清理过期会话，返回清理数量"""
-        with self._lock:
-            expired_ids = [
-                session_id
-                for session_id in self._sessions
-                if self._is_expired(session_id)
-            ]
-
-            for session_id in expired_ids:
-                self._remove_session(session_id)
+        # 后端按访问顺序或索引只返回已过期的会话，无需扫描全部会话
+        candidates = self._backend.expired(time.time() - self._ttl)
 
-            if expired_ids:
-                print(f"🗑️  清理了 {len(expired_ids)} 个过期会话")
+        expired_ids = []
+        for session_id in candidates:
+            # 只锁住所在分段，并在锁内复查（期间可能刚被访问过）
+            with self._stripe(session_id):
+                loaded = self._backend.load(session_id)
+                if loaded is not None and self._is_expired(loaded[1], time.time()):
+                    self._remove_session(session_id)
+                    expired_ids.append(session_id)
 
-            return len(expired_ids)
+        if expired_ids:
+            print(f"🗑️  清理了 {len(expired_ids)} 个过期会话")
+
+        return len(expired_ids)
 
     def count(self) -> int:
         """获取当前会话数量"""
-        with self._lock:
-            return len(self._sessions)
+        return self._backend.count()
+
+    def _stripe_index(self, session_id: str) -> int:
+        return hash(session_id) % len(self._stripes)
+
+    def _stripe(self, session_id: str) -> threading.RLock:
+        return self._stripes[self._stripe_index(session_id)]
+
+    def _remove_session(self, session_id: str) -> bool:
+        """移除会话（调用方需持有所在分段的锁）
 
-    def _is_expired(self, session_id: str) -> bool:
+        会话锁仍由持有者登记，持有者退出时自行移除，不会出现同一会话两把锁。
+        """
+        return self._backend.delete(session_id)
+
+    def _is_expired(self, last_access: float, now: float) -> bool:
         """检查会话是否过期"""
-        last_access = self._access_times.get(session_id)
-        if last_access is None:
-            return True
+        return (now - last_access) > self._ttl
+
 
-        return (time.time() - last_access) > self._ttl
+class _SessionLock:
+    """会话锁的句柄：获取时登记引用，释放后无人引用即从锁表移除
 
-    def _remove_session(self, session_id: str) -> None:
-        """移除会话（内部方法，不加锁）"""
-        self._sessions.pop(session_id, None)
-        self._access_times.pop(session_id, None)
+    同一会话的所有句柄共用锁表中的同一把可重入锁，可用作上下文管理器，
+    也可像 ``threading.RLock`` 一样调用 ``acquire``/``release``。
+    """
+
+    __slots__ = ("_manager", "_session_id", "_index")
+
+    def __init__(self, manager: SessionManager, session_id: str) -> None:
+        self._manager = manager
+        self._session_id = session_id
+        self._index = manager._stripe_index(session_id)
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        with self._manager._stripes[self._index]:
+            locks = self._manager._session_locks[self._index]
+            entry = locks.get(self._session_id)
+            if entry is None:
+                entry = locks[self._session_id] = [threading.RLock(), 0]
+            entry[1] += 1
+        if entry[0].acquire(blocking, timeout):
+            return True
+        self._unref()
+        return False
+
+    def release(self) -> None:
+        with self._manager._stripes[self._index]:
+            entry = self._manager._session_locks[self._index][self._session_id]
+        entry[0].release()
+        self._unref()
+
+    def __enter__(self) -> "_SessionLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
+
+    def _unref(self) -> None:
+        with self._manager._stripes[self._index]:
+            locks = self._manager._session_locks[self._index]
+            entry = locks[self._session_id]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del locks[self._session_id]
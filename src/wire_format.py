@@ -0,0 +1,90 @@
+"""答题接口的精简传输格式（移动端）
+
+完整格式每题都下发 ``explanation``（常为整段知识原文）、``answer_text`` 与
+``correct_options``，在移动网络下占去大部分流量。请求体带 ``"compact": true``
+时，答题接口改用精简格式：
+
+- 字段名缩短（见 :data:`COMPACT_KEYS`），``None`` 与空列表省略；
+- 题目只含题干、选项等公开字段，答案在提交后随判分结果返回；
+- 知识解析与关键词不随题目下发，答题后按题目 ID 单独获取；
+- 题型以 ``single`` / ``multi`` / ``cloze`` / ``qa`` 表示。
+
+响应压缩与格式无关，由 ``Accept-Encoding`` 协商（见 :func:`gzip_json`）。
+"""
+
+from __future__ import annotations
+
+import gzip
+from typing import Any, Dict, Optional
+
+from .question_models import QuestionType
+
+# 完整字段名 -> 精简字段名；映射为 None 的字段在精简格式中省略
+COMPACT_KEYS: Dict[str, Optional[str]] = {
+    # 题目
+    "identifier": "id",
+    "question_type": "t",
+    "prompt": "p",
+    "options": "o",
+    "component": "c",
+    "keywords": None,
+    "correct_options": None,
+    "answer_text": None,
+    "explanation": "e",
+    # 会话与判分
+    "question": "q",
+    "questions": "qs",
+    "question_id": "id",
+    "index": "i",
+    "current_index": "i",
+    "total_count": "n",
+    "correct_count": "cc",
+    "finished": "f",
+    "pending": "w",
+    "is_correct": "r",
+    "correct_answer": "a",
+    "next_available": "nx",
+    "results": "rs",
+    "success": None,
+}
+
+TYPE_CODES: Dict[str, str] = {
+    QuestionType.SINGLE_CHOICE.name: "single",
+    QuestionType.MULTI_CHOICE.name: "multi",
+    QuestionType.CLOZE.name: "cloze",
+    QuestionType.QA.name: "qa",
+}
+
+# 小于该字节数的响应不压缩（压缩收益抵不上 gzip 头与 CPU 开销）
+GZIP_MIN_BYTES = 512
+
+
+def compact(value: Any) -> Any:
+    """把完整格式的响应转换为精简格式
+
+    只改写字段名与题型，不会补上或去掉答案：题目的答案字段由
+    :data:`COMPACT_KEYS` 省略，调用方仍应传入不含答案的公开题目。
+    """
+    if isinstance(value, list):
+        return [compact(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    result: Dict[str, Any] = {}
+    for key, item in value.items():
+        short = COMPACT_KEYS.get(key, key)
+        if short is None or item is None or item == []:
+            continue
+        if key == "question_type":
+            item = TYPE_CODES.get(item, item)
+        result[short] = compact(item)
+    return result
+
+
+def gzip_json(body: bytes, accept_encoding: float) -> Optional[bytes]:
+    """客户端接受 gzip（``accept_encoding`` 为其质量值）且响应足够大时返回压缩后的内容"""
+    if accept_encoding <= 0 or len(body) < GZIP_MIN_BYTES:
+        return None
+    return gzip.compress(body, compresslevel=6)
+
+
+__all__ = ["COMPACT_KEYS", "GZIP_MIN_BYTES", "TYPE_CODES", "compact", "gzip_json"]
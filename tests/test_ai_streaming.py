@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+AI 流式出题测试脚本
+使用本地 HTTP 服务模拟 OpenAI 兼容接口的流式响应（无需真实 AI 接口）
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.ai_client import AIClient, AIConfig, IncrementalJSONArray  # noqa: E402
+from src.hybrid_generation import generate_with_deadline  # noqa: E402
+from src.knowledge_loader import KnowledgeEntry  # noqa: E402
+from src.question_models import Question, QuestionType  # noqa: E402
+
+QUESTIONS = [
+    {
+        "type": "single",
+        "prompt": "限速器应多久校验一次？",
+        "options": ["每年", "从不"],
+        "answer": 0,
+    },
+    {"type": "qa", "prompt": '说明 "安全钳" 的作用 {简述}', "answer": "制停轿厢"},
+    {
+        "type": "multi",
+        "prompt": "制动器检查项目",
+        "options": ["间隙", "磨损", "颜色"],
+        "answer": [0, 1],
+    },
+]
+
+
+class _FakeAIHandler(BaseHTTPRequestHandler):
+    stream_seen = []
+    sent_before_pause = threading.Event()
+    resume = threading.Event()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.stream_seen.append(payload.get("stream"))
+        text = "```json\n" + json.dumps(QUESTIONS, ensure_ascii=False) + "\n```"
+        if self.path == "/plain":
+            body = {"choices": [{"message": {"content": text}}]}
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        # 第一题之后暂停，验证客户端无需等待完整响应即可拿到第一题
+        first_end = text.index("}", text.index("限速器")) + 1
+        for start in range(0, len(text), 7):
+            chunk = text[start : start + 7]
+            event = {"choices": [{"delta": {"content": chunk}}]}
+            self.wfile.write(
+                f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+            )
+            self.wfile.flush()
+            if start <= first_end < start + 7:
+                self.sent_before_pause.set()
+                self.resume.wait(timeout=5)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve():
+    server = HTTPServer(("127.0.0.1", 0), _FakeAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_incremental_array_parser():
+    """测试任意切分的文本能逐个解析出完整对象"""
+    text = '前言 {"questions": ' + json.dumps(QUESTIONS, ensure_ascii=False) + "}"
+    for size in (1, 5, 64):
+        parser = IncrementalJSONArray()
+        items = []
+        for start in range(0, len(text), size):
+            items.extend(parser.feed(text[start : start + size]))
+        assert items == QUESTIONS, size
+    print("✓ 增量 JSON 数组解析")
+
+
+def test_stream_questions_yields_before_response_ends():
+    """测试流式请求在响应结束前即返回第一题，并兼容非流式响应"""
+    server = _serve()
+    base = f"http://127.0.0.1:{server.server_port}"
+    entries = [KnowledgeEntry(component="限速器", raw_text="限速器应每年校验。")]
+    types = list(QuestionType)
+    try:
+        client = AIClient(AIConfig(key="k", url=f"{base}/stream", model="m", timeout=5))
+        stream = client.stream_questions(entries, count=3, question_types=types)
+        first = next(stream)
+        assert first.prompt == "限速器应多久校验一次？"
+        assert _FakeAIHandler.sent_before_pause.is_set()
+        _FakeAIHandler.resume.set()
+        rest = list(stream)
+        assert [q.question_type for q in rest] == [
+            QuestionType.QA,
+            QuestionType.MULTI_CHOICE,
+        ]
+        assert rest[1].correct_options == [0, 1]
+
+        plain = AIClient(AIConfig(key="k", url=f"{base}/plain", model="m", timeout=5))
+        limited = list(plain.stream_questions(entries, count=2, question_types=types))
+        assert len(limited) == 2
+        assert _FakeAIHandler.stream_seen == [True, True]
+    finally:
+        server.shutdown()
+    print("✓ AI 流式出题")
+
+
+def _question(prompt):
+    return Question(
+        identifier=prompt,
+        question_type=QuestionType.QA,
+        prompt=prompt,
+        answer_text="答案",
+    )
+
+
+def test_hybrid_generation_deadline():
+    """测试截止时间内取已到达的 AI 题目，不足部分由本地题目补齐"""
+    local = [_question("AI1")] + [_question(f"本地{i}") for i in range(10)]
+
+    def slow_ai():
+        for index in range(10):
+            time.sleep(0.05 if index < 2 else 5)
+            yield _question(f"AI{index}")
+
+    started = time.monotonic()
+    result = generate_with_deadline(
+        count=5, deadline=0.3, local=lambda: local, ai_stream=slow_ai
+    )
+    assert time.monotonic() - started < 1.0, "耗时应受截止时间约束"
+    assert result.timed_out and (result.ai_count, result.local_count) == (2, 3)
+    assert [q.prompt for q in result.questions] == [
+        "AI0",
+        "AI1",
+        "本地0",
+        "本地1",
+        "本地2",
+    ], "AI 题目优先，与 AI 重复的本地题目被跳过"
+
+    def failing_ai():
+        yield _question("AI0")
+        raise ConnectionError("AI 接口不可用")
+
+    result = generate_with_deadline(
+        count=3, deadline=5, local=lambda: local, ai_stream=failing_ai
+    )
+    assert not result.timed_out and result.ai_error == "AI 接口不可用"
+    assert [q.prompt for q in result.questions] == ["AI0", "AI1", "本地0"]
+
+    def broken_ai():
+        raise ConnectionError("AI 未配置")
+
+    # 创建流时就失败也应立即结束，不等到截止时间
+    started = time.monotonic()
+    result = generate_with_deadline(
+        count=2, deadline=5, local=lambda: local, ai_stream=broken_ai
+    )
+    assert time.monotonic() - started < 1.0
+    assert result.ai_error == "AI 未配置" and result.local_count == 2
+
+    def fast_ai():
+        return iter([_question(f"AI{i}") for i in range(10)])
+
+    result = generate_with_deadline(
+        count=4, deadline=5, local=lambda: local, ai_stream=fast_ai
+    )
+    assert result.local_count == 0 and result.ai_count == 4
+    unlimited = generate_with_deadline(count=0, deadline=5, local=lambda: local)
+    assert len(unlimited.questions) == 11
+    print("✓ 限时混合出题")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+后台任务队列测试脚本
+测试任务执行与进度汇报、排队上限以及重启后接管遗留任务（无需启动服务器）
+"""
+
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.job_queue import JobManager, JobQueueConfig, JobQueueFull  # noqa: E402
+
+
+def _wait_for(manager, job_id, state, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job["state"] == state:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"任务未进入 {state} 状态: {manager.get(job_id)}")
+
+
+def test_progress_partial_results_and_limits():
+    """测试进度与部分结果可轮询、排队上限与失败任务"""
+    step = threading.Event()
+    release = threading.Event()
+
+    def generate(params, job):
+        job.report(0, params["count"])
+        for index in range(params["count"]):
+            job.add_partial([f"q{index}"])
+            job.report(index + 1)
+            if index == 0:
+                step.set()
+                release.wait(timeout=5)
+        return {"count": params["count"]}
+
+    def broken(params, job):
+        raise ValueError("知识文件为空")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = JobManager(
+            Path(tmp),
+            {"generate": generate, "broken": broken},
+            JobQueueConfig(workers=1, max_queued=1),
+        )
+        first = manager.submit("generate", {"count": 3})
+        assert first["state"] == "queued" and "owner" not in first
+        assert step.wait(timeout=5)
+
+        running = manager.get(first["id"])
+        assert running["state"] == "running"
+        assert running["progress"] == {"completed": 1, "total": 3}
+        assert running["partial_results"] == ["q0"]
+
+        # 唯一的工作线程忙碌时只能再排队一个任务
+        second = manager.submit("broken", {})
+        try:
+            manager.submit("generate", {"count": 1})
+        except JobQueueFull:
+            pass
+        else:
+            raise AssertionError("超过排队上限时应拒绝提交")
+
+        release.set()
+        done = _wait_for(manager, first["id"], "succeeded")
+        assert done["result"] == {"count": 3}
+        assert done["partial_results"] == ["q0", "q1", "q2"]
+        failed = _wait_for(manager, second["id"], "failed")
+        assert failed["error"] == "知识文件为空"
+        assert manager.queued() == 0
+
+        # 其他进程（此处以新的管理器模拟）可从文件查询任务
+        other = JobManager(Path(tmp), {})
+        assert other.get(first["id"])["state"] == "succeeded"
+        assert other.get("../etc/passwd") is None
+        manager.stop()
+
+    print("✓ 任务进度轮询与排队上限")
+
+
+def test_recover_jobs_of_dead_process():
+    """测试重启后接管已退出进程的未完成任务"""
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        base = {
+            "kind": "generate",
+            "params": {"count": 2},
+            "progress": {"completed": 1, "total": 2},
+            "partial_results": ["旧结果"],
+            "result": None,
+            "error": None,
+            "updated_at": time.time(),
+            "owner": dead.pid,
+        }
+        jobs = {
+            "a" * 32: {"state": "running", "created_at": 1.0},
+            "b" * 32: {"state": "queued", "created_at": 2.0},
+            "c" * 32: {"state": "succeeded", "created_at": 0.0, "updated_at": 0.0},
+        }
+        for job_id, fields in jobs.items():
+            job = {**base, "id": job_id, **fields}
+            (root / f"{job_id}.json").write_text(json.dumps(job), encoding="utf-8")
+
+        order = []
+
+        def generate(params, job):
+            order.append(job.job_id)
+            job.add_partial(["新结果"])
+            return {"count": params["count"]}
+
+        manager = JobManager(root, {"generate": generate}, JobQueueConfig(workers=1))
+        manager.start()
+        for job_id in ("a" * 32, "b" * 32):
+            job = _wait_for(manager, job_id, "succeeded")
+            assert job["partial_results"] == ["新结果"], "中断的任务应从头执行"
+        assert order == ["a" * 32, "b" * 32]
+        assert not (root / f"{'c' * 32}.json").exists(), "过期的已结束任务应删除"
+        manager.stop()
+
+    print("✓ 重启后接管遗留任务")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+多进程记录压力测试
+多个进程同时写入同一个 data 目录，验证历史、题目目录与错题本不丢不坏
+"""
+
+import multiprocessing
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.history_writer import HistoryWriterConfig  # noqa: E402
+from src.question_models import Question, QuestionType  # noqa: E402
+from src.record_manager import RecordManager  # noqa: E402
+
+PROCESSES = 6
+ATTEMPTS_PER_PROCESS = 90
+SHARED_QUESTIONS = 10
+
+
+def _question(identifier: str, variant: int) -> Question:
+    return Question(
+        identifier=identifier,
+        question_type=QuestionType.CLOZE,
+        prompt=f"安全钳动作后必须____（{variant}）",
+        answer_text="复位",
+        explanation="安全钳动作后需人工复位。",
+        keywords=["复位"],
+    )
+
+
+def _worker(data_dir: str, worker_id: int) -> None:
+    manager = RecordManager(
+        Path(data_dir),
+        writer_config=HistoryWriterConfig(max_batch_size=8, flush_interval=0.005),
+    )
+    for index in range(ATTEMPTS_PER_PROCESS):
+        shared = _question(
+            f"安全钳-CZ-{index % SHARED_QUESTIONS}", index % SHARED_QUESTIONS
+        )
+        manager.log_attempt(
+            session_id=f"worker-{worker_id}",
+            question=shared,
+            user_answer="复位",
+            is_correct=True,
+            plain_explanation="",
+        )
+        own = _question(f"w{worker_id}-{index}", index)
+        manager.upsert_wrong_question(own, last_plain_explanation="")
+        if index % 3 == 2:
+            manager.remove_wrong_question(f"w{worker_id}-{index - 1}")
+    manager.close()
+
+
+def test_concurrent_writers_share_data_dir():
+    """测试多个进程并发写入同一数据目录"""
+    with tempfile.TemporaryDirectory() as tmp:
+        context = multiprocessing.get_context("spawn")
+        workers = [
+            context.Process(target=_worker, args=(tmp, worker_id))
+            for worker_id in range(PROCESSES)
+        ]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join(timeout=120)
+            assert process.exitcode == 0, f"子进程异常退出: {process.exitcode}"
+
+        manager = RecordManager(Path(tmp))
+        expected_rows = PROCESSES * ATTEMPTS_PER_PROCESS
+        records = list(manager.history_store.iter_records())
+        assert (
+            len(records) == expected_rows
+        ), f"历史行数 {len(records)} != {expected_rows}"
+        assert manager.history_store.total_rows() == expected_rows, "清单行数不一致"
+        assert len({record["id"] for record in records}) == expected_rows
+
+        assert len(manager.question_catalog) == SHARED_QUESTIONS, "题目目录出现重复"
+        result = manager.query_answer_history(page=1, page_size=1)
+        assert result["entries"][0]["question"]["answer_text"] == "复位"
+
+        removed_per_worker = ATTEMPTS_PER_PROCESS // 3
+        expected_wrong = PROCESSES * (ATTEMPTS_PER_PROCESS - removed_per_worker)
+        stats = manager.get_wrong_question_stats()
+        assert (
+            stats["total_wrong"] == expected_wrong
+        ), f"错题数 {stats['total_wrong']} != {expected_wrong}"
+
+    print(f"✓ {PROCESSES} 个进程并发写入无丢失")
+
+
+if __name__ == "__main__":
+    try:
+        test_concurrent_writers_share_data_dir()
+    except AssertionError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
@@ -0,0 +1,1144 @@
+#!/usr/bin/env python3
+"""
+答题记录存储测试脚本
+测试批量写入、历史查询等 RecordManager 存储功能（无需启动服务器）
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.analytics import (  # noqa: E402
+    HAS_NUMPY,
+    AnalyticsSnapshotManager,
+    _concat_rows,
+    extract_rows,
+)
+from src.database.importer import RecordImporter  # noqa: E402
+from src.database.migrations import rollback_latest, run_migrations  # noqa: E402
+from src.history_export import gzip_stream, iter_csv, iter_ndjson  # noqa: E402
+from src.history_scanner import HistoryScanner  # noqa: E402
+from src.history_store import HistoryStore, _lines_backwards  # noqa: E402
+from src.history_writer import (  # noqa: E402
+    BatchedHistoryWriter,
+    FsyncPolicy,
+    HistoryWriteError,
+    HistoryWriterConfig,
+)
+from src.question_models import Question, QuestionType  # noqa: E402
+from src.record_manager import RecordManager, _question_to_dict  # noqa: E402
+from src.retention import collect_unreferenced_uploads  # noqa: E402
+from src.retention import select_expired_sessions  # noqa: E402
+from src.task_journal import DurableTaskQueue  # noqa: E402
+
+
+def _make_question(index: int = 1) -> Question:
+    return Question(
+        identifier=f"限速器-SC-{index}",
+        question_type=QuestionType.SINGLE_CHOICE,
+        prompt=f"关于限速器，以下哪项描述是正确的？（{index}）",
+        options=["A 选项", "B 选项", "C 选项", "D 选项"],
+        correct_options=[1],
+        answer_text="B 选项",
+        explanation="限速器动作速度应定期校验。",
+    )
+
+
+def _log(manager: RecordManager, index: int, *, session_id: str = "s1") -> None:
+    manager.log_attempt(
+        session_id=session_id,
+        question=_make_question(index),
+        user_answer="A",
+        is_correct=index % 2 == 0,
+        plain_explanation="说明",
+    )
+
+
+def test_batched_writer_flushes_on_read():
+    """测试批量写入的记录在查询前被写出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        config = HistoryWriterConfig(max_batch_size=16, flush_interval=5.0)
+        manager = RecordManager(Path(tmp), writer_config=config)
+        for index in range(40):
+            _log(manager, index)
+
+        result = manager.query_answer_history(page=1, page_size=100)
+        assert result["pagination"]["total"] == 40, result["pagination"]
+        manager.close()
+
+    print("✓ 批量写入记录可被立即查询")
+
+
+def test_batched_writer_flushes_on_close():
+    """测试关闭时写出队列中剩余的记录"""
+    with tempfile.TemporaryDirectory() as tmp:
+        config = HistoryWriterConfig(
+            max_batch_size=1000, flush_interval=30.0, fsync_policy=FsyncPolicy.NONE
+        )
+        manager = RecordManager(Path(tmp), writer_config=config)
+        for index in range(25):
+            _log(manager, index)
+        manager.close()
+
+        records = list(manager.history_store.iter_records())
+        assert len(records) == 25, f"期望 25 条，实际 {len(records)}"
+        assert all(record["session_id"] == "s1" for record in records)
+
+    print("✓ 关闭时待写记录全部落盘")
+
+
+def test_fsync_always_is_synchronous():
+    """测试 always 策略下提交返回时记录已写出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        config = HistoryWriterConfig(
+            flush_interval=0.01, fsync_policy=FsyncPolicy.ALWAYS
+        )
+        manager = RecordManager(Path(tmp), writer_config=config)
+        _log(manager, 1)
+        assert manager._writer is not None and manager._writer.pending() == 0
+        assert manager.history_store.segments()[0]["rows"] == 1
+        manager.close()
+
+    print("✓ always 策略同步落盘")
+
+
+def test_writer_retries_failed_batches():
+    """测试写出失败的批次保留重试，flush 报告失败"""
+    written = []
+    failing = threading.Event()
+    failing.set()
+
+    def sink(records, fsync):
+        if failing.is_set():
+            raise OSError("磁盘已满")
+        written.extend(records)
+
+    config = HistoryWriterConfig(flush_interval=0.01, retry_interval=0.05)
+    writer = BatchedHistoryWriter(sink, config)
+    writer.submit_many([1, 2, 3])
+    try:
+        writer.flush(timeout=5)
+    except HistoryWriteError:
+        pass
+    else:
+        raise AssertionError("写出失败时 flush 应抛出 HistoryWriteError")
+    assert writer.pending() == 3 and written == []
+
+    failing.clear()
+    writer.submit(4)
+    assert writer.flush(timeout=5)
+    assert written == [1, 2, 3, 4] and writer.pending() == 0
+    writer.close()
+
+    print("✓ 写出失败的批次保留重试")
+
+
+def test_history_references_question_catalog():
+    """测试历史记录引用题目目录且查询时补回完整题目"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = RecordManager(Path(tmp))
+        question = _make_question(1)
+        question.explanation = "限速器原文。" * 500
+        for _ in range(50):
+            manager.log_attempt(
+                session_id="s1",
+                question=question,
+                user_answer="A",
+                is_correct=False,
+                plain_explanation="说明",
+            )
+
+        assert len(manager.question_catalog) == 1, "同一题目只应写入一次"
+        raw = [json.dumps(r) for r in manager.history_store.iter_records()]
+        assert all("question_ref" in r and '"explanation"' not in r for r in raw)
+        catalog_size = manager.question_catalog.path.stat().st_size
+        history_size = manager.history_store.segments()[0]["bytes"]
+        assert history_size * 10 < catalog_size * 50, "历史行不应包含题目全文"
+
+        result = manager.query_answer_history(
+            page=1, page_size=5, question_type=QuestionType.SINGLE_CHOICE
+        )
+        assert result["pagination"]["total"] == 50
+        entry = result["entries"][0]
+        assert entry["question"]["explanation"] == question.explanation
+        assert entry["question"]["identifier"] == question.identifier
+
+    print("✓ 历史记录通过哈希引用题目目录")
+
+
+def test_history_cursor_pagination():
+    """测试游标分页逐页读取且不重复、不遗漏"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = RecordManager(Path(tmp))
+        for index in range(23):
+            _log(manager, index, session_id="s1" if index % 3 else "s2")
+
+        seen = []
+        cursor = ""
+        while True:
+            result = manager.query_answer_history(
+                page_size=5, session_id="s1", cursor=cursor, include_total=False
+            )
+            assert "total" not in result["pagination"]
+            seen.extend(entry["id"] for entry in result["entries"])
+            cursor = result["pagination"]["next_cursor"]
+            if not cursor:
+                break
+
+        expected = manager.query_answer_history(page=1, page_size=100, session_id="s1")
+        assert len(seen) == len(set(seen)) == expected["pagination"]["total"] == 15
+        first = manager.query_answer_history(page_size=3, cursor="", include_total=True)
+        assert first["pagination"]["total"] == 23
+        assert first["entries"][0]["question"]["identifier"] == "限速器-SC-22"
+
+        try:
+            manager.query_answer_history(cursor="!!not-a-cursor")
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("非法游标应抛出 ValueError")
+
+    print("✓ 作答历史游标分页正确")
+
+
+def test_wrong_questions_cursor_pagination():
+    """测试错题列表游标分页"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = RecordManager(Path(tmp))
+        for index in range(12):
+            manager.upsert_wrong_question(
+                _make_question(index), last_plain_explanation="说明"
+            )
+
+        identifiers = []
+        cursor = ""
+        while True:
+            result = manager.get_wrong_questions_paginated(
+                page_size=5, sort_by="identifier", order="asc", cursor=cursor
+            )
+            identifiers.extend(
+                entry["question"]["identifier"] for entry in result["questions"]
+            )
+            cursor = result["pagination"]["next_cursor"]
+            if not cursor:
+                break
+
+        assert identifiers == sorted(identifiers) and len(identifiers) == 12
+
+    print("✓ 错题列表游标分页正确")
+
+
+def _history_line(timestamp: str, index: int) -> str:
+    entry = {
+        "timestamp": timestamp,
+        "session_id": f"s{index % 3}",
+        "question": {"identifier": f"限速器-SC-{index % 5}", "prompt": "题干" * 20},
+        "user_answer": "A",
+        "is_correct": index % 2 == 0,
+    }
+    return json.dumps(entry, ensure_ascii=False) + "\n"
+
+
+def test_history_segments_by_day():
+    """测试按天分段、压缩旧段与按时间跳过分段"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(Path(tmp) / "history")
+        for day in (1, 2, 3):
+            records = [
+                (f"2026-01-0{day}T08:00:{i % 60:02d}Z", _history_line("", i))
+                for i in range(100)
+            ]
+            store.append(records)
+
+        segments = store.segments()
+        assert [s["day"] for s in segments] == [
+            "2026-01-01",
+            "2026-01-02",
+            "2026-01-03",
+        ]
+        assert [s["compressed"] for s in segments] == [True, True, False]
+        assert all(s["rows"] == 100 for s in segments)
+
+        selected = store.select_segments(
+            date_from=datetime(2026, 1, 2, tzinfo=timezone.utc),
+            date_to=datetime(2026, 1, 2, 23, 59, tzinfo=timezone.utc),
+        )
+        assert [s["day"] for s in selected] == ["2026-01-02"]
+        assert len(list(store.iter_records())) == 300
+
+        # 重新打开后清单保持一致
+        reopened = HistoryStore(Path(tmp) / "history")
+        assert len(list(reopened.iter_records())) == 300
+
+    print("✓ 历史按天分段并跳过范围外分段")
+
+
+def test_legacy_history_migration():
+    """测试旧版单文件历史迁移并显著压缩"""
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        legacy = data_dir / "answer_history.jsonl"
+        with legacy.open("w", encoding="utf-8") as handle:
+            for i in range(3000):
+                handle.write(_history_line(f"2026-02-{1 + i // 1000:02d}T10:00:00Z", i))
+        legacy_size = legacy.stat().st_size
+
+        manager = RecordManager(data_dir)
+        assert not legacy.exists(), "旧文件应在迁移后删除"
+        result = manager.query_answer_history(page=1, page_size=10)
+        assert result["pagination"]["total"] == 3000
+
+        compressed = sum(
+            s["bytes"] for s in manager.history_store.segments() if s["compressed"]
+        )
+        closed_size = sum(
+            s["compressed_bytes"]
+            for s in manager.history_store.segments()
+            if s["compressed"]
+        )
+        assert closed_size * 10 < compressed, (closed_size, compressed, legacy_size)
+
+    print("✓ 旧版历史迁移并压缩")
+
+
+def test_legacy_migration_survives_crash():
+    """测试迁移中途或删除旧文件前崩溃后重新迁移不会重复记录"""
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        legacy = data_dir / "answer_history.jsonl"
+        legacy.write_text(
+            "".join(
+                _history_line(f"2026-02-0{1 + i % 3}T10:00:00Z", i) for i in range(30)
+            ),
+            encoding="utf-8",
+        )
+        stat = legacy.stat()
+        content = legacy.read_bytes()
+
+        # 上次迁移在暂存目录中途崩溃：残留的暂存段不会被发布
+        staging = data_dir / "history" / ".migrating"
+        staging.mkdir(parents=True)
+        (staging / "2026-02-01.jsonl").write_text(
+            _history_line("", 0), encoding="utf-8"
+        )
+        store = HistoryStore(data_dir / "history", legacy_path=legacy)
+        assert store.total_rows() == 30
+        assert not legacy.exists() and not staging.exists()
+
+        # 清单已写出但旧文件未删除：再次启动只删除旧文件
+        legacy.write_bytes(content)
+        os.utime(legacy, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        store = HistoryStore(data_dir / "history", legacy_path=legacy)
+        assert store.total_rows() == 30
+        assert len(list(store.iter_records())) == 30
+        assert not legacy.exists()
+
+    print("✓ 旧版历史迁移可在崩溃后安全重试")
+
+
+def test_late_records_keep_time_order():
+    """测试迟到的记录并入活动段后仍按时间顺序读取"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(Path(tmp) / "history")
+
+        def line(timestamp: str) -> Tuple[str, str]:
+            return timestamp, json.dumps({"timestamp": timestamp}) + "\n"
+
+        store.append([line("2026-03-01T09:00:00Z"), line("2026-03-01T18:00:00Z")])
+        store.append([line("2026-03-02T09:00:00Z"), line("2026-03-02T10:00:00Z")])
+        # 两条迟到记录：一条属于活动段当天，一条早于前一个段的最后一条
+        store.append([line("2026-03-02T08:00:00Z"), line("2026-03-01T12:00:00Z")])
+        assert store.segments()[-1]["unordered"]
+
+        forward = [record["timestamp"] for record in store.iter_records()]
+        assert forward == sorted(forward) and len(forward) == 6
+        backward = [record["timestamp"] for record in store.iter_records(reverse=True)]
+        assert backward == forward[::-1]
+
+    print("✓ 迟到记录不打乱读取顺序")
+
+
+def test_reverse_read_stops_at_cursor():
+    """测试有序段从末尾按块倒读，游标上界内的记录不多不少"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(Path(tmp) / "history")
+        lines = []
+        for day in (1, 2):  # 第 1 天的段关闭后被压缩，第 2 天为未压缩的活动段
+            for index in range(300):
+                timestamp = (
+                    f"2026-03-0{day}T09:{index // 60:02d}:{index % 60 // 2:02d}Z"
+                )
+                entry = {
+                    "timestamp": timestamp,
+                    "n": index,
+                    "说明": "限速器" * (index % 7),
+                }
+                lines.append((timestamp, json.dumps(entry, ensure_ascii=False) + "\n"))
+        store.append(lines[:300])
+        store.append(lines[300:])
+        assert [segment["compressed"] for segment in store.segments()] == [True, False]
+
+        forward = list(store.iter_records())
+        assert list(store.iter_records(reverse=True)) == forward[::-1]
+        for bound in (
+            "2026-03-02T09:02:07Z",  # 段内有同一时间戳的两条记录
+            "2026-03-02T09:02:59Z",  # 落在两条记录之间
+            "2026-03-01T23:00:00Z",  # 早于活动段的全部记录
+            "2026-03-01T09:00:00Z",
+            "2026-03-01T08:00:00Z",
+            "2026-03-03T00:00:00Z",
+        ):
+            expected = [r for r in forward if r["timestamp"] <= bound][::-1]
+            got = list(store.iter_records(reverse=True, max_timestamp=bound))
+            assert got == expected, bound
+
+        # 按块倒读时，跨块的行（含多字节字符）被完整拼接
+        path = Path(tmp) / "lines.jsonl"
+        path.write_bytes(b"".join(line.encode("utf-8") for _, line in lines[:50]))
+        with path.open("rb") as handle:
+            backwards = [
+                line + b"\n"
+                for line in _lines_backwards(handle, path.stat().st_size, block_size=7)
+                if line
+            ]
+        assert backwards == [line.encode("utf-8") for _, line in lines[:50]][::-1]
+
+    print("✓ 倒序读取按块进行并在游标处截止")
+
+
+def test_analytics_snapshot_aggregations():
+    """测试列式快照的分组正确率、按周分桶与持久化"""
+    if not HAS_NUMPY:
+        print("- 未安装 NumPy，跳过分析快照测试")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        history = HistoryStore(data_dir / "history")
+        # 2026-01-05 为周一；前 7 天一周、后 7 天一周
+        history.append(
+            [
+                (
+                    f"2026-01-{5 + i % 14:02d}T08:00:00Z",
+                    _history_line(f"2026-01-{5 + i % 14:02d}T08:00:00Z", i),
+                )
+                for i in range(140)
+            ]
+        )
+        manager = RecordManager(data_dir)
+        snapshots = AnalyticsSnapshotManager(manager)
+        snapshot = snapshots.get()
+        assert len(snapshot) == 140
+
+        by_component = snapshot.accuracy_by("component")
+        assert by_component == [
+            {"component": "限速器", "total": 140, "correct": 70, "accuracy": 0.5}
+        ]
+        assert sum(snapshot.count_by("session").values()) == 140
+
+        weeks = snapshot.time_buckets("week")
+        assert [row["bucket"] for row in weeks] == ["2026-01-05", "2026-01-12"]
+        assert [row["total"] for row in weeks] == [70, 70]
+
+        first_day = snapshot.time_buckets(
+            "day",
+            date_from=datetime(2026, 1, 5, tzinfo=timezone.utc),
+            date_to=datetime(2026, 1, 5, 23, 59, tzinfo=timezone.utc),
+        )
+        assert [row["total"] for row in first_day] == [10]
+
+        reloaded = AnalyticsSnapshotManager(manager).get()
+        assert reloaded.built_at == snapshot.built_at
+        assert reloaded.dictionaries == snapshot.dictionaries
+
+        # 过期时先返回旧快照，由后台线程重建
+        stale = AnalyticsSnapshotManager(manager, max_age_seconds=0)
+        _log(manager, 1)
+        assert len(stale.get()) == 140
+        deadline = time.time() + 5
+        while len(stale.get()) != 141 and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(stale.get()) == 141, "后台重建应纳入新记录"
+
+        # 清空后写入同样多的记录：行数不变，但数据版本变了
+        manager.clear_answer_history()
+        manager.history_store.append(
+            [
+                ("2026-02-01T08:00:00Z", _history_line("2026-02-01T08:00:00Z", i))
+                for i in range(141)
+            ]
+        )
+        # 清空与写入之间可能先重建出空快照，等到重建纳入新记录为止
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            weeks = stale.get().time_buckets("week")
+            if [row["bucket"] for row in weeks] == ["2026-01-26"]:
+                break
+            time.sleep(0.01)
+        assert [row["bucket"] for row in weeks] == ["2026-01-26"], "行数相同也应重建"
+
+    print("✓ 列式快照聚合")
+
+
+def test_parallel_scanner_matches_sequential_read():
+    """测试并行扫描按换行切块，结果与顺序读取一致"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(Path(tmp) / "history")
+        for day in (1, 2):
+            store.append(
+                [
+                    (
+                        f"2026-03-0{day}T09:{i // 60:02d}:{i % 60:02d}Z",
+                        _history_line(
+                            f"2026-03-0{day}T09:{i // 60:02d}:{i % 60:02d}Z", i
+                        ),
+                    )
+                    for i in range(400)
+                ]
+            )
+
+        scanner = HistoryScanner(
+            store, workers=2, chunk_bytes=4096, parallel_threshold=0
+        )
+        tasks = scanner.plan()
+        assert len(tasks) > 2, "未压缩的当天段应被切成多块"
+        assert tasks[0].compressed and not tasks[-1].compressed
+        assert tasks[0].estimated_bytes == store.segments()[0]["bytes"]
+        small = HistoryScanner(store, workers=2, parallel_threshold=1 << 20)
+        assert small._run_inline(
+            small.plan()
+        ), "压缩段按原始大小估算，小数据不启动进程池"
+
+        rows = scanner.map_reduce(extract_rows, _concat_rows, [])
+        expected = extract_rows(store.iter_records())
+        assert rows == expected and len(rows) == 800
+
+        only_day_two = scanner.map_reduce(
+            extract_rows,
+            _concat_rows,
+            [],
+            date_from=datetime(2026, 3, 2, tzinfo=timezone.utc),
+        )
+        assert len(only_day_two) == 400
+
+    print("✓ 并行扫描与顺序读取一致")
+
+
+def test_wrong_question_stats_incremental():
+    """测试错题计数随增删增量维护，组件名不再从编号截取"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = RecordManager(Path(tmp))
+        hyphenated = Question(
+            identifier="T-型导轨-SC-1",
+            question_type=QuestionType.SINGLE_CHOICE,
+            prompt="题干",
+            options=["A", "B"],
+            correct_options=[0],
+            component="T-型导轨",
+        )
+        ai_question = Question(
+            identifier="AI-曳引机-2",
+            question_type=QuestionType.QA,
+            prompt="题干",
+            answer_text="答案",
+            component="曳引机",
+        )
+        for question in (hyphenated, ai_question, hyphenated):
+            manager.upsert_wrong_question(question, last_plain_explanation="说明")
+
+        stats = manager.get_wrong_question_stats()
+        assert stats["total_wrong"] == 2
+        assert stats["by_type"] == {"SINGLE_CHOICE": 1, "QA": 1}
+        assert stats["by_component"] == {"T-型导轨": 1, "曳引机": 1}
+
+        manager.remove_wrong_question("AI-曳引机-2")
+        stats = manager.get_wrong_question_stats()
+        assert stats["total_wrong"] == 1 and stats["by_component"] == {"T-型导轨": 1}
+
+        # 旧版错题本没有计数文件、题目也没有 component 字段：按编号推断并重建
+        manager.wrong_stats_path.unlink()
+        legacy = json.loads(manager.wrong_path.read_text(encoding="utf-8"))
+        legacy[0].pop("component")
+        legacy[0]["question"].pop("component")
+        legacy[0]["question"]["identifier"] = "AI-曳引机-7"
+        manager.wrong_path.write_text(json.dumps(legacy), encoding="utf-8")
+        stats = manager.get_wrong_question_stats()
+        assert stats["by_component"] == {"曳引机": 1}
+        assert manager.wrong_stats_path.exists()
+
+        # 另一进程原子替换错题本，大小与修改时间都相同：只有 inode 变了
+        before = manager.wrong_path.stat()
+        replaced = manager.wrong_path.read_text(encoding="utf-8").replace(
+            json.dumps("AI-曳引机-7"), json.dumps("AI-限速器-7")
+        )
+        staging = manager.wrong_path.with_suffix(".tmp")
+        staging.write_text(replaced, encoding="utf-8")
+        os.utime(staging, ns=(before.st_atime_ns, before.st_mtime_ns))
+        os.replace(staging, manager.wrong_path)
+        after = manager.wrong_path.stat()
+        assert (after.st_size, after.st_mtime_ns) == (
+            before.st_size,
+            before.st_mtime_ns,
+        )
+        assert manager.get_wrong_question_stats()["by_component"] == {"限速器": 1}
+
+        manager.clear_all_wrong_questions()
+        assert manager.get_wrong_question_stats()["total_wrong"] == 0
+
+    print("✓ 错题统计增量维护")
+
+
+def test_spaced_repetition_due_order():
+    """测试错题按到期先后出题，答对延长间隔、掌握后移出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = RecordManager(Path(tmp))
+        for index in range(1, 6):
+            manager.upsert_wrong_question(
+                _make_question(index), last_plain_explanation="说明"
+            )
+
+        due = manager.select_due_wrong_questions(3)
+        # 同一秒内到期的错题按编号排序
+        assert [q.identifier for q in due] == [f"限速器-SC-{i}" for i in (1, 2, 3)]
+        first = due[0].identifier
+
+        # 答对后推迟 1 天，排到最后
+        assert manager.record_wrong_question_review(first) is False
+        order = [q.identifier for q in manager.select_due_wrong_questions(5)]
+        assert order[-1] == first and len(order) == 5
+
+        entry = manager.get_wrong_question_detail(first)
+        assert entry["review"]["interval_days"] == 1
+        assert entry["review"]["repetitions"] == 1
+
+        # 再次答错：次数累加并重新立即到期
+        manager.upsert_wrong_question(_make_question(1), last_plain_explanation="说明")
+        entry = manager.get_wrong_question_detail("限速器-SC-1")
+        assert entry["wrong_count"] == 2 and entry["review"]["repetitions"] == 0
+
+        # 连续答对直至间隔达到掌握阈值
+        graduated = False
+        for _ in range(6):
+            graduated = manager.record_wrong_question_review("限速器-SC-2")
+            if graduated:
+                break
+        assert graduated
+        assert manager.get_wrong_question_detail("限速器-SC-2") is None
+        assert manager.get_wrong_question_stats()["total_wrong"] == 4
+
+        # 其他进程修改错题本后，到期堆按新文件重建
+        other = RecordManager(Path(tmp))
+        other.remove_wrong_question("限速器-SC-3")
+        remaining = {q.identifier for q in manager.select_due_wrong_questions(10)}
+        assert "限速器-SC-3" not in remaining and len(remaining) == 3
+
+        assert (
+            manager.select_due_wrong_questions(10, question_types=[QuestionType.QA])
+            == []
+        )
+
+    print("✓ 错题间隔复习调度")
+
+
+def test_sqlite_import_is_resumable():
+    """测试 JSONL → SQLite 批量导入可断点续传且不重复"""
+    import sqlite3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        manager = RecordManager(data_dir)
+        for index in range(5):
+            _log(manager, index)
+        manager.upsert_wrong_question(_make_question(1), last_plain_explanation="说明")
+        segment = (
+            manager.history_store.root / manager.history_store.segments()[-1]["name"]
+        )
+        with segment.open("a", encoding="utf-8") as handle:
+            handle.write("{损坏的行\n")
+
+        db_path = data_dir / "records.db"
+        stats = RecordImporter(data_dir, db_path, batch_size=2).run()
+        assert stats.history_rows == 5 and stats.skipped_rows == 1
+        assert stats.wrong_questions == 1
+
+        for index in range(5, 8):
+            _log(manager, index)
+        stats = RecordImporter(data_dir, db_path, batch_size=2).run()
+        assert stats.history_rows == 3, "第二次运行应只导入新增的行"
+
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT record_id) FROM answer_history"
+            ).fetchone()
+            assert rows == (8, 8)
+            prompt = conn.execute(
+                "SELECT question_prompt FROM answer_history LIMIT 1"
+            ).fetchone()[0]
+            assert prompt.startswith("关于限速器"), "题目应从题目目录联结"
+            indexes = conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index'"
+                " AND tbl_name = 'answer_history' AND name LIKE 'idx_%'"
+            ).fetchone()[0]
+            assert indexes == 7, "导入结束后应重建全部索引"
+
+    print("✓ SQLite 批量导入")
+
+
+def test_import_migration_rollback_and_reapply():
+    """测试导入迁移回滚后删除新增列，可以再次应用"""
+    import sqlite3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "records.db"
+        run_migrations(db_path)
+        rollback_latest(db_path)
+        with sqlite3.connect(db_path) as conn:
+            columns = {
+                row[1] for row in conn.execute("PRAGMA table_info(answer_history)")
+            }
+        assert not columns & {"record_id", "question_id", "question_ref"}
+
+        run_migrations(db_path)
+        with sqlite3.connect(db_path) as conn:
+            columns = {
+                row[1] for row in conn.execute("PRAGMA table_info(answer_history)")
+            }
+        assert {"record_id", "question_id", "question_ref"} <= columns
+
+    print("✓ 导入迁移可回滚并重新应用")
+
+
+def test_full_text_search():
+    """测试作答记录与题库的全文检索及索引重建"""
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = RecordManager(Path(tmp))
+        if not manager.search_index.available:
+            print("- SQLite 不支持 FTS5 trigram，跳过全文检索测试")
+            return
+        for index in range(3):
+            _log(manager, index)
+        manager.log_attempt(
+            session_id="s2",
+            question=Question(
+                identifier="曳引机-QA-1",
+                question_type=QuestionType.QA,
+                prompt="请概述曳引机的检查要求。",
+                answer_text="检查制动器",
+            ),
+            user_answer="需要检查制动器和限速器",
+            is_correct=True,
+            plain_explanation="覆盖关键点",
+        )
+
+        result = manager.search_answer_history("限速器", page_size=2)
+        assert result["pagination"]["total"] == 4
+        assert result["pagination"]["total_pages"] == 2
+        assert len(result["entries"]) == 2
+        assert all("question" in entry for entry in result["entries"])
+
+        # 不足三个字的词走 LIKE
+        assert manager.search_answer_history("制动")["pagination"]["total"] == 1
+        # 短词与长词同时出现时在 MATCH 结果上过滤
+        assert manager.search_answer_history("限速器 制动")["pagination"]["total"] == 1
+
+        # 游标分页：逐页取完且不重复，未要求时不统计总数
+        seen = []
+        cursor = ""
+        while cursor is not None:
+            result = manager.search_answer_history(
+                "限速器", page_size=3, cursor=cursor, include_total=False
+            )
+            assert "total" not in result["pagination"]
+            seen.extend(entry["id"] for entry in result["entries"])
+            cursor = result["pagination"]["next_cursor"]
+        assert len(seen) == len(set(seen)) == 4
+        first = manager.search_answer_history("限速器", page_size=3, cursor="")
+        assert first["pagination"]["total"] == 4
+        assert first["pagination"]["has_more"]
+
+        found = manager.search_questions("曳引机")
+        assert found["pagination"]["total"] == 1
+        assert found["questions"][0]["question"]["identifier"] == "曳引机-QA-1"
+
+        assert manager.rebuild_search_index() == 4
+        assert manager.search_answer_history("限速器")["pagination"]["total"] == 4
+
+    print("✓ 全文检索")
+
+
+def test_streaming_export():
+    """测试按条件流式导出 CSV/NDJSON 与 gzip 压缩"""
+    import csv
+    import gzip
+    import io
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = RecordManager(Path(tmp))
+        for index in range(5):
+            _log(manager, index, session_id="s1" if index < 3 else "s2")
+
+        records = manager.iter_answer_history(session_id="s1")
+        lines = b"".join(iter_ndjson(records)).decode("utf-8").splitlines()
+        entries = [json.loads(line) for line in lines]
+        assert len(entries) == 3
+        assert all(entry["id"] and entry["question"]["prompt"] for entry in entries)
+        assert [e["timestamp"] for e in entries] == sorted(
+            e["timestamp"] for e in entries
+        )
+
+        payload = b"".join(gzip_stream(iter_csv(manager.iter_answer_history())))
+        text = gzip.decompress(payload).decode("utf-8-sig")
+        rows = list(csv.DictReader(io.StringIO(text)))
+        assert len(rows) == 5
+        assert {row["session_id"] for row in rows} == {"s1", "s2"}
+        assert rows[0]["question_type"] == "SINGLE_CHOICE"
+
+    print("✓ 流式导出")
+
+
+def test_retention_purge():
+    """测试历史按时间/行数清理、会话淘汰与上传文件回收"""
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        store = HistoryStore(root / "history")
+        for day in (1, 2, 3):
+            stamps = [f"2026-01-0{day}T08:00:{i:02d}Z" for i in range(60)]
+            store.append([(ts, _history_line(ts, i)) for i, ts in enumerate(stamps)])
+
+        # 第 1 天整段删除，第 2 天（已压缩）重写，只保留 30 秒之后的行
+        assert store.purge(before="2026-01-02T08:00:30Z") == 90
+        segments = store.segments()
+        assert [s["rows"] for s in segments] == [30, 60]
+        assert segments[0]["name"] == "2026-01-02.001.jsonl.gz"
+        assert segments[0]["first_ts"] == "2026-01-02T08:00:30Z"
+        assert sorted(p.name for p in (root / "history").glob("*.jsonl*")) == [
+            "2026-01-02.001.jsonl.gz",
+            "2026-01-03.jsonl",
+        ]
+
+        # 行数上限：从最旧的段开始删除
+        assert store.purge(max_rows=70) == 20
+        assert [s["rows"] for s in store.segments()] == [10, 60]
+        store.append(
+            [("2026-01-03T09:00:00Z", _history_line("2026-01-03T09:00:00Z", 0))]
+        )
+        reopened = HistoryStore(root / "history")
+        assert len(list(reopened.iter_records())) == 71
+
+        manager = RecordManager(root / "data")
+        for index in range(3):
+            _log(manager, index)
+        assert (
+            manager.purge_answer_history(
+                before=datetime(2100, 1, 1, tzinfo=timezone.utc)
+            )
+            == 3
+        )
+        assert manager.query_answer_history()["pagination"]["total"] == 0
+        assert manager.search_index.attempt_count() == 0
+
+        sessions = {
+            "old": {"updated_at": 0},
+            "a": {"updated_at": 1000, "filepath": str(root / "uploads" / "a.md")},
+            "b": {"updated_at": 2000},
+        }
+        now = 1000 + 86_400 * 2
+        assert (
+            select_expired_sessions(sessions, now=now, max_age_days=3, max_count=None)
+            == []
+        )
+        assert select_expired_sessions(
+            sessions, now=now, max_age_days=1, max_count=None
+        ) == ["old", "a", "b"]
+        assert select_expired_sessions(
+            sessions, now=now, max_age_days=None, max_count=1
+        ) == ["old", "a"]
+
+        uploads = root / "uploads"
+        uploads.mkdir()
+        for name in ("a.md", "orphan.md"):
+            (uploads / name).write_text("x", encoding="utf-8")
+        removed = collect_unreferenced_uploads(
+            uploads,
+            [sessions["a"]["filepath"]],
+            now=(uploads / "orphan.md").stat().st_mtime + 25 * 3600,
+            grace_hours=24,
+        )
+        assert [p.name for p in removed] == ["orphan.md"]
+        # 宽限期内的新文件不删除
+        (uploads / "fresh.md").write_text("x", encoding="utf-8")
+        assert (
+            collect_unreferenced_uploads(
+                uploads, [], now=(uploads / "fresh.md").stat().st_mtime, grace_hours=24
+            )
+            == []
+        )
+
+    print("✓ 数据保留策略清理")
+
+
+def test_deferred_wrong_updates_replay():
+    """测试错题更新后台完成：读取前先等待，崩溃遗留的任务在重启时重放"""
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        manager = RecordManager(root, defer_wrong_updates=True)
+        for index in range(1, 21):
+            manager.record_answer_outcome(
+                _make_question(index), is_correct=False, plain_explanation="说明"
+            )
+        manager.record_answer_outcome(
+            _make_question(1), is_correct=True, plain_explanation="说明"
+        )
+        # 读取前等待已提交的更新完成
+        assert manager.get_wrong_question_stats()["total_wrong"] == 20
+        assert (
+            manager.get_wrong_question_detail("限速器-SC-1")["review"]["repetitions"]
+            == 1
+        )
+        manager.close()
+        assert not list((root / "journal").glob("*.jsonl")), "队列清空后应删除日志"
+
+        # 模拟进程崩溃：已退出进程的日志中 seq 1 已完成，2、3 未完成
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        lines = [
+            {
+                "seq": seq,
+                "kind": "answer_outcome",
+                "payload": {
+                    "question": _question_to_dict(_make_question(seq + 20)),
+                    "is_correct": False,
+                    "plain_explanation": "崩溃前",
+                },
+            }
+            for seq in (1, 2, 3)
+        ]
+        lines.append({"done": 1})
+        journal = root / "journal" / f"{dead.pid}.jsonl"
+        journal.write_text(
+            "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+            + '{"seq": 4, "ki',  # 崩溃时写了一半的行
+            encoding="utf-8",
+        )
+        restarted = RecordManager(root, defer_wrong_updates=True)
+        assert not journal.exists()
+        assert restarted.get_wrong_question_detail("限速器-SC-21") is None
+        for identifier in ("限速器-SC-22", "限速器-SC-23"):
+            entry = restarted.get_wrong_question_detail(identifier)
+            assert entry["last_plain_explanation"] == "崩溃前"
+
+        # 处理函数已写入错题本、完成标记未写出时崩溃：重放跳过已应用的作答
+        outcomes = [
+            {
+                "attempt_id": "a-22",
+                "question": _make_question(22),
+                "is_correct": False,
+                "plain_explanation": "再错",
+            },
+            {
+                "attempt_id": "a-23",
+                "question": _make_question(23),
+                "is_correct": True,
+                "plain_explanation": "说明",
+            },
+        ]
+        restarted.record_answer_outcomes(outcomes)
+        before = {
+            identifier: restarted.get_wrong_question_detail(identifier)
+            for identifier in ("限速器-SC-22", "限速器-SC-23")
+        }
+        assert before["限速器-SC-22"]["wrong_count"] == 2
+        assert before["限速器-SC-23"]["review"]["repetitions"] == 1
+        restarted.close()
+        crashed = subprocess.Popen([sys.executable, "-c", "pass"])
+        crashed.wait()
+        journal = root / "journal" / f"{crashed.pid}.jsonl"
+        journal.write_text(
+            "".join(
+                json.dumps(
+                    {
+                        "seq": seq,
+                        "kind": "answer_outcome",
+                        "payload": dict(
+                            outcome, question=_question_to_dict(outcome["question"])
+                        ),
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n"
+                for seq, outcome in enumerate(outcomes, start=1)
+            ),
+            encoding="utf-8",
+        )
+        replayed = RecordManager(root, defer_wrong_updates=True)
+        assert not journal.exists()
+        for identifier, entry in before.items():
+            after = replayed.get_wrong_question_detail(identifier)
+            assert after["wrong_count"] == entry["wrong_count"]
+            assert after["review"] == entry["review"], "重放不应再次推进复习状态"
+        replayed.close()
+
+    # 积压的同类任务合并成批交给处理函数
+    with tempfile.TemporaryDirectory() as tmp:
+        batches = []
+        release = threading.Event()
+
+        def handler(payloads):
+            release.wait(timeout=5)
+            batches.append([p["n"] for p in payloads])
+
+        tasks = DurableTaskQueue(Path(tmp), {"n": handler})
+        for n in range(10):
+            tasks.submit("n", {"n": n})
+        release.set()
+        assert tasks.flush(timeout=5) and tasks.pending() == 0
+        assert sum(batches, []) == list(range(10)) and len(batches) <= 2
+        tasks.close()
+
+    print("✓ 错题更新后台完成并可崩溃恢复")
+
+
+def test_task_journal_retry_and_dead_letter():
+    """测试后台任务失败时退避重试，仍失败则移入死信文件后才登记完成"""
+    with tempfile.TemporaryDirectory() as tmp:
+        calls = []
+
+        def flaky(payloads):
+            calls.append([p["n"] for p in payloads])
+            if len(calls) < 3:
+                raise OSError("磁盘暂时不可用")
+
+        tasks = DurableTaskQueue(Path(tmp), {"n": flaky}, retry_backoff=0.001)
+        tasks.submit("n", {"n": 1})
+        assert tasks.flush(timeout=5) and tasks.pending() == 0
+        assert calls == [[1], [1], [1]]
+        assert not tasks.dead_letter_path.exists()
+        tasks.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+
+        def broken(payloads):
+            raise ValueError("坏数据")
+
+        tasks = DurableTaskQueue(root, {"n": broken}, retry_backoff=0.001)
+        tasks.submit_many("n", [{"n": 1}, {"n": 2}])
+        assert tasks.flush(timeout=5) and tasks.pending() == 0
+        dead = [
+            json.loads(line)
+            for line in tasks.dead_letter_path.read_text(encoding="utf-8").splitlines()
+        ]
+        assert [item["payload"] for item in dead] == [{"n": 1}, {"n": 2}]
+        assert dead[0]["kind"] == "n" and dead[0]["error"] == "坏数据"
+        tasks.close()
+
+        # 遗留日志重放失败：任务进入死信文件，不会随日志一起丢失
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        journal = root / f"{exited.pid}.jsonl"
+        journal.write_text(
+            json.dumps({"seq": 1, "kind": "n", "payload": {"n": 3}}) + "\n",
+            encoding="utf-8",
+        )
+        restarted = DurableTaskQueue(root, {"n": broken}, retry_backoff=0.001)
+        restarted.start()
+        assert not journal.exists()
+        lines = restarted.dead_letter_path.read_text(encoding="utf-8").splitlines()
+        assert json.loads(lines[-1])["payload"] == {"n": 3}
+        restarted.close()
+
+    print("✓ 后台任务重试与死信")
+
+
+def test_batch_attempts_and_outcomes():
+    """测试批量提交：作答记录按序写出，整批错题更新只读写一次错题本"""
+    with tempfile.TemporaryDirectory() as tmp:
+        config = HistoryWriterConfig(
+            flush_interval=0.01, fsync_policy=FsyncPolicy.ALWAYS
+        )
+        manager = RecordManager(
+            Path(tmp), writer_config=config, defer_wrong_updates=True
+        )
+        questions = [_make_question(index) for index in range(1, 6)]
+        manager.log_attempts(
+            {
+                "session_id": "s1",
+                "question": question,
+                "user_answer": "A",
+                "is_correct": False,
+                "plain_explanation": "说明",
+            }
+            for question in questions
+        )
+        assert manager._writer.pending() == 0, "always 策略下整批返回时已写出"
+        records = list(manager.history_store.iter_records())
+        assert [r["question_id"] for r in records] == [q.identifier for q in questions]
+
+        batches = []
+        apply = manager._apply_answer_outcomes
+
+        def counting_apply(payloads):
+            batches.append(len(payloads))
+            apply(payloads)
+
+        manager._outcomes.handlers["answer_outcome"] = counting_apply
+        manager.record_answer_outcomes(
+            {"question": q, "is_correct": False, "plain_explanation": "说明"}
+            for q in questions
+        )
+        manager.record_answer_outcomes([])
+        assert manager.get_wrong_question_stats()["total_wrong"] == 5
+        assert batches == [5], batches
+        manager.close()
+
+    print("✓ 批量提交作答记录与错题更新")
+
+
+def test_data_generations():
+    """测试数据版本随写入改变、未写入时保持不变，清空后不与旧版本重复"""
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        manager = RecordManager(root, defer_wrong_updates=True)
+        assert manager.answer_history_generation() == "0"
+        assert manager.wrong_questions_generation() == "0"
+
+        _log(manager, 1)
+        manager.record_answer_outcome(
+            _make_question(1), is_correct=False, plain_explanation="说明"
+        )
+        history, wrong = (
+            manager.answer_history_generation(),
+            manager.wrong_questions_generation(),
+        )
+        assert history != "0" and wrong != "0", "读取版本前应写出待写记录"
+        manager.get_wrong_question_stats()
+        manager.query_answer_history(page=1, page_size=10)
+        assert manager.answer_history_generation() == history, "读取不改变版本"
+        assert manager.wrong_questions_generation() == wrong
+
+        _log(manager, 2)
+        manager.record_answer_outcome(
+            _make_question(2), is_correct=False, plain_explanation="说明"
+        )
+        assert manager.answer_history_generation() != history
+        assert manager.wrong_questions_generation() != wrong
+
+        # 其他进程（此处以新的实例模拟）看到相同的版本
+        other = HistoryStore(root / "history")
+        assert other.generation() == manager.answer_history_generation()
+
+        previous = manager.answer_history_generation()
+        manager.clear_answer_history()
+        _log(manager, 1)
+        assert manager.answer_history_generation() not in (previous, history)
+        manager.close()
+
+    print("✓ 数据版本随写入改变")
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+会话存储测试脚本
+测试按会话分文件持久化、延迟合并写出与旧版迁移（无需启动服务器）
+"""
+
+import json
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.session_store import SessionStore  # noqa: E402
+from src.utils.session_backends import (  # noqa: E402
+    FileBackend,
+    MemoryBackend,
+    SessionConflictError,
+    SQLiteBackend,
+)
+from src.utils.session_manager import SessionManager  # noqa: E402
+
+
+def _encode(session):
+    payload = dict(session)
+    payload["answers"] = list(payload.get("answers", []))
+    return payload
+
+
+def test_lazy_load_and_dirty_flush():
+    """测试首次访问才加载、只写出被修改的会话"""
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "sessions"
+        store = SessionStore(root, encode=_encode, flush_delay=60)
+        store["a"] = {"current_index": 0, "answers": []}
+        store["b"] = {"current_index": 0, "answers": []}
+        assert not list(root.glob("*.json")), "延迟写出前不应落盘"
+        assert store.flush() == 2
+
+        b_mtime = (root / "b.json").stat().st_mtime_ns
+        store["a"]["current_index"] = 1
+        store.mark_dirty("a")
+        assert store.flush() == 1
+        assert (root / "b.json").stat().st_mtime_ns == b_mtime
+        assert json.loads((root / "a.json").read_text())["current_index"] == 1
+
+        reopened = SessionStore(root, flush_delay=60)
+        assert not reopened._cache
+        assert "a" in reopened and "missing" not in reopened
+        assert "../a" not in reopened
+        assert reopened["a"]["current_index"] == 1
+        assert list(reopened._cache) == ["a"]
+        assert sorted(reopened) == ["a", "b"]
+
+        del reopened["b"]
+        assert not (root / "b.json").exists()
+        assert len(reopened) == 1
+
+    print("✓ 会话按需加载并只写出脏会话")
+
+
+def test_debounced_writes():
+    """测试时间窗口内的多次修改合并为一次写出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "sessions"
+        store = SessionStore(root, flush_delay=0.05)
+        store["s"] = {"count": 0}
+        for index in range(10):
+            store["s"]["count"] = index
+            store.mark_dirty("s")
+        deadline = time.time() + 2
+        while not (root / "s.json").exists() and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        assert json.loads((root / "s.json").read_text())["count"] == 9
+
+    print("✓ 延迟合并写出")
+
+
+def test_legacy_sessions_migration():
+    """测试旧版 sessions.json 拆分为单独的文件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = Path(tmp) / "sessions.json"
+        legacy.write_text(
+            json.dumps({"x1": {"filepath": "uploads/a.md"}, "x2": {}}), encoding="utf-8"
+        )
+        store = SessionStore(Path(tmp) / "sessions", legacy_path=legacy)
+        assert not legacy.exists()
+        assert sorted(store) == ["x1", "x2"]
+        summaries = store.summaries()
+        assert summaries["x1"]["filepath"] == "uploads/a.md"
+        assert summaries["x2"]["updated_at"] > 0
+        assert not store._cache, "汇总不应反序列化或缓存会话"
+
+    print("✓ 旧版会话文件迁移")
+
+
+def test_sqlite_backend_shared_between_managers():
+    """测试 SQLite 后端：不同进程（此处以两个管理器模拟）看到同一份会话"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "sessions.db"
+        worker_a = SessionManager(ttl_seconds=60, backend=SQLiteBackend(path))
+        worker_b = SessionManager(ttl_seconds=60, backend=SQLiteBackend(path))
+
+        worker_a.set("s1", {"current_index": 0, "filepath": "uploads/a.md"})
+        session = worker_b.get("s1")
+        assert session == {"current_index": 0, "filepath": "uploads/a.md"}
+        session["current_index"] = 1
+        worker_b.set("s1", session)
+        assert worker_a.get("s1")["current_index"] == 1
+        assert worker_a.summaries()["s1"]["filepath"] == "uploads/a.md"
+
+        # 读取后的访问时间更新按间隔节流
+        backend = worker_a.backend
+        accessed = backend.access_times()["s1"]
+        worker_a.get("s1")
+        assert backend.access_times()["s1"] == accessed, "间隔内不应再次写库"
+        backend.touch_interval = 0
+        worker_a.get("s1")
+        assert backend.access_times()["s1"] > accessed
+        backend.touch_interval = 5.0
+
+        # 两个 worker 读到同一版本后先后提交：后写入者被拒绝
+        first, second = worker_a.get("s1"), worker_b.get("s1")
+        second["current_index"] = 2
+        worker_b.set("s1", second, check_version=True)
+        first["current_index"] = 2
+        try:
+            worker_a.set("s1", first, check_version=True)
+        except SessionConflictError:
+            pass
+        else:
+            raise AssertionError("过期版本的提交应被拒绝")
+        retried = worker_a.get("s1")
+        assert retried["current_index"] == 2
+        retried["current_index"] = 3
+        worker_a.set("s1", retried, check_version=True)
+        assert worker_b.get("s1")["current_index"] == 3
+
+        expiring = SessionManager(ttl_seconds=0, backend=SQLiteBackend(path))
+        time.sleep(0.01)
+        assert expiring.cleanup_expired() == 1
+        assert worker_a.get("s1") is None
+        assert worker_b.count() == 0
+
+    print("✓ SQLite 会话后端跨进程共享")
+
+    # 旧版数据库没有版本列：打开时补上
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "sessions.db"
+        with sqlite3.connect(path) as conn:
+            conn.execute(
+                "CREATE TABLE sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                "last_access REAL NOT NULL, created_at REAL, updated_at REAL, "
+                "filepath TEXT)"
+            )
+            conn.execute(
+                "INSERT INTO sessions (id, data, last_access) VALUES ('old', '{}', ?)",
+                (time.time(),),
+            )
+        conn.close()
+        manager = SessionManager(ttl_seconds=60, backend=SQLiteBackend(path))
+        session = manager.get("old")
+        session["current_index"] = 1
+        manager.set("old", session, check_version=True)
+        assert manager.get("old") == {"current_index": 1}
+
+
+def test_file_backend_through_manager():
+    """测试文件后端经由 SessionManager 读写并延迟写出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "sessions"
+        manager = SessionManager(
+            ttl_seconds=60, backend=FileBackend(root, flush_delay=60)
+        )
+        manager.set("f1", {"answers": []})
+        manager.get("f1")["answers"].append("A")
+        manager.set("f1", manager.get("f1"))
+        manager.flush()
+        assert json.loads((root / "f1.json").read_text())["answers"] == ["A"]
+
+        reopened = SessionManager(ttl_seconds=60, backend=FileBackend(root))
+        assert reopened.exists("f1") and reopened.count() == 1
+        assert reopened.delete("f1") and not (root / "f1.json").exists()
+
+    print("✓ 文件会话后端")
+
+
+def test_session_locks_serialize_same_session_only():
+    """测试会话锁：同一会话的读-改-写串行，其他会话不被阻塞"""
+    manager = SessionManager(ttl_seconds=60, lock_stripes=4)
+    for session_id in ("a", "b"):
+        manager.set(session_id, {"current_index": 0, "answers": []})
+
+    def submit(session_id):
+        for _ in range(200):
+            with manager.session_lock(session_id):
+                session = manager.get(session_id)
+                index = session["current_index"]
+                time.sleep(0)  # 让出 GIL，放大竞争窗口
+                session["answers"].append(index)
+                session["current_index"] = index + 1
+                manager.set(session_id, session)
+
+    threads = [
+        threading.Thread(target=submit, args=(session_id,))
+        for session_id in ("a", "b") * 4
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for session_id in ("a", "b"):
+        session = manager.get(session_id)
+        assert session["current_index"] == 800
+        assert session["answers"] == list(range(800)), "同一题不应被重复提交"
+
+    # 持有 a 的会话锁时，b 仍可正常读写
+    acquired = threading.Event()
+    release = threading.Event()
+
+    def hold_a():
+        with manager.session_lock("a"):
+            acquired.set()
+            release.wait(timeout=5)
+
+    holder = threading.Thread(target=hold_a)
+    holder.start()
+    acquired.wait(timeout=5)
+    assert manager.session_lock("b").acquire(timeout=0.5)
+    manager.session_lock("b").release()
+    assert manager.update("b", {"done": True})
+    assert not manager.session_lock("a").acquire(timeout=0.05)
+    release.set()
+    holder.join()
+
+    manager.delete("a")
+    assert manager.get("a") is None and manager.count() == 1
+
+    # 锁表只登记正在持有或等待的会话锁，客户端乱发的会话 ID 不会留下
+    for index in range(1000):
+        with manager.session_lock(f"unknown-{index}"):
+            pass
+    assert not any(manager._session_locks)
+
+    # 持锁期间会话被删除，后来者仍等待同一把锁
+    with manager.session_lock("b"):
+        manager.delete("b")
+        blocked = []
+        waiter = threading.Thread(
+            target=lambda: blocked.append(
+                not manager.session_lock("b").acquire(timeout=0.05)
+            )
+        )
+        waiter.start()
+        waiter.join()
+        assert blocked == [True]
+    assert not any(manager._session_locks)
+
+    print("✓ 会话锁分段并行")
+
+
+def test_memory_backend_expiry_order_and_lru_cap():
+    """测试按访问顺序过期、数量/字节上限下的 LRU 淘汰"""
+    backend = MemoryBackend(max_sessions=3)
+    for index, session_id in enumerate("abcd"):
+        backend.save(session_id, {"n": index}, 100.0 + index)
+    assert backend.count() == 3 and backend.load("a") is None, "应淘汰最久未访问的 a"
+    backend.touch("b", 200.0)
+    assert backend.expired(150.0) == ["c", "d"]
+    backend.save("e", {"n": 4}, 201.0)
+    assert sorted(backend.access_times()) == ["b", "d", "e"]
+    assert backend.evictions == 2
+
+    sized = MemoryBackend(max_bytes=20_000)
+    for index in range(10):
+        sized.save(f"s{index}", {"payload": "x" * 4000}, float(index))
+    assert sized.total_bytes <= 20_000
+    assert sized.load("s9") is not None and sized.load("s0") is None
+    sized.delete("s9")
+    assert sized.total_bytes == sum(entry[2] for entry in sized._entries.values())
+
+    # 大量会话时清理只检查过期部分
+    manager = SessionManager(ttl_seconds=60, backend=MemoryBackend())
+    for index in range(100_000):
+        manager.set(f"k{index}", {})
+    started = time.perf_counter()
+    assert manager.cleanup_expired() == 0
+    assert time.perf_counter() - started < 0.05
+    assert manager.get("k5") == {}
+
+    print("✓ 会话按访问顺序过期并受内存上限约束")
+
+
+def test_file_cache_evicts_after_flush():
+    """测试文件后端缓存淘汰前先写出脏会话，之后可重新加载"""
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "sessions"
+        store = SessionStore(root, flush_delay=60, max_cached=2)
+        for session_id in ("a", "b", "c"):
+            store[session_id] = {"id": session_id}
+        assert list(store._cache) == ["a", "b", "c"], "未写出的会话不应被淘汰"
+        assert store.flush() == 3
+        assert list(store._cache) == ["b", "c"]
+        assert (root / "a.json").exists(), "被淘汰的会话应已落盘"
+        assert store["a"] == {"id": "a"}
+        assert list(store._cache) == ["c", "a"]
+        assert store.cached_bytes > 0
+        store.flush()
+
+    print("✓ 文件会话缓存淘汰")
+
+
+def test_file_cache_evicts_idle_sessions():
+    """测试闲置的会话在写出后从缓存淘汰"""
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "sessions"
+        store = SessionStore(root, flush_delay=60, cache_idle_seconds=0.05)
+        store["a"] = {"id": "a"}
+        store.flush()
+        time.sleep(0.1)
+        store["b"] = {"id": "b"}
+        store.flush()
+        assert list(store._cache) == ["b"]
+        assert store["a"] == {"id": "a"}, "淘汰后可重新加载"
+
+    print("✓ 闲置会话从缓存淘汰")
+
+
+def test_flush_encodes_under_session_lock():
+    """测试写出会话时等待会话锁，不会写出修改到一半的会话"""
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "sessions"
+        manager = SessionManager(backend=FileBackend(root, flush_delay=60))
+        manager.set("a", {"answers": []})
+        with manager.session_lock("a"):
+            session = manager.get("a")
+            session["answers"].append(1)
+            flusher = threading.Thread(target=manager.flush)
+            flusher.start()
+            flusher.join(timeout=0.2)
+            assert flusher.is_alive(), "持有会话锁期间不应编码该会话"
+            session["answers"].append(2)
+            manager.set("a", session)
+        flusher.join(timeout=5)
+        assert json.loads((root / "a.json").read_text())["answers"] == [1, 2]
+        manager.flush()
+
+    print("✓ 会话在会话锁内编码")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+上传文件存储测试脚本
+测试内容寻址去重、解析缓存与按引用计数回收（无需启动服务器）
+"""
+
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import src.upload_store as upload_store  # noqa: E402
+from src.retention import collect_unreferenced_uploads  # noqa: E402
+from src.upload_store import UploadStore, UploadTooLarge, parse_cache_path  # noqa: E402
+
+MANUAL = (
+    "# 限速器\n限速器动作速度应定期校验，安全钳应可靠动作。\n\n"
+    "# 曳引机\n曳引机制动器应每月检查，制动间隙符合要求。\n"
+).encode("utf-8")
+
+
+def test_identical_uploads_share_file_and_parse():
+    """测试相同内容只保存一份，重复上传与出题复用解析缓存"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = UploadStore(Path(tmp) / "uploads")
+        first = store.save(io.BytesIO(MANUAL), ".md")
+        assert first.created and first.size == len(MANUAL)
+        assert len(first.filename) == len("0" * 64 + ".md")
+        entries = store.entries(first.path)
+        assert entries == upload_store.load_knowledge_entries(first.path)
+        assert len(entries) == 2
+        assert parse_cache_path(first.path).exists()
+
+        parsed = []
+        original = upload_store.load_knowledge_entries
+        upload_store.load_knowledge_entries = lambda path: parsed.append(path)
+        try:
+            second = store.save(io.BytesIO(MANUAL), ".MD")
+            assert not second.created and second.filename == first.filename
+            entries[0].sentences.append("调用方修改")
+            assert "调用方修改" not in store.entries(second.path)[0].sentences
+            # 其他进程（此处以新实例模拟）使用磁盘上的解析缓存
+            other = UploadStore(Path(tmp) / "uploads")
+            assert len(other.entries(second.path)) == 2
+        finally:
+            upload_store.load_knowledge_entries = original
+        assert parsed == [], "重复上传不应重新解析"
+
+        other_content = store.save(io.BytesIO(MANUAL + b"\n"), ".md")
+        assert other_content.created and other_content.filename != first.filename
+        assert sorted(p.name for p in store.root.glob("*.md")) == sorted(
+            [first.filename, other_content.filename]
+        )
+
+        small = UploadStore(Path(tmp) / "small", max_bytes=16)
+        try:
+            small.save(io.BytesIO(MANUAL), ".md")
+        except UploadTooLarge:
+            pass
+        else:
+            raise AssertionError("超过大小上限时应拒绝")
+        assert list(small.root.iterdir()) == [], "超限的临时文件应删除"
+
+    print("✓ 相同内容上传去重并复用解析")
+
+
+def test_uploads_collected_by_reference_count():
+    """测试文件仍被任一会话引用时保留，引用计数为 0 时连同解析缓存回收"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = UploadStore(Path(tmp))
+        shared = store.save(io.BytesIO(MANUAL), ".md").path
+        store.entries(shared)
+        later = time.time() + 25 * 3600
+
+        # 40 个会话共用同一文件，只要还有一个会话就不删除
+        referenced = [str(shared)] * 40
+        assert (
+            collect_unreferenced_uploads(
+                store.root, referenced[:1], now=later, grace_hours=24
+            )
+            == []
+        )
+        removed = collect_unreferenced_uploads(
+            store.root, [], now=later, grace_hours=24
+        )
+        assert removed == [shared]
+        assert not parse_cache_path(shared).exists()
+        try:
+            store.entries(shared)
+        except FileNotFoundError:
+            pass
+        else:
+            raise AssertionError("已回收的文件不应从内存缓存返回")
+
+    print("✓ 按引用计数回收上传文件")
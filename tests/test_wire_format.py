@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+精简传输格式测试脚本
+测试移动端精简格式的字段缩写、答案省略与 gzip 协商（无需启动服务器）
+"""
+
+import gzip
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.question_models import Question, QuestionType  # noqa: E402
+from src.record_manager import _question_to_dict  # noqa: E402
+from src.wire_format import GZIP_MIN_BYTES, compact, gzip_json  # noqa: E402
+
+
+def _question() -> Question:
+    return Question(
+        identifier="称重装置-SC-1",
+        question_type=QuestionType.SINGLE_CHOICE,
+        prompt="关于称重装置，以下哪项描述是正确的？",
+        options=["超载 110% 时报警", "超载 115% 时报警"],
+        correct_options=[0],
+        answer_text="超载 110% 时报警",
+        explanation="当轿厢超载到 110% 时，系统必须发出声光报警。" * 40,
+        keywords=["110% 限值", "声光报警"],
+        component="称重装置",
+    )
+
+
+def test_compact_question_payload():
+    """测试精简格式缩短字段名并省略答案、解析与空字段"""
+    full = {
+        "finished": False,
+        "question": _question_to_dict(_question()),
+        "current_index": 1,
+        "total_count": 12,
+    }
+    short = compact(full)
+    assert short == {
+        "f": False,
+        "q": {
+            "id": "称重装置-SC-1",
+            "t": "single",
+            "p": "关于称重装置，以下哪项描述是正确的？",
+            "o": ["超载 110% 时报警", "超载 115% 时报警"],
+            "c": "称重装置",
+            "e": _question().explanation,
+        },
+        "i": 1,
+        "n": 12,
+    }, short
+
+    public = dict(full["question"])
+    for key in ("correct_options", "answer_text", "explanation"):
+        public.pop(key)
+    payload = compact({**full, "question": public})
+    encoded = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    original = json.dumps(full, ensure_ascii=False).encode("utf-8")
+    assert "a" not in payload["q"] and "e" not in payload["q"]
+    assert len(encoded) * 10 < len(original), (len(encoded), len(original))
+
+    qa = compact({"question_type": "QA", "options": [], "component": None})
+    assert qa == {"t": "qa"}
+    print("✓ 精简格式字段缩写与答案省略")
+
+
+def test_gzip_negotiation():
+    """测试仅在客户端接受且响应足够大时压缩"""
+    body = json.dumps([_question_to_dict(_question())], ensure_ascii=False).encode()
+    assert len(body) >= GZIP_MIN_BYTES
+    compressed = gzip_json(body, 1.0)
+    assert compressed is not None and gzip.decompress(compressed) == body
+    assert len(compressed) < len(body) // 4
+    assert gzip_json(body, 0) is None, "未声明 gzip 时不压缩"
+    assert gzip_json(b'{"f": true}', 1.0) is None, "小响应不压缩"
+    print("✓ gzip 压缩协商")
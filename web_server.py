@@ -1,81 +1,86 @@
 #!/usr/bin/env python3
 """Web API 服务器 - 对接答题系统后端"""
 
+import functools
 import json
+import queue
+import threading
+import time
 import uuid
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
 
 from manage_ai_config import AIConfig, delete_config
 from manage_ai_config import load_config as load_ai_config
 from manage_ai_config import save_config, test_connectivity
 from src.ai_client import AIClient, AIResponseFormatError, AITransportError
-from src.knowledge_loader import MAX_KNOWLEDGE_FILE_SIZE, load_knowledge_entries
+from src.analytics import HAS_NUMPY, AnalyticsSnapshotManager
+from src.history_export import ENCODERS, EXPORT_FORMATS, gzip_stream
+from src.history_writer import HistoryWriterConfig
+from src.hybrid_generation import deadline_from_env, generate_with_deadline
+from src.job_queue import JobContext, JobManager, JobQueueConfig, JobQueueFull
+from src.monitoring.metrics import AppMetrics, Timer, metrics
 from src.question_generator import QuestionGenerator
 from src.question_models import Question, QuestionType
 from src.record_manager import RecordManager
 from src.record_manager import _dict_to_question as dict_to_question
+from src.retention import RetentionEngine, RetentionPolicy
+from src.upload_store import UploadStore, UploadTooLarge
+from src.utils.response_cache import ResponseCache, make_etag
+from src.utils.session_backends import SessionConflictError, create_session_backend
+from src.utils.session_manager import SessionManager
+from src.wire_format import compact, gzip_json
 
 app = Flask(__name__, static_folder="frontend", static_url_path="")
 CORS(app)
 
-# 全局变量存储会话数据
-sessions: Dict[str, Dict[str, Any]] = {}
 UPLOAD_FOLDER = Path("uploads")
-UPLOAD_FOLDER.mkdir(exist_ok=True)
-SESSIONS_FILE = Path("data/sessions.json")
-SESSIONS_FILE.parent.mkdir(exist_ok=True)
+DATA_DIR = Path("data")
+DEFAULT_PRACTICE_COUNT = 20
 
-# 初始化 RecordManager
-record_manager = RecordManager()
+# 看板类接口的响应缓存：键含数据版本，数据写入后旧条目不再命中
+response_cache = ResponseCache()
+
+# 以下应用单例由 init_services() 创建。历史扫描进程池使用 spawn，子进程会以
+# __mp_main__ 重新导入本脚本；单例不在导入时创建，子进程就不会再启动写线程、
+# 重放任务日志或迁移会话文件
+uploads: UploadStore = None  # type: ignore[assignment]
+record_manager: RecordManager = None  # type: ignore[assignment]
+analytics_snapshots: AnalyticsSnapshotManager = None  # type: ignore[assignment]
+retention_policy: RetentionPolicy = None  # type: ignore[assignment]
+session_manager: SessionManager = None  # type: ignore[assignment]
+retention: RetentionEngine = None  # type: ignore[assignment]
+jobs: JobManager = None  # type: ignore[assignment]
+_services_initialized = False
 
 
 # Session持久化函数
-def load_sessions():
-    """从文件加载sessions"""
-    global sessions
-    if SESSIONS_FILE.exists():
-        try:
-            with open(SESSIONS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                # 反序列化Question对象
-                for session_id, session in data.items():
-                    if "questions" in session:
-                        session["questions"] = [
-                            dict_to_question(q) for q in session["questions"]
-                        ]
-                sessions = data
-                print(f"✅ 加载了 {len(sessions)} 个会话")
-        except Exception as e:
-            print(f"⚠️  加载会话失败: {e}")
-            sessions = {}
+def _encode_session(session: Dict[str, Any]) -> Dict[str, Any]:
+    """序列化会话中的 Question 对象"""
+    payload = session.copy()
+    if "questions" in payload:
+        payload["questions"] = [question_to_dict(q) for q in payload["questions"]]
+    return payload
 
 
-def save_sessions():
-    """保存sessions到文件"""
-    try:
-        # 序列化Question对象
-        data = {}
-        for session_id, session in sessions.items():
-            session_copy = session.copy()
-            if "questions" in session_copy:
-                session_copy["questions"] = [
-                    question_to_dict(q) for q in session_copy["questions"]
-                ]
-            data[session_id] = session_copy
+def _decode_session(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """反序列化会话中的 Question 对象"""
+    if "questions" in payload:
+        payload["questions"] = [dict_to_question(q) for q in payload["questions"]]
+    # 旧会话没有活动时间，从本次加载开始计算保留期
+    payload.setdefault("updated_at", time.time())
+    return payload
 
-        with open(SESSIONS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"⚠️  保存会话失败: {e}")
 
+def _drop_sessions(session_ids: List[str]) -> None:
+    """删除过期会话（供数据清理任务调用）"""
+    for session_id in session_ids:
+        session_manager.delete(session_id)
 
-# 启动时加载sessions
-load_sessions()
 
 _TYPE_ALIAS: Dict[str, QuestionType] = {
     "single": QuestionType.SINGLE_CHOICE,
@@ -96,9 +101,18 @@ def question_to_dict(q: Question) -> Dict[str, Any]:
         "answer_text": q.answer_text,
         "explanation": q.explanation,
         "keywords": q.keywords,
+        "component": q.component,
     }
 
 
+def _public_question_dict(q: Question) -> Dict[str, Any]:
+    """题目的公开字段（不含答案与解析），用于提交前下发"""
+    payload = question_to_dict(q)
+    for key in ("correct_options", "answer_text", "explanation"):
+        payload.pop(key)
+    return payload
+
+
 def _parse_bool(value: Optional[str]) -> Optional[bool]:
     if value is None:
         return None
@@ -129,12 +143,68 @@ def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
     return parsed
 
 
+@app.after_request
+def negotiate_compression(response: Response) -> Response:
+    """按 Accept-Encoding 对 JSON 响应进行 gzip 压缩"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.mimetype != "application/json"
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    body = gzip_json(response.get_data(), request.accept_encodings.quality("gzip"))
+    response.vary.add("Accept-Encoding")
+    if body is not None:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = "gzip"
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            # 压缩后的表示使用不同的强 ETag
+            response.set_etag(f"{etag}-gzip")
+    return response
+
+
+def _versioned_json(generation: str, build: Callable[[], Dict[str, Any]]) -> Response:
+    """按数据版本处理条件 GET 并缓存响应，``build`` 只在缓存未命中时调用
+
+    缓存键为 ``(端点, 查询参数, 数据版本)``，ETag 由键导出：版本未变时
+    ``If-None-Match`` 直接得到 304，不读取数据。
+    """
+    key = (request.endpoint, tuple(sorted(request.args.items(multi=True))), generation)
+    etag = make_etag(key)
+    for candidate in (etag, f"{etag}-gzip"):
+        if request.if_none_match.contains(candidate):
+            AppMetrics.not_modified_total.inc()
+            response = app.response_class(status=304)
+            response.set_etag(candidate)
+            return response
+
+    body = response_cache.get(key)
+    if body is None:
+        body = jsonify(build()).get_data()
+        response_cache.put(key, body)
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"  # 每次使用前向服务器验证
+    return response
+
+
 @app.route("/")
 def index():
     """主页"""
     return send_from_directory("frontend", "app.html")
 
 
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus 指标"""
+    return Response(
+        metrics.get_prometheus_metrics(), mimetype="text/plain; version=0.0.4"
+    )
+
+
 @app.route("/web/<path:filename>")
 def serve_web_files(filename):
     """Serve files from the web/ directory (for AI config page)"""
@@ -152,36 +222,27 @@ def upload_knowledge():
         if file.filename == "":
             return jsonify({"error": "文件名为空"}), 400
 
-        # 检查文件大小
-        file.seek(0, 2)  # 移动到文件末尾
-        size = file.tell()
-        file.seek(0)  # 回到开头
-
-        if size > MAX_KNOWLEDGE_FILE_SIZE:
-            return (
-                jsonify(
-                    {
-                        "error": f"文件过大（{size // 1024}KB），最大支持 {MAX_KNOWLEDGE_FILE_SIZE // 1024}KB"
-                    }
-                ),
-                400,
-            )
-
         # 检查文件扩展名
         ext = Path(file.filename).suffix.lower()
         if ext not in [".txt", ".md", ".pdf"]:
             return jsonify({"error": "仅支持 .txt、.md、.pdf 格式"}), 400
 
-        # 保存文件
-        filename = f"{uuid.uuid4()}{ext}"
-        filepath = UPLOAD_FOLDER / filename
-        file.save(filepath)
-
-        # 加载知识条目
+        # 边写入边计算哈希，相同内容复用已有文件
         try:
-            entries = load_knowledge_entries(filepath)
+            stored = uploads.save(file.stream, ext)
+        except UploadTooLarge as e:
+            return jsonify({"error": str(e)}), 400
+        filename = stored.filename
+        filepath = stored.path
+        if not stored.created:
+            AppMetrics.file_upload_dedup_total.inc()
+
+        # 加载知识条目（重复上传直接使用解析缓存）
+        try:
+            entries = uploads.entries(filepath)
         except Exception as e:
-            filepath.unlink()  # 删除无效文件
+            if stored.created:
+                uploads.discard(filepath)  # 删除无效文件
             return jsonify({"error": f"解析失败：{str(e)}"}), 400
 
         return jsonify(
@@ -189,6 +250,7 @@ def upload_knowledge():
                 "success": True,
                 "filename": filename,
                 "filepath": str(filepath),
+                "deduplicated": not stored.created,
                 "entry_count": len(entries),
                 "entries_preview": [
                     {"component": e.component, "text": e.raw_text[:100] + "..."}
@@ -201,63 +263,247 @@ def upload_knowledge():
         return jsonify({"error": f"上传失败：{str(e)}"}), 500
 
 
+def _generation_request(
+    data: Dict[str, Any],
+) -> tuple[Dict[str, Any], Optional[str], int]:
+    """解析出题参数并检查知识文件，返回 (参数, 错误信息, 状态码)"""
+    filepath = data.get("filepath")
+    if not filepath:
+        return {}, "未指定知识文件", 400
+
+    if not Path(filepath).exists():
+        return {}, "知识文件不存在", 404
+
+    params = {
+        "filepath": filepath,
+        "types": data.get("types", ["single", "multi", "cloze", "qa"]),
+        "count": data.get("count", 10),
+        "mode": data.get("mode", "sequential"),
+        "seed": data.get("seed"),
+    }
+    return params, None, 200
+
+
+def _type_filters(question_types: List[str]) -> List[QuestionType]:
+    type_filters = [_TYPE_ALIAS[t] for t in question_types if t in _TYPE_ALIAS]
+    return type_filters or list(_TYPE_ALIAS.values())
+
+
+def _generate_locally(
+    entries: List[Any], type_filters: List[QuestionType], count: Optional[int]
+) -> List[Question]:
+    print("📝 使用本地算法生成题目")
+    generator = QuestionGenerator(entries)
+    questions = generator.generate_questions(type_filters=type_filters)
+    if count and count < len(questions):
+        questions = questions[:count]
+    return questions
+
+
+def _order_questions(
+    params: Dict[str, Any], questions: List[Question]
+) -> List[Question]:
+    """按出题模式打乱并截取题目"""
+    count = params["count"]
+    if params["mode"] == "random":
+        import random
+
+        rng = random.Random(params["seed"])
+        rng.shuffle(questions)
+
+    # 限制数量
+    if count and count < len(questions):
+        questions = questions[:count]
+    return questions
+
+
+def _session_record(filepath: str, questions: List[Question]) -> Dict[str, Any]:
+    now = time.time()
+    return {
+        "questions": questions,
+        "current_index": 0,
+        "answers": [],
+        "correct_count": 0,
+        "total_count": len(questions),
+        "filepath": filepath,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+# 待登记到全文检索索引的题目批次，由单个后台线程依次处理
+INDEX_QUEUE_SIZE = 256
+_index_queue: "queue.Queue[List[Question]]" = queue.Queue(maxsize=INDEX_QUEUE_SIZE)
+
+
+def _index_questions_async(questions: List[Question]) -> None:
+    """题目登记到全文检索索引，不阻塞本次响应
+
+    队列已满时放弃本批：题目在被作答时仍会随作答记录登记。
+    """
+    try:
+        _index_queue.put_nowait(questions)
+    except queue.Full:
+        print("⚠️  检索索引队列已满，跳过本批题目登记")
+
+
+def _index_worker() -> None:
+    """补建检索索引，然后依次登记出题产生的题目"""
+    try:
+        record_manager.ensure_search_index()
+    except Exception as exc:
+        print(f"⚠️  补建检索索引失败：{exc}")
+    while True:
+        questions = _index_queue.get()
+        try:
+            record_manager.index_questions(questions)
+        except Exception as exc:
+            print(f"⚠️  登记检索索引失败：{exc}")
+
+
+def _create_quiz_session(
+    params: Dict[str, Any], questions: List[Question]
+) -> Dict[str, Any]:
+    """按出题模式整理题目并创建会话，返回会话概要"""
+    questions = _order_questions(params, questions)
+    session_id = str(uuid.uuid4())
+    session_manager.set(session_id, _session_record(params["filepath"], questions))
+    _index_questions_async(questions)
+
+    return {
+        "session_id": session_id,
+        "total_count": len(questions),
+        "question_types": list(set(q.question_type.name for q in questions)),
+    }
+
+
+# 同步出题的截止时间（秒），到时未完成的 AI 题目由本地题目补齐
+GENERATION_DEADLINE = deadline_from_env()
+
+# 后台任务中每次向 AI 请求的题目数，每批完成后更新进度与部分结果
+AI_JOB_BATCH_SIZE = 5
+
+
+def _generation_job(params: Dict[str, Any], job: JobContext) -> Dict[str, Any]:
+    """后台出题任务：分批调用 AI 并汇报进度，失败时降级本地生成"""
+    entries = uploads.entries(Path(params["filepath"]))
+    if not entries:
+        raise ValueError("知识文件为空")
+    type_filters = _type_filters(params["types"])
+    count = params["count"]
+
+    questions: List[Question] = []
+    ai_config = load_ai_config()
+    if ai_config and count:
+        ai_client = AIClient(ai_config)
+        job.report(0, count)
+        seen = set()
+        try:
+            while len(questions) < count:
+                batch = ai_client.generate_additional_questions(
+                    entries,
+                    count=min(AI_JOB_BATCH_SIZE, count - len(questions)),
+                    question_types=type_filters,
+                )
+                fresh = [q for q in batch if q.prompt not in seen]
+                if not fresh:
+                    break
+                seen.update(q.prompt for q in fresh)
+                questions.extend(fresh)
+                job.add_partial(
+                    [
+                        {
+                            "identifier": q.identifier,
+                            "question_type": q.question_type.name,
+                            "prompt": q.prompt,
+                        }
+                        for q in fresh
+                    ]
+                )
+                job.report(len(questions), count)
+            print(f"✅ AI生成成功：生成 {len(questions)} 道题目")
+        except (AITransportError, AIResponseFormatError) as e:
+            print(f"⚠️  AI生成失败：{str(e)}，已生成 {len(questions)} 道")
+
+    ai_used = bool(questions)
+    if not questions:
+        questions = _generate_locally(entries, type_filters, count)
+    if not questions:
+        raise ValueError("题库为空，无法生成题目。请检查知识文件内容或配置AI。")
+
+    summary = _create_quiz_session(params, questions)
+    job.report(summary["total_count"], summary["total_count"])
+    return {**summary, "ai_used": ai_used}
+
+
 @app.route("/api/generate-questions", methods=["POST"])
 def generate_questions():
-    """生成题目"""
+    """生成题目
+
+    请求体带 ``"async": true`` 时提交后台任务并立即返回任务 ID（202），
+    客户端轮询 ``/api/jobs/<job_id>`` 获取进度与会话 ID。
+    """
     try:
         data = request.json
-        filepath = data.get("filepath")
-        question_types = data.get("types", ["single", "multi", "cloze", "qa"])
-        count = data.get("count", 10)
-        use_ai = data.get("use_ai", False)  # 新参数：是否使用AI增强
-        mode = data.get("mode", "sequential")
-        seed = data.get("seed")
+        params, error, status = _generation_request(data)
+        if error:
+            return jsonify({"error": error}), status
 
-        if not filepath:
-            return jsonify({"error": "未指定知识文件"}), 400
+        if data.get("async"):
+            try:
+                job = jobs.submit("generate_questions", params)
+            except JobQueueFull as e:
+                response = jsonify({"error": f"服务器繁忙：{str(e)}"})
+                response.headers["Retry-After"] = "5"
+                return response, 503
+            return (
+                jsonify(
+                    {
+                        "success": True,
+                        "job_id": job["id"],
+                        "state": job["state"],
+                        "status_url": f"/api/jobs/{job['id']}",
+                    }
+                ),
+                202,
+            )
 
         # 加载知识条目
-        knowledge_path = Path(filepath)
-        if not knowledge_path.exists():
-            return jsonify({"error": "知识文件不存在"}), 404
-
-        entries = load_knowledge_entries(knowledge_path)
+        entries = uploads.entries(Path(params["filepath"]))
         if not entries:
             return jsonify({"error": "知识文件为空"}), 400
 
         # 转换题型
-        type_filters = [_TYPE_ALIAS[t] for t in question_types if t in _TYPE_ALIAS]
-        if not type_filters:
-            type_filters = list(_TYPE_ALIAS.values())
+        type_filters = _type_filters(params["types"])
+        count = params["count"]
 
-        questions = []
-        ai_used = False
-
-        # 优先使用AI生成所有题目
+        # AI 与本地生成并行：截止时间内 AI 已生成的题目优先，不足部分由本地补齐
+        ai_stream = None
         ai_config = load_ai_config()
         if ai_config:
-            try:
-                ai_client = AIClient(ai_config)
-                questions = ai_client.generate_additional_questions(
-                    entries,
-                    count=count,
-                    question_types=type_filters,
-                )
-                ai_used = True
-                print(f"✅ AI生成成功：生成 {len(questions)} 道题目")
-            except (AITransportError, AIResponseFormatError) as e:
-                print(f"⚠️  AI生成失败：{str(e)}，降级使用本地生成")
-                ai_used = False
-
-        # 如果AI未配置或失败，降级使用本地生成
-        if not questions:
-            print("📝 使用本地算法生成题目")
-            generator = QuestionGenerator(entries)
-            questions = generator.generate_questions(type_filters=type_filters)
+            ai_stream = functools.partial(
+                AIClient(ai_config).stream_questions,
+                entries,
+                count=count,
+                question_types=type_filters,
+            )
 
-            # 限制数量
-            if count and count < len(questions):
-                questions = questions[:count]
+        with Timer(AppMetrics.question_generation_duration):
+            result = generate_with_deadline(
+                count=count,
+                deadline=GENERATION_DEADLINE,
+                local=lambda: _generate_locally(entries, type_filters, None),
+                ai_stream=ai_stream,
+            )
+        if result.ai_error:
+            print(f"⚠️  AI生成失败：{result.ai_error}，使用本地题目补齐")
+        elif result.timed_out:
+            print(f"⏱️  AI 出题超过 {GENERATION_DEADLINE} 秒，使用本地题目补齐")
+        print(
+            f"✅ 生成 {len(result.questions)} 道题目"
+            f"（AI {result.ai_count} 道，本地 {result.local_count} 道）"
+        )
+        questions = result.questions
 
         if not questions:
             return (
@@ -267,37 +513,12 @@ def generate_questions():
                 400,
             )
 
-        # 创建会话
-        session_id = str(uuid.uuid4())
-
-        # 模式处理
-        if mode == "random":
-            import random
-
-            rng = random.Random(seed)
-            rng.shuffle(questions)
-
-        # 限制数量
-        if count and count < len(questions):
-            questions = questions[:count]
-
-        # 保存会话
-        sessions[session_id] = {
-            "questions": questions,
-            "current_index": 0,
-            "answers": [],
-            "correct_count": 0,
-            "total_count": len(questions),
-            "filepath": filepath,
-        }
-        save_sessions()  # 持久化到文件
-
         return jsonify(
             {
                 "success": True,
-                "session_id": session_id,
-                "total_count": len(questions),
-                "question_types": list(set(q.question_type.name for q in questions)),
+                **_create_quiz_session(params, questions),
+                "ai_count": result.ai_count,
+                "local_count": result.local_count,
             }
         )
 
@@ -308,37 +529,184 @@ def generate_questions():
         return jsonify({"error": f"生成失败：{str(e)}"}), 500
 
 
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """查询后台任务的状态、进度与部分结果"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify({"success": True, "job": job})
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _append_session_questions(
+    session_id: str, questions: List[Question], *, finished: bool = False
+) -> None:
+    """向生成中的会话追加题目；``finished`` 时结束生成并确定总题数"""
+    with session_manager.session_lock(session_id):
+        session = session_manager.get(session_id)
+        if session is None:
+            return
+        session["questions"].extend(questions)
+        if finished:
+            session["generating"] = False
+            session["total_count"] = len(session["questions"])
+        session["updated_at"] = time.time()
+        session_manager.set(session_id, session)
+
+
+@app.route("/api/generate-questions/stream", methods=["GET"])
+def generate_questions_stream():
+    """以 Server-Sent Events 推送 AI 逐题生成的题目
+
+    先推送 ``session`` 事件（会话 ID），之后每生成一题推送一个 ``question``
+    事件并追加到会话，客户端收到第一题即可开始答题；结束时推送 ``done``，
+    无法生成题目时推送 ``error``。AI 未配置或失败时一次推送本地生成的题目。
+    逐题推送的 AI 题目按生成顺序出题，不受 ``mode=random`` 影响。
+    """
+    try:
+        data = {
+            "filepath": request.args.get("filepath"),
+            "types": request.args.get("types", "single,multi,cloze,qa").split(","),
+            "count": int(request.args.get("count", 10)),
+            "mode": request.args.get("mode", "sequential"),
+            "seed": request.args.get("seed"),
+        }
+    except ValueError:
+        return jsonify({"error": "count 参数必须为整数"}), 400
+    params, error, status = _generation_request(data)
+    if error:
+        return jsonify({"error": error}), status
+    entries = uploads.entries(Path(params["filepath"]))
+    if not entries:
+        return jsonify({"error": "知识文件为空"}), 400
+    type_filters = _type_filters(params["types"])
+    count = params["count"]
+
+    session_id = str(uuid.uuid4())
+    session = _session_record(params["filepath"], [])
+    session.update(total_count=count, generating=True)
+    session_manager.set(session_id, session)
+
+    def events():
+        produced: List[Question] = []
+        ai_used = False
+        try:
+            yield _sse("session", {"session_id": session_id, "total_count": count})
+            ai_config = load_ai_config()
+            if ai_config and count:
+                try:
+                    for question in AIClient(ai_config).stream_questions(
+                        entries, count=count, question_types=type_filters
+                    ):
+                        _append_session_questions(session_id, [question])
+                        produced.append(question)
+                        yield _sse(
+                            "question",
+                            {
+                                "index": len(produced),
+                                "question": question_to_dict(question),
+                            },
+                        )
+                    ai_used = bool(produced)
+                    print(f"✅ AI流式生成：生成 {len(produced)} 道题目")
+                except (AITransportError, AIResponseFormatError) as e:
+                    print(f"⚠️  AI流式生成失败：{str(e)}，已生成 {len(produced)} 道")
+
+            if not produced:
+                produced = _order_questions(
+                    params, _generate_locally(entries, type_filters, count)
+                )
+                _append_session_questions(session_id, produced)
+                for index, question in enumerate(produced, start=1):
+                    yield _sse(
+                        "question",
+                        {"index": index, "question": question_to_dict(question)},
+                    )
+
+            if produced:
+                yield _sse(
+                    "done",
+                    {
+                        "session_id": session_id,
+                        "total_count": len(produced),
+                        "ai_used": ai_used,
+                    },
+                )
+            else:
+                yield _sse(
+                    "error",
+                    {"error": "题库为空，无法生成题目。请检查知识文件内容或配置AI。"},
+                )
+        finally:
+            # 客户端中途断开时同样结束生成，已推送的题目保留在会话中
+            if produced:
+                _append_session_questions(session_id, [], finished=True)
+                _index_questions_async(produced)
+            else:
+                session_manager.delete(session_id)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.route("/api/get-question", methods=["POST"])
 def get_question():
     """获取当前题目"""
     try:
         data = request.json
+        compact_mode = bool(data.get("compact"))
         session_id = data.get("session_id")
 
-        if not session_id or session_id not in sessions:
+        session = session_manager.get(session_id) if session_id else None
+        if session is None:
             return jsonify({"error": "会话不存在"}), 404
 
-        session = sessions[session_id]
         index = session["current_index"]
 
+        if index >= len(session["questions"]) and session.get("generating"):
+            # 题目仍在流式生成中，客户端稍后重试
+            return _quiz_json(
+                compact_mode,
+                {
+                    "finished": False,
+                    "pending": True,
+                    "current_index": index,
+                    "total_count": session["total_count"],
+                },
+            )
+
         if index >= len(session["questions"]):
-            return jsonify(
+            return _quiz_json(
+                compact_mode,
                 {
                     "finished": True,
                     "correct_count": session["correct_count"],
                     "total_count": session["total_count"],
-                }
+                },
             )
 
         question = session["questions"][index]
 
-        return jsonify(
+        # 精简格式不下发答案与解析
+        return _quiz_json(
+            compact_mode,
             {
                 "finished": False,
-                "question": question_to_dict(question),
+                "question": (
+                    _public_question_dict(question)
+                    if compact_mode
+                    else question_to_dict(question)
+                ),
                 "current_index": index + 1,
                 "total_count": session["total_count"],
-            }
+            },
         )
 
     except Exception as e:
@@ -348,72 +716,174 @@ def get_question():
 @app.route("/api/submit-answer", methods=["POST"])
 def submit_answer():
     """提交答案"""
+    started = time.perf_counter()
     try:
         data = request.json
         session_id = data.get("session_id")
         user_answer = data.get("answer", "").strip()
 
-        if not session_id or session_id not in sessions:
+        # 先确认会话存在再取会话锁，不存在的会话 ID 不进入锁表
+        if not session_id or not session_manager.exists(session_id):
             return jsonify({"error": "会话不存在"}), 404
 
-        session = sessions[session_id]
-        index = session["current_index"]
+        # 持有会话锁完成读取-判分-写回，同一题的重复提交不会被重复计分；
+        # 其他会话的请求不受影响
+        with session_manager.session_lock(session_id):
+            session = session_manager.get(session_id)
+            if session is None:
+                return jsonify({"error": "会话不存在"}), 404
 
-        if index >= len(session["questions"]):
-            return jsonify({"error": "已完成所有题目"}), 400
+            index = session["current_index"]
 
-        question = session["questions"][index]
+            if index >= len(session["questions"]):
+                return jsonify({"error": "已完成所有题目"}), 400
+
+            graded = [_grade_into_session(session, user_answer)]
+            # 只写出本会话；会话锁只在本进程内有效，跨 worker 的重复提交
+            # 由后端按读取时的版本拒绝
+            try:
+                session_manager.set(session_id, session, check_version=True)
+            except SessionConflictError:
+                return _session_conflict()
 
-        # 判分
-        is_correct, plain_explanation = _grade_answer(question, user_answer)
+        _record_graded(session_id, session, graded)
 
-        # 记录答案
-        session["answers"].append(
+        question, answer = graded[0]
+        AppMetrics.submit_answer_duration.observe(time.perf_counter() - started)
+        return _quiz_json(
+            bool(data.get("compact")),
             {
-                "question_id": question.identifier,
-                "user_answer": user_answer,
-                "is_correct": is_correct,
-                "explanation": plain_explanation,
-            }
+                "success": True,
+                "is_correct": answer["is_correct"],
+                "explanation": answer["explanation"],
+                "correct_answer": _get_correct_answer_text(question),
+                "next_available": _next_available(session),
+            },
         )
 
-        if is_correct:
-            session["correct_count"] += 1
+    except Exception as e:
+        import traceback
+
+        traceback.print_exc()
+        return jsonify({"error": f"提交失败：{str(e)}"}), 500
 
-        # 移动到下一题
-        session["current_index"] += 1
-        save_sessions()  # 持久化到文件
 
-        # 记录到数据库（如果需要）
-        record_manager = RecordManager()
-        record_manager.log_attempt(
-            session_id=session_id,
-            question=question,
-            user_answer=user_answer,
-            is_correct=is_correct,
-            plain_explanation=plain_explanation,
-            session_context={
-                "filepath": session.get("filepath"),
-                "mode": "web",
+# 题目预取 / 批量提交的默认与最大题数
+BUNDLE_DEFAULT_SIZE = 10
+BUNDLE_MAX_SIZE = 50
+
+
+@app.route("/api/session-bundle", methods=["POST"])
+def session_bundle():
+    """一次取回接下来的若干道题（不含答案）及会话进度，减少答题往返"""
+    try:
+        data = request.json or {}
+        session_id = data.get("session_id")
+        try:
+            count = int(data.get("count", BUNDLE_DEFAULT_SIZE))
+        except (TypeError, ValueError):
+            return jsonify({"error": "count 必须是整数"}), 400
+        count = max(1, min(count, BUNDLE_MAX_SIZE))
+
+        session = session_manager.get(session_id) if session_id else None
+        if session is None:
+            return jsonify({"error": "会话不存在"}), 404
+
+        index = session["current_index"]
+        upcoming = session["questions"][index : index + count]
+        generating = bool(session.get("generating"))
+        return _quiz_json(
+            bool(data.get("compact")),
+            {
+                "questions": [
+                    {"index": index + offset + 1, "question": _public_question_dict(q)}
+                    for offset, q in enumerate(upcoming)
+                ],
+                "current_index": index,
+                "total_count": session["total_count"],
+                "correct_count": session["correct_count"],
+                "finished": index >= len(session["questions"]) and not generating,
+                "pending": generating,
             },
         )
 
-        # 错题管理
-        if is_correct:
-            record_manager.remove_wrong_question(question.identifier)
-        else:
-            record_manager.upsert_wrong_question(
-                question, last_plain_explanation=plain_explanation
-            )
+    except Exception as e:
+        return jsonify({"error": f"获取题目失败：{str(e)}"}), 500
 
-        return jsonify(
+
+@app.route("/api/submit-answers", methods=["POST"])
+def submit_answers():
+    """批量提交答案：一次判分、一次写回会话、一次记录作答历史"""
+    started = time.perf_counter()
+    try:
+        data = request.json or {}
+        session_id = data.get("session_id")
+        answers = data.get("answers")
+
+        if not session_id:
+            return jsonify({"error": "会话不存在"}), 404
+        if not isinstance(answers, list) or not answers:
+            return jsonify({"error": "answers 不能为空"}), 400
+        if len(answers) > BUNDLE_MAX_SIZE:
+            return jsonify({"error": f"单次最多提交 {BUNDLE_MAX_SIZE} 道题"}), 400
+        if not session_manager.exists(session_id):
+            return jsonify({"error": "会话不存在"}), 404
+
+        with session_manager.session_lock(session_id):
+            session = session_manager.get(session_id)
+            if session is None:
+                return jsonify({"error": "会话不存在"}), 404
+
+            # 先校验整批答案，任何一题不匹配时整批不计分
+            index = session["current_index"]
+            if index + len(answers) > len(session["questions"]):
+                return jsonify({"error": "提交的答案多于剩余题目"}), 400
+            for offset, item in enumerate(answers):
+                if not isinstance(item, dict):
+                    return jsonify({"error": "答案格式错误"}), 400
+                expected = session["questions"][index + offset].identifier
+                question_id = item.get("question_id")
+                if question_id is not None and question_id != expected:
+                    return (
+                        jsonify(
+                            {
+                                "error": "题目顺序不匹配，请刷新后重试",
+                                "current_index": index,
+                            }
+                        ),
+                        409,
+                    )
+
+            graded = [
+                _grade_into_session(session, str(item.get("answer", "")).strip())
+                for item in answers
+            ]
+            try:
+                session_manager.set(session_id, session, check_version=True)
+            except SessionConflictError:
+                return _session_conflict()
+
+        _record_graded(session_id, session, graded)
+
+        AppMetrics.submit_answer_duration.observe(time.perf_counter() - started)
+        return _quiz_json(
+            bool(data.get("compact")),
             {
                 "success": True,
-                "is_correct": is_correct,
-                "explanation": plain_explanation,
-                "correct_answer": _get_correct_answer_text(question),
-                "next_available": session["current_index"] < len(session["questions"]),
-            }
+                "results": [
+                    {
+                        "question_id": question.identifier,
+                        "is_correct": answer["is_correct"],
+                        "explanation": answer["explanation"],
+                        "correct_answer": _get_correct_answer_text(question),
+                    }
+                    for question, answer in graded
+                ],
+                "current_index": session["current_index"],
+                "correct_count": session["correct_count"],
+                "total_count": session["total_count"],
+                "next_available": _next_available(session),
+            },
         )
 
     except Exception as e:
@@ -423,6 +893,102 @@ def submit_answer():
         return jsonify({"error": f"提交失败：{str(e)}"}), 500
 
 
+@app.route("/api/question-explanation", methods=["GET"])
+def question_explanation():
+    """按题目 ID 获取知识解析（精简格式下答题后单独获取）"""
+    session_id = request.args.get("session_id", "")
+    question_id = request.args.get("question_id", "")
+
+    session = session_manager.get(session_id) if session_id else None
+    if session is None:
+        return jsonify({"error": "会话不存在"}), 404
+
+    question = next(
+        (q for q in session["questions"] if q.identifier == question_id), None
+    )
+    if question is None:
+        return jsonify({"error": "题目不存在"}), 404
+
+    answered = {answer["question_id"] for answer in session["answers"]}
+    if question_id not in answered:
+        # 作答前不提供解析，以免提前泄露答案
+        return jsonify({"error": "提交答案后才能查看解析"}), 403
+    response = jsonify(
+        {
+            "question_id": question_id,
+            "explanation": question.explanation,
+            "keywords": question.keywords,
+        }
+    )
+    response.headers["Cache-Control"] = "private, max-age=3600"
+    return response
+
+
+def _quiz_json(compact_mode: bool, payload: Dict[str, Any]) -> Response:
+    """按请求选择完整或精简格式（见 :mod:`src.wire_format`）返回答题接口响应"""
+    return jsonify(compact(payload) if compact_mode else payload)
+
+
+def _grade_into_session(
+    session: Dict[str, Any], user_answer: str
+) -> tuple[Question, Dict[str, Any]]:
+    """判分当前题并记入会话、推进到下一题（调用方持有会话锁）"""
+    question = session["questions"][session["current_index"]]
+    is_correct, plain_explanation = _grade_answer(question, user_answer)
+    answer = {
+        "question_id": question.identifier,
+        "user_answer": user_answer,
+        "is_correct": is_correct,
+        "explanation": plain_explanation,
+    }
+    session["answers"].append(answer)
+    if is_correct:
+        session["correct_count"] += 1
+    session["current_index"] += 1
+    session["updated_at"] = time.time()
+    return question, answer
+
+
+def _record_graded(
+    session_id: str,
+    session: Dict[str, Any],
+    graded: List[tuple[Question, Dict[str, Any]]],
+) -> None:
+    """记录作答历史并登记错题本更新（整批各一次）"""
+    context = {"filepath": session.get("filepath"), "mode": "web"}
+    record_manager.log_attempts(
+        {
+            "session_id": session_id,
+            "question": question,
+            "user_answer": answer["user_answer"],
+            "is_correct": answer["is_correct"],
+            "plain_explanation": answer["explanation"],
+            "session_context": context,
+        }
+        for question, answer in graded
+    )
+    # 错题管理（后台完成）：答对推进复习间隔，掌握后移出错题本
+    record_manager.record_answer_outcomes(
+        {
+            "question": question,
+            "is_correct": answer["is_correct"],
+            "plain_explanation": answer["explanation"],
+        }
+        for question, answer in graded
+    )
+
+
+def _session_conflict():
+    """会话已被其他 worker 的请求改写：本次判分不生效，由客户端刷新后重试"""
+    return jsonify({"error": "会话已被其他请求更新，请刷新后重试"}), 409
+
+
+def _next_available(session: Dict[str, Any]) -> bool:
+    return session["current_index"] < len(session["questions"]) or bool(
+        session.get("generating")
+    )
+
+
 @app.route("/api/session-status", methods=["POST"])
 def session_status():
     """获取会话状态"""
@@ -430,18 +996,18 @@ def session_status():
         data = request.json
         session_id = data.get("session_id")
 
-        if not session_id or session_id not in sessions:
+        session = session_manager.get(session_id) if session_id else None
+        if session is None:
             return jsonify({"error": "会话不存在"}), 404
 
-        session = sessions[session_id]
-
         return jsonify(
             {
                 "session_id": session_id,
                 "current_index": session["current_index"],
                 "total_count": session["total_count"],
                 "correct_count": session["correct_count"],
-                "finished": session["current_index"] >= session["total_count"],
+                "finished": session["current_index"] >= session["total_count"]
+                and not session.get("generating"),
             }
         )
 
@@ -452,6 +1018,40 @@ def session_status():
 # ============ Answer History API Routes ============
 
 
+def _history_filters() -> tuple[Dict[str, Any], Optional[str]]:
+    """解析作答历史的筛选参数，返回 (筛选条件, 错误信息)"""
+    question_type_param = request.args.get("question_type")
+    question_type = None
+    if question_type_param:
+        try:
+            question_type = QuestionType[question_type_param]
+        except KeyError:
+            return {}, f"无效的题型: {question_type_param}"
+
+    is_correct_raw = request.args.get("is_correct")
+    is_correct = _parse_bool(is_correct_raw)
+    if is_correct_raw is not None and is_correct is None:
+        return {}, "is_correct 参数必须为 true/false"
+
+    date_from_raw = request.args.get("date_from")
+    date_to_raw = request.args.get("date_to")
+    date_from = _parse_datetime(date_from_raw)
+    date_to = _parse_datetime(date_to_raw)
+    if date_from_raw and date_from is None:
+        return {}, "date_from 不是有效的 ISO 8601 时间"
+    if date_to_raw and date_to is None:
+        return {}, "date_to 不是有效的 ISO 8601 时间"
+
+    filters = {
+        "session_id": request.args.get("session_id") or None,
+        "question_type": question_type,
+        "is_correct": is_correct,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+    return filters, None
+
+
 @app.route("/api/answer-history", methods=["GET"])
 def api_answer_history():
     """分页返回历史作答记录"""
@@ -460,19 +1060,94 @@ def api_answer_history():
         page_size = int(request.args.get("page_size", 20))
         page_size = max(1, min(page_size, 200))
 
-        session_id = request.args.get("session_id") or None
-        question_type_param = request.args.get("question_type")
-        question_type = None
-        if question_type_param:
-            try:
-                question_type = QuestionType[question_type_param]
-            except KeyError:
-                return jsonify({"error": f"无效的题型: {question_type_param}"}), 400
+        filters, error = _history_filters()
+        if error:
+            return jsonify({"error": error}), 400
 
-        is_correct_raw = request.args.get("is_correct")
-        is_correct = _parse_bool(is_correct_raw)
-        if is_correct_raw is not None and is_correct is None:
-            return jsonify({"error": "is_correct 参数必须为 true/false"}), 400
+        # 传入 cursor 参数（首页为空字符串）时使用游标分页，总数按需统计
+        cursor = request.args.get("cursor")
+        include_total = _parse_bool(request.args.get("include_total")) or False
+
+        result = record_manager.query_answer_history(
+            page=page,
+            page_size=page_size,
+            **filters,
+            cursor=cursor,
+            include_total=include_total if cursor is not None else True,
+        )
+        return jsonify({"success": True, "data": result})
+    except ValueError as exc:
+        return jsonify({"error": f"参数错误：{exc}"}), 400
+    except Exception as exc:
+        import traceback
+
+        traceback.print_exc()
+        return jsonify({"error": f"获取历史失败：{str(exc)}"}), 500
+
+
+@app.route("/api/answer-history/export", methods=["GET"])
+def api_answer_history_export():
+    """流式导出作答历史（CSV/NDJSON，按时间正序，可选 gzip 压缩）"""
+    export_format = (request.args.get("format") or "csv").lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": "format 参数必须为 csv/ndjson"}), 400
+    compress_raw = request.args.get("gzip")
+    compress = _parse_bool(compress_raw)
+    if compress_raw is not None and compress is None:
+        return jsonify({"error": "gzip 参数必须为 true/false"}), 400
+
+    filters, error = _history_filters()
+    if error:
+        return jsonify({"error": error}), 400
+
+    # 参数在生成器之外解析完毕，生成器只负责逐块读取与编码
+    body = ENCODERS[export_format](record_manager.iter_answer_history(**filters))
+    filename = f"answer_history_{datetime.now():%Y%m%d_%H%M%S}.{export_format}"
+    mimetype = EXPORT_FORMATS[export_format]
+    if compress:
+        body = gzip_stream(body)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@app.route("/api/answer-history/sessions", methods=["GET"])
+def api_answer_history_sessions():
+    """获取最近若干作答会话的摘要"""
+    try:
+        limit = int(request.args.get("limit", 20))
+        limit = max(1, min(limit, 100))
+        return _versioned_json(
+            record_manager.answer_history_generation(),
+            lambda: {
+                "success": True,
+                "data": record_manager.list_answer_history_sessions(limit=limit),
+            },
+        )
+    except ValueError as exc:
+        return jsonify({"error": f"参数错误：{exc}"}), 400
+    except Exception as exc:
+        import traceback
+
+        traceback.print_exc()
+        return jsonify({"error": f"获取会话失败：{str(exc)}"}), 500
+
+
+@app.route("/api/answer-history/analytics", methods=["GET"])
+def api_answer_history_analytics():
+    """基于列式快照的作答统计（按组件/题型/会话、按天/周分桶）"""
+    if not HAS_NUMPY:
+        return jsonify({"error": "历史统计需要安装 NumPy"}), 503
+    try:
+        group_by = request.args.get("group_by", "component")
+        bucket = request.args.get("bucket") or None
 
         date_from_raw = request.args.get("date_from")
         date_to_raw = request.args.get("date_to")
@@ -483,40 +1158,89 @@ def api_answer_history():
         if date_to_raw and date_to is None:
             return jsonify({"error": "date_to 不是有效的 ISO 8601 时间"}), 400
 
-        result = record_manager.query_answer_history(
+        snapshot = analytics_snapshots.get()
+        if bucket:
+            rows = snapshot.time_buckets(
+                bucket,
+                by=group_by if group_by != "none" else None,
+                date_from=date_from,
+                date_to=date_to,
+            )
+        else:
+            rows = snapshot.accuracy_by(group_by, date_from=date_from, date_to=date_to)
+        return jsonify(
+            {
+                "success": True,
+                "data": {
+                    "rows": rows,
+                    "snapshot_rows": len(snapshot),
+                    "built_at": datetime.fromtimestamp(
+                        snapshot.built_at, tz=timezone.utc
+                    ).isoformat(),
+                },
+            }
+        )
+    except ValueError as exc:
+        return jsonify({"error": f"参数错误：{exc}"}), 400
+    except Exception as exc:
+        import traceback
+
+        traceback.print_exc()
+        return jsonify({"error": f"获取统计失败：{str(exc)}"}), 500
+
+
+def _search_params() -> tuple[str, int, int]:
+    query = (request.args.get("q") or "").strip()
+    if not query:
+        raise ValueError("缺少检索关键词 q")
+    page = max(1, int(request.args.get("page", 1)))
+    page_size = max(1, min(int(request.args.get("page_size", 20)), 100))
+    return query, page, page_size
+
+
+@app.route("/api/answer-history/search", methods=["GET"])
+def api_answer_history_search():
+    """全文检索作答记录，按相关度排序"""
+    try:
+        query, page, page_size = _search_params()
+        # 传入 cursor 参数（首页为空字符串）时使用游标分页，总数按需统计
+        cursor = request.args.get("cursor")
+        include_total = _parse_bool(request.args.get("include_total")) or False
+        result = record_manager.search_answer_history(
+            query,
             page=page,
             page_size=page_size,
-            session_id=session_id,
-            question_type=question_type,
-            is_correct=is_correct,
-            date_from=date_from,
-            date_to=date_to,
+            cursor=cursor,
+            include_total=include_total if cursor is not None else True,
         )
         return jsonify({"success": True, "data": result})
     except ValueError as exc:
         return jsonify({"error": f"参数错误：{exc}"}), 400
+    except RuntimeError as exc:
+        return jsonify({"error": str(exc)}), 503
     except Exception as exc:
         import traceback
 
         traceback.print_exc()
-        return jsonify({"error": f"获取历史失败：{str(exc)}"}), 500
+        return jsonify({"error": f"检索失败：{str(exc)}"}), 500
 
 
-@app.route("/api/answer-history/sessions", methods=["GET"])
-def api_answer_history_sessions():
-    """获取最近若干作答会话的摘要"""
+@app.route("/api/questions/search", methods=["GET"])
+def api_questions_search():
+    """全文检索题库（已出过的题目）"""
     try:
-        limit = int(request.args.get("limit", 20))
-        limit = max(1, min(limit, 100))
-        summaries = record_manager.list_answer_history_sessions(limit=limit)
-        return jsonify({"success": True, "data": summaries})
+        query, page, page_size = _search_params()
+        result = record_manager.search_questions(query, page=page, page_size=page_size)
+        return jsonify({"success": True, "data": result})
     except ValueError as exc:
         return jsonify({"error": f"参数错误：{exc}"}), 400
+    except RuntimeError as exc:
+        return jsonify({"error": str(exc)}), 503
     except Exception as exc:
         import traceback
 
         traceback.print_exc()
-        return jsonify({"error": f"获取会话失败：{str(exc)}"}), 500
+        return jsonify({"error": f"检索失败：{str(exc)}"}), 500
 
 
 # ============ Wrong Questions API Routes ============
@@ -539,15 +1263,24 @@ def get_wrong_questions():
             except KeyError:
                 return jsonify({"error": f"无效的题型: {question_type_str}"}), 400
 
-        result = record_manager.get_wrong_questions_paginated(
-            page=page,
-            page_size=page_size,
-            question_type=question_type,
-            sort_by=sort_by,
-            order=order,
-        )
+        cursor = request.args.get("cursor")
+        include_total = _parse_bool(request.args.get("include_total")) or False
+
+        def build() -> Dict[str, Any]:
+            result = record_manager.get_wrong_questions_paginated(
+                page=page,
+                page_size=page_size,
+                question_type=question_type,
+                sort_by=sort_by,
+                order=order,
+                cursor=cursor,
+                include_total=include_total if cursor is not None else True,
+            )
+            return {"success": True, "data": result}
 
-        return jsonify({"success": True, "data": result})
+        return _versioned_json(record_manager.wrong_questions_generation(), build)
+    except ValueError as exc:
+        return jsonify({"error": f"参数错误：{exc}"}), 400
     except Exception as e:
         import traceback
 
@@ -559,8 +1292,13 @@ def get_wrong_questions():
 def get_wrong_questions_stats():
     """获取错题统计"""
     try:
-        stats = record_manager.get_wrong_question_stats()
-        return jsonify({"success": True, "data": stats})
+        return _versioned_json(
+            record_manager.wrong_questions_generation(),
+            lambda: {
+                "success": True,
+                "data": record_manager.get_wrong_question_stats(),
+            },
+        )
     except Exception as e:
         import traceback
 
@@ -575,47 +1313,61 @@ def start_wrong_question_practice():
         data = request.json or {}
         question_types = data.get("question_types", [])
         count = data.get("count")
-        mode = data.get("mode", "random")
+        # due：按间隔复习的到期先后出题；random/sequential 沿用整本错题
+        mode = data.get("mode", "due")
+
+        type_filters = [
+            QuestionType[t] for t in question_types if t in QuestionType.__members__
+        ]
+
+        if mode == "due":
+            if record_manager.get_wrong_question_stats()["total_wrong"] == 0:
+                return jsonify({"error": "当前没有错题"}), 400
+            limit = count if count and count > 0 else DEFAULT_PRACTICE_COUNT
+            wrong_questions = record_manager.select_due_wrong_questions(
+                limit, question_types=type_filters or None
+            )
+        else:
+            # 加载错题
+            wrong_questions = record_manager.load_wrong_questions()
 
-        # 加载错题
-        wrong_questions = record_manager.load_wrong_questions()
+            if not wrong_questions:
+                return jsonify({"error": "当前没有错题"}), 400
 
-        if not wrong_questions:
-            return jsonify({"error": "当前没有错题"}), 400
-
-        # 筛选题型
-        if question_types:
-            type_filters = [
-                QuestionType[t] for t in question_types if t in QuestionType.__members__
-            ]
-            wrong_questions = [
-                q for q in wrong_questions if q.question_type in type_filters
-            ]
+            # 筛选题型
+            if type_filters:
+                wrong_questions = [
+                    q for q in wrong_questions if q.question_type in type_filters
+                ]
 
-        if not wrong_questions:
-            return jsonify({"error": "没有符合条件的错题"}), 400
+            # 随机/顺序
+            if mode == "random":
+                import random
 
-        # 随机/顺序
-        if mode == "random":
-            import random
+                random.shuffle(wrong_questions)
 
-            random.shuffle(wrong_questions)
+            # 限制数量
+            if count and count < len(wrong_questions):
+                wrong_questions = wrong_questions[:count]
 
-        # 限制数量
-        if count and count < len(wrong_questions):
-            wrong_questions = wrong_questions[:count]
+        if not wrong_questions:
+            return jsonify({"error": "没有符合条件的错题"}), 400
 
         # 创建会话
         session_id = str(uuid.uuid4())
-        sessions[session_id] = {
-            "questions": wrong_questions,
-            "current_index": 0,
-            "answers": [],
-            "correct_count": 0,
-            "total_count": len(wrong_questions),
-            "mode": "wrong_question_practice",  # 标识为错题练习
-        }
-        save_sessions()  # 持久化到文件
+        session_manager.set(
+            session_id,
+            {
+                "questions": wrong_questions,
+                "current_index": 0,
+                "answers": [],
+                "correct_count": 0,
+                "total_count": len(wrong_questions),
+                "mode": "wrong_question_practice",  # 标识为错题练习
+                "created_at": time.time(),
+                "updated_at": time.time(),
+            },
+        )
 
         return jsonify(
             {
@@ -789,20 +1541,13 @@ def reset_data():
     """清空所有数据（保留AI配置）"""
     try:
         # 清空会话
-        global sessions
-        sessions = {}
-        if SESSIONS_FILE.exists():
-            SESSIONS_FILE.unlink()
+        session_manager.clear()
 
-        # 清空答题历史
-        history_file = Path("data/answer_history.jsonl")
-        if history_file.exists():
-            history_file.unlink()
+        # 清空答题历史（先写出队列中的记录，避免重置后又被追加回来）
+        record_manager.clear_answer_history()
 
         # 清空错题本
-        wrong_file = Path("data/wrong_questions.json")
-        if wrong_file.exists():
-            wrong_file.write_text("[]", encoding="utf-8")
+        record_manager.clear_all_wrong_questions()
 
         # 清空上传的知识文件
         uploads_dir = Path("uploads")
@@ -1006,6 +1751,66 @@ def _get_correct_answer_text(question: Question) -> str:
     return ""
 
 
+def init_services() -> None:
+    """创建应用单例并启动后台服务（幂等）
+
+    gunicorn 等导入本模块即会调用，无需 ``__main__``。
+    """
+    global uploads, record_manager, analytics_snapshots, retention_policy
+    global session_manager, retention, jobs, _services_initialized
+    if _services_initialized:
+        return
+    _services_initialized = True
+
+    # 上传文件按内容哈希保存，相同内容只存一份并复用解析结果
+    uploads = UploadStore(UPLOAD_FOLDER)
+    # 答题记录由后台线程批量写入，错题本更新记入任务日志后在响应之后完成
+    record_manager = RecordManager(
+        writer_config=HistoryWriterConfig.from_env(), defer_wrong_updates=True
+    )
+    analytics_snapshots = AnalyticsSnapshotManager(record_manager)
+    # 会话后端由 SESSION_BACKEND 选择：file（默认，每会话一个文件）、
+    # sqlite（多 worker 进程共享）或 memory；无活动超过保留期的会话过期
+    retention_policy = RetentionPolicy.from_env()
+    session_manager = SessionManager(
+        ttl_seconds=(
+            retention_policy.session_max_age_days * 86_400
+            if retention_policy.session_max_age_days is not None
+            else float("inf")
+        ),
+        backend=create_session_backend(
+            data_dir=DATA_DIR, encode=_encode_session, decode=_decode_session
+        ),
+    )
+    retention = RetentionEngine(
+        retention_policy,
+        record_manager,
+        upload_dir=UPLOAD_FOLDER,
+        list_sessions=session_manager.summaries,
+        drop_sessions=_drop_sessions,
+    )
+    jobs = JobManager(
+        DATA_DIR / "jobs",
+        {"generate_questions": _generation_job},
+        JobQueueConfig.from_env(),
+    )
+    start_background_services()
+
+
+def start_background_services() -> None:
+    """启动后台线程（由 :func:`init_services` 在单例创建后调用）"""
+    analytics_snapshots.start_refresh_thread()
+    threading.Thread(target=_index_worker, name="search-index", daemon=True).start()
+    retention.start()
+    # 接管重启前遗留的生成任务并启动工作线程
+    jobs.start()
+
+
+# 历史扫描的 spawn 子进程以 __mp_main__ 导入本脚本，只需要其中的函数定义
+if __name__ != "__mp_main__":
+    init_services()
+
+
 if __name__ == "__main__":
     print("=" * 60)
     print("答题考试系统（AI版）Web 服务器")